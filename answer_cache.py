@@ -0,0 +1,142 @@
+"""
+Answer cache for standalone chatbot questions.
+
+Answers are grouped by scope (grid cell, payload hour, address), which is
+everything besides the question that the model sees when there is no
+conversation history. Within a scope a question matches an earlier one
+exactly after normalization, or near-exactly by character trigram Jaccard
+similarity, so "When is the best time to go out?" and "when's the best time
+to go outside" share one answer. A handful of words flip a question's
+meaning while barely moving the score ("best" vs "worst", "go out" vs "not
+go out", "5pm" vs "6pm", "now" vs "this evening"), so near-duplicates must
+also agree on their numbers, negations, superlatives and time words;
+otherwise only an exact match counts. A scope expires with its forecast hour.
+
+Each lookup's outcome is set on the active span, and every STATS_EVERY
+lookups the running hit rates are exported as an 'answer_cache.stats' span
+(see tracing).
+
+Configured from the [chat] secrets section:
+
+    answer_similarity = 0.8    # trigram Jaccard needed for a near-duplicate hit; 1 disables them
+"""
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+import streamlit as st
+from tracing import emit, current_span
+
+logger = logging.getLogger(__name__)
+
+chat_config=st.secrets.get("chat",{})
+ANSWER_SIMILARITY=float(chat_config.get("answer_similarity",0.8))
+MAX_SCOPES=512
+MAX_ANSWERS_PER_SCOPE=64
+STATS_EVERY=100   # lookups between exported hit-rate summaries
+
+_NON_WORD=re.compile(r'[^a-z0-9]+')
+_NUMBER=re.compile(r'\d+')
+# Words that must agree for two questions to count as near-duplicates
+NEGATIONS=frozenset(('not','no','never','nor','without','avoid','cannot','cant','dont','don','doesn','isn','aren','won','wouldn','shouldn'))
+SUPERLATIVES=frozenset(('best','worst','better','worse','most','least','highest','lowest','cleanest','dirtiest','safest','max','min','peak'))
+TIME_WORDS=frozenset(('now','currently','current','today','tonight','morning','afternoon','evening','night','later','soon','next','tomorrow','yesterday','am','pm'))
+GUARD_WORDS=NEGATIONS|SUPERLATIVES|TIME_WORDS
+
+
+def normalize(question):
+    """Lowercase words and digits only, single-spaced"""
+    return _NON_WORD.sub(' ',question.lower()).strip()
+
+
+def trigrams(text):
+    padded=f' {text} '
+    return frozenset(padded[i:i+3] for i in range(len(padded)-2))
+
+
+def signature(text):
+    """Numbers and meaning-flipping words of a normalized question"""
+    return tuple(_NUMBER.findall(text)),frozenset(w for w in text.split() if w in GUARD_WORDS)
+
+
+def similarity(a,b):
+    if not a or not b:
+        return 0.0
+    return len(a&b)/len(a|b)
+
+
+class AnswerCache():
+    """Thread-safe, shared by every session in the process"""
+    def __init__(self,threshold=ANSWER_SIMILARITY,max_scopes=MAX_SCOPES,max_answers=MAX_ANSWERS_PER_SCOPE):
+        self.threshold=threshold
+        self.max_scopes=max_scopes
+        self.max_answers=max_answers
+        self._scopes=OrderedDict()   # scope -> (expires_at, OrderedDict normalized -> (trigrams, signature, answer))
+        self._lock=threading.Lock()
+        self._stats={'exact_hits': 0,'similar_hits': 0,'misses': 0,'stores': 0}
+
+    def _answers(self,scope,now):
+        entry=self._scopes.get(scope)
+        if entry is None:
+            return None
+        if entry[0]<=now:
+            del self._scopes[scope]
+            return None
+        self._scopes.move_to_end(scope)
+        return entry[1]
+
+    def get(self,scope,question):
+        """Cached answer for question in scope, or None"""
+        key=normalize(question)
+        with self._lock:
+            answers=self._answers(scope,time.time())
+            found=None
+            outcome='miss'
+            if answers is not None and key in answers:
+                found=answers[key][2]
+                outcome='exact'
+                self._stats['exact_hits']+=1
+            elif answers:
+                grams=trigrams(key)
+                sig=signature(key)
+                candidates=[(similarity(grams,g),answer) for g,other,answer in answers.values() if other==sig]
+                score,best=max(candidates,key=lambda x: x[0],default=(0.0,None))
+                if score>=self.threshold:
+                    found=best
+                    outcome='similar'
+                    self._stats['similar_hits']+=1
+            if found is None:
+                self._stats['misses']+=1
+            lookups=self._stats['exact_hits']+self._stats['similar_hits']+self._stats['misses']
+        current_span().set('answer_cache',outcome)
+        if lookups%STATS_EVERY==0:
+            emit('answer_cache.stats',lookups=lookups,**self.stats())
+        return found
+
+    def set(self,scope,question,answer,expires_at):
+        now=time.time()
+        if expires_at<=now or not answer:
+            return
+        key=normalize(question)
+        with self._lock:
+            answers=self._answers(scope,now)
+            if answers is None:
+                answers=OrderedDict()
+                self._scopes[scope]=(expires_at,answers)
+                while len(self._scopes)>self.max_scopes:
+                    self._scopes.popitem(last=False)
+            answers[key]=(trigrams(key),signature(key),answer)
+            answers.move_to_end(key)
+            while len(answers)>self.max_answers:
+                answers.popitem(last=False)
+            self._stats['stores']+=1
+
+    def stats(self):
+        with self._lock:
+            stats=dict(self._stats)
+            stats['scopes']=len(self._scopes)
+        hits=stats['exact_hits']+stats['similar_hits']
+        lookups=hits+stats['misses']
+        stats['hit_rate']=hits/lookups if lookups else 0.0
+        return stats
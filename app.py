@@ -1,4 +1,12 @@
 from predict import Predictor
+from inference import get_engine
+from builder import snap_to_grid, ist_now, hour_expiry
+from cache import TTLCache
+from answer_cache import AnswerCache
+from jobs import get_executor
+from geocode import get_location
+from aqi import aqi, pm_aqi
+from forecast_grid import LAT_MIN, LAT_MAX, LON_MIN, LON_MAX, get_current_grid
 import streamlit as st
 import numpy as np
 import pandas as pd
@@ -8,115 +16,133 @@ import time
 import requests
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
-from chatbot import get_response
+from chatbot import get_response_stream, build_chat_context, route_question
 import html
 import pytz
 import base64
 import os
 
 
-LAT_MIN = 28.20  # South: Covers Manesar & Southern Gurgaon
-LAT_MAX = 28.90  # North: Covers Narela & North Delhi border
-LON_MIN = 76.80  # West: Covers Manesar & Dwarka Expressway
-LON_MAX = 77.70  # East: Covers Narela & North Delhi border
-
 GOOGLE_API = st.secrets["google"]["api_key"]
 OPEN_AI_API =  st.secrets["open_ai"]["api_key"]
 
-def get_PM25_subindex(x):
-    if x <= 30:
-        return x * 50 / 30
-    elif x <= 60:
-        return 50 + (x - 30) * 50 / 30
-    elif x <= 90:
-        return 100 + (x - 60) * 100 / 30
-    elif x <= 120:
-        return 200 + (x - 90) * 100 / 30
-    elif x <= 250:
-        return 300 + (x - 120) * 100 / 130
-    elif x > 250:
-        return 400 + (x - 250) * 100 / 130
-    else:
-        return 0
-
-def get_PM10_subindex(x):
-    if x <= 50:
-        return x
-    elif x <= 100:
-        return x
-    elif x <= 250:
-        return 100 + (x - 100) * 100 / 150
-    elif x <= 350:
-        return 200 + (x - 250)
-    elif x <= 430:
-        return 300 + (x - 350) * 100 / 80
-    elif x > 430:
-        return 400 + (x - 430) * 100 / 80
-    else:
-        return 0
-
-def get_location(address):
-    """Geocode address to latitude and longitude"""
-    api_key = GOOGLE_API
-    ad_to_us = address.replace(' ', '+')
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?address={ad_to_us}&key={api_key}"
-    
-    try:
-        # Use tuple timeout: (connect_timeout, read_timeout) in seconds
-        # This ensures both connection and read operations timeout properly
-        response = requests.get(url, timeout=(5, 3))  # 5s to connect, 3s to read
-        response.raise_for_status()  # Raise exception for bad status codes
-        data = response.json()
-        
-        # Check API response status
-        status = data.get('status', 'UNKNOWN_ERROR')
-        if status != 'OK':
-            return None, None, None, f"Geocoding error: {status}"
-        
-        if not data.get('results'):
-            return None, None, None, "No results found for this address"
-        
-        lat = data['results'][0]['geometry']['location']['lat']
-        lon = data['results'][0]['geometry']['location']['lng']
-        location = data['results'][0]['formatted_address']  # Fixed: added 'data' before ['results']
-        return lat, lon, location, None
-        
-    except requests.exceptions.Timeout as e:
-        return None, None, None, f"Request timed out after 5 seconds. Please try again."
-    except requests.exceptions.ConnectionError as e:
-        return None, None, None, f"Connection error: Unable to reach the geocoding service."
-    except requests.exceptions.RequestException as e:
-        return None, None, None, f"Network error: {str(e)}"
-    except (KeyError, IndexError) as e:
-        return None, None, None, f"Error parsing geocoding response: {str(e)}"
-    except Exception as e:
-        return None, None, None, f"Unexpected error: {str(e)}"
-
-def AQI_builder(lat, lon):
-    """Build AQI dictionary and predictions dictionary from coordinates"""
-    new = Predictor(lat, lon)
+@st.cache_resource
+def get_forecast_cache():
+    """Forecast results shared by every session in this process"""
+    return TTLCache(maxsize=256)
+
+@st.cache_resource
+def get_answer_cache():
+    """Answers to standalone chatbot questions, shared by every session"""
+    return AnswerCache()
+
+def session_chat_context():
+    """The session's chat context, or None once the IST hour of its forecast has passed"""
+    context = st.session_state.chat_context
+    if context is None or context['hour'] != ist_now().floor('h'):
+        return None
+    return context
+
+def compute_forecast(lat, lon, on_current=None):
+    """Run the full pipeline (APIs, features, 16 model predictions) for one location"""
+    new = Predictor(lat, lon, on_current=on_current)
     
     # Check for critical errors from Builder
     if new.critical_errors:
         error_msg = new.critical_errors[0] if isinstance(new.critical_errors, list) and len(new.critical_errors) > 0 else str(new.critical_errors)
         return None, None, None, error_msg
     
-    new.predict_pm25()
-    new.predict_pm10()
-    new.build_averages()
-    AQI_dic = {}
-    AQI_live_dic={}
-    for key in range(0, 9):
-        AQI_dic[key] = max(
-            get_PM25_subindex(new.predictions_dic[key]['PM25_AVG_24']),
-            get_PM10_subindex(new.predictions_dic[key]['PM10_AVG_24'])
-        )
-        AQI_live_dic[key] = max(
-            get_PM25_subindex(new.predictions_dic[key]['pm25']),
-            get_PM10_subindex(new.predictions_dic[key]['pm10'])
-        )
+    new.predict()
+    # Set by check_coverage when a step has no PM value or 24-hour average
+    if new.critical_errors:
+        return None, None, None, new.critical_errors[0]
+    steps = range(0, 9)
+    series = {name: [new.predictions_dic[key][name] for key in steps] for name in ('pm25', 'pm10', 'PM25_AVG_24', 'PM10_AVG_24')}
+    aqi_values = pm_aqi(series['PM25_AVG_24'], series['PM10_AVG_24'])
+    aqi_live_values = pm_aqi(series['pm25'], series['pm10'])
+    AQI_dic = {key: float(aqi_values[key]) for key in steps}
+    AQI_live_dic = {key: float(aqi_live_values[key]) for key in steps}
     return AQI_dic, AQI_live_dic, new.predictions_dic, None
 
+def forecast_key(lat, lon, hour):
+    # Nearby addresses in the same grid cell and forecast hour share one forecast
+    return snap_to_grid(lat, lon) + (hour.isoformat(),)
+
+def cached_forecast(lat, lon):
+    """Forecast from the hourly grid or the shared cache, or None if the pipeline has to run"""
+    # The hourly grid job answers in-bounds locations without touching the pipeline
+    grid = get_current_grid()
+    if grid is not None:
+        result = grid.lookup(lat, lon)
+        if result is not None:
+            return result + (build_chat_context(result[1], grid.hour), None)
+    cached = get_forecast_cache().get(forecast_key(lat, lon, ist_now().floor('h')))
+    if cached is not None:
+        return cached + (None,)
+    return None
+
+def run_forecast(job, lat, lon, cache):
+    """Job body: publishes the current conditions as soon as they arrive, then returns (AQI_dic, AQI_live_dic, predictions_dic, chat_context, error)"""
+    hour = ist_now().floor('h')
+    key = forecast_key(lat, lon, hour)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached + (None,)
+
+    def on_current(aq_curr):
+        pm25 = float(aq_curr['PM2.5 (µg/m³)'].iloc[-1])
+        pm10 = float(aq_curr['PM10 (µg/m³)'].iloc[-1])
+        job.update(current={'pm25': pm25, 'pm10': pm10, 'aqi': float(pm_aqi(pm25, pm10))})
+
+    AQI_dic, AQI_live_dic, predictions_dic, error = compute_forecast(lat, lon, on_current)
+    if error:
+        return None, None, None, None, error
+    # The chat payload is built from this forecast and carries its hour, and is cached with it
+    result = (AQI_dic, AQI_live_dic, predictions_dic, build_chat_context(AQI_live_dic, hour))
+    cache.set(key, result, hour_expiry(hour))
+    return result + (None,)
+
+def submit_forecast(lat, lon):
+    """Queue a forecast on the shared worker pool; sessions asking for the same cell and hour share one job"""
+    hour = ist_now().floor('h')
+    return get_executor().submit(forecast_key(lat, lon, hour), run_forecast, lat, lon, get_forecast_cache())
+
+def apply_forecast(result):
+    """Store a finished forecast in the session. Returns an error message, or None on success"""
+    AQI_dic, AQI_live_dic, predictions_dic, chat_context, error = result
+    if error:
+        return error
+    if not (AQI_dic and AQI_live_dic and predictions_dic and chat_context):
+        return "Incomplete data, please try again."
+    st.session_state.aqi_data = AQI_dic
+    st.session_state.aqi_live_data = AQI_live_dic
+    st.session_state.predictions_data = predictions_dic
+    st.session_state.chat_context = chat_context
+    st.session_state.data_loaded = True
+    return None
+
+@st.fragment(run_every=1)
+def forecast_progress():
+    """Poll the session's forecast job: current conditions first, then a full rerun once the forecast is in"""
+    job = st.session_state.forecast_job
+    if job is None:
+        return
+    if not job.done():
+        current = job.progress.get('current')
+        if current:
+            st.info(f"Current AQI (Live): {current['aqi']:.0f} | PM2.5 {current['pm25']:.1f} µg/m³ | PM10 {current['pm10']:.1f} µg/m³. Forecasting the next 8 hours...")
+        else:
+            st.info("Fetching air quality data...")
+        return
+    st.session_state.forecast_job = None
+    error = job.error or apply_forecast(job.result)
+    if error:
+        st.session_state.forecast_notice = ('error', f"Error Encountered ! {error}")
+        st.session_state.data_loaded = False
+    else:
+        st.session_state.forecast_notice = ('success', "Forecast Ready!")
+    st.rerun()
+
 def check_location_rate_limit():
     """Check if location request can be made (1 request per 10 seconds)"""
     now = time.time()
@@ -152,14 +178,8 @@ def check_chatbot_rate_limit():
 
 def get_dominant_pollutant(pm25_avg, pm10_avg):
     """Determine dominant pollutant based on which has higher subindex"""
-    pm25_sub = get_PM25_subindex(pm25_avg)
-    pm10_sub = get_PM10_subindex(pm10_avg)
-    if pm25_sub > pm10_sub:
-        return "PM2.5"
-    elif pm10_sub > pm25_sub:
-        return "PM10"
-    else:
-        return "PM2.5 & PM10"
+    _, dominant = aqi({'PM2.5': pm25_avg, 'PM10': pm10_avg})
+    return dominant.item()
 
 def escape_html(text):
     """Escape HTML special characters to prevent raw HTML rendering"""
@@ -177,8 +197,15 @@ def get_img_as_base64(file_path):
 
 
 
+@st.cache_resource
+def warm_up_models():
+    """Load all horizon boosters of the configured forecast mode once per process instead of on the first forecast"""
+    return get_engine().registry.warm_up()
+
+
 # Streamlit App
 st.set_page_config(page_title="Breezo", layout="wide")
+warm_up_models()
 
 # Load Breezo logo as base64 for reliable inline rendering
 try:
@@ -380,6 +407,12 @@ if 'location_request_times' not in st.session_state:
     st.session_state.location_request_times = []  # Recent timestamps for location requests
 if 'chatbot_timestamps' not in st.session_state:
     st.session_state.chatbot_timestamps = []  # Recent timestamps for chatbot submits
+if 'forecast_job' not in st.session_state:
+    st.session_state.forecast_job = None  # Job handle while a forecast is computing in the background
+if 'chat_context' not in st.session_state:
+    st.session_state.chat_context = None  # {'hour', 'payload', 'hourly'} built with the forecast, valid for its IST hour
+if 'forecast_notice' not in st.session_state:
+    st.session_state.forecast_notice = None  # (kind, message) shown once after the job finishes
 
 # Address input section - using form for Enter key support
 st.markdown("### Where To?")
@@ -411,6 +444,7 @@ with st.form("address_form", clear_on_submit=False):
             st.session_state.rendered_qa_count = 0
             st.session_state.chatbot_error = None
             st.session_state.chatbot_count = 0  # Reset chat limit on new location
+            st.session_state.forecast_job = None  # Stop following the previous location's forecast
             st.session_state.location_request_times.append(time.time())
             
             # Geocoding spinner
@@ -431,34 +465,39 @@ with st.form("address_form", clear_on_submit=False):
                     st.success(f"Found! {lat:.4f}, {lon:.4f}")
                     st.session_state.location_info = {"lat": lat, "lon": lon, "address": location}
                     
-                    # Only show AQI spinner if location info was successfully received
-                    with st.spinner("Generating predictions (this may take a minute)..."):
-                        try:
-                            AQI_dic, AQI_live_dic, predictions_dic, error = AQI_builder(lat, lon)
-                            
-                            # Check for error from AQI_builder
+                    # Grid and cache hits are immediate; otherwise the pipeline runs as a background job
+                    try:
+                        result = cached_forecast(lat, lon)
+                        if result is None:
+                            st.session_state.forecast_job = submit_forecast(lat, lon)
+                        else:
+                            error = apply_forecast(result)
                             if error:
                                 st.error(f"Error Encountered ! {error}")
                                 st.session_state.data_loaded = False
-                            # Validate data before storing
-                            elif AQI_dic and AQI_live_dic and predictions_dic:
-                                st.session_state.aqi_data = AQI_dic
-                                st.session_state.aqi_live_data = AQI_live_dic
-                                st.session_state.predictions_data = predictions_dic
-                                st.session_state.data_loaded = True
-                                st.success("Forecast Ready!")
                             else:
-                                st.error("Error Encountered ! Incomplete data, please try again.")
-                                st.session_state.data_loaded = False
-                        except Exception as e:
-                            st.error(f"Error Encountered ! {str(e)}")
-                            st.info("💡 Please try again or check if the location has available air quality data.")
-                            st.session_state.data_loaded = False
+                                st.success("Forecast Ready!")
+                    except Exception as e:
+                        st.error(f"Error Encountered ! {str(e)}")
+                        st.info("💡 Please try again or check if the location has available air quality data.")
+                        st.session_state.data_loaded = False
     elif submitted and address == st.session_state.last_address:
         # Address hasn't changed, use cached data
         if st.session_state.data_loaded:
             st.info(" Using cached data for this location.")
 
+# Progress of a background forecast, and the outcome of the one that just finished
+if st.session_state.forecast_job is not None:
+    forecast_progress()
+if st.session_state.forecast_notice:
+    kind, message = st.session_state.forecast_notice
+    st.session_state.forecast_notice = None
+    if kind == 'error':
+        st.error(message)
+        st.info("💡 Please try again or check if the location has available air quality data.")
+    else:
+        st.success(message)
+
 # Display results if available
 if st.session_state.aqi_data and st.session_state.predictions_data:
     st.markdown("---")
@@ -586,6 +625,10 @@ if st.session_state.aqi_data and st.session_state.predictions_data:
         
         st.plotly_chart(fig, width="stretch")
 
+# Streaming answers are redrawn at most this often (seconds) or once this many characters arrive
+STREAM_FLUSH_SECONDS = 0.05
+STREAM_FLUSH_CHARS = 120
+
 # Initialize chatbot response in session state
 if 'chatbot_response' not in st.session_state:
     st.session_state.chatbot_response = ""
@@ -669,55 +712,76 @@ if st.session_state.chatbot_loading and st.session_state.location_info and st.se
     # Schema: [{"role": "user"/"assistant", "content": "..."}, ...]
     history_for_api = st.session_state.conversation_history[-8:] if len(st.session_state.conversation_history) > 8 else st.session_state.conversation_history
     
-    # Get full response with conversation history
-    # get_response expects conversation_history as list of {"role": str, "content": str} dicts
+    # Stream the response with conversation history
+    # get_response_stream expects conversation_history as list of {"role": str, "content": str} dicts
     
-    response, error = get_response(
-        st.session_state.chatbot_input, 
-        st.session_state.aqi_live_data, 
-        st.session_state.location_info['address'],
-        conversation_history=history_for_api
-    )
-    if error:
-        st.session_state.chatbot_error = error
+    context = session_chat_context()
+    info = st.session_state.location_info
+    if context is None:
+        # The forecast is from an earlier hour: fetch this hour's instead of answering from stale data
+        if st.session_state.forecast_job is None:
+            st.session_state.forecast_job = submit_forecast(info['lat'], info['lon'])
+        st.session_state.chatbot_error = "The forecast is being updated for the new hour. Please ask again in a moment."
         st.session_state.chatbot_loading = False
         st.session_state.chatbot_input = ""
         st.rerun()
-    if not response or not isinstance(response, str):
-        st.session_state.chatbot_error = "Invalid response from chatbot"
+    
+    # A question without history depends only on the cell's payload and the address, so its answer is shared
+    answer_scope = forecast_key(info['lat'], info['lon'], context['hour']) + (info['address'],) if not history_for_api else None
+    # Structured questions (best window, current AQI, trend, a specific hour) are answered from the payload directly
+    routed_answer = route_question(st.session_state.chatbot_input, context)
+    cached_answer = None
+    if routed_answer is None and answer_scope:
+        cached_answer = get_answer_cache().get(answer_scope, st.session_state.chatbot_input)
+    
+    if routed_answer is not None:
+        deltas, error = iter([routed_answer]), None
+    elif cached_answer is not None:
+        deltas, error = iter([cached_answer]), None
+    else:
+        deltas, error = get_response_stream(
+            st.session_state.chatbot_input, 
+            context, 
+            info['address'],
+            conversation_history=history_for_api
+        )
+    if error:
+        st.session_state.chatbot_error = error
         st.session_state.chatbot_loading = False
         st.session_state.chatbot_input = ""
         st.rerun()
     
-    # Stream response letter by letter - update the single container
-    streamed_text = ""
     current_question = st.session_state.chatbot_input
     
-    for char in response:
-        streamed_text += char
-        # Process streamed text: replace double newlines with single newline
-        processed_streamed = streamed_text.replace('\n\n', '\n')
-        
-        # Build complete HTML: previous Q&A + current streaming Q&A
-        complete_html = '<div class="chat-main-container">'
-        
-        # Add all previously rendered Q&A pairs
-        if st.session_state.rendered_qa_html:
-            complete_html += st.session_state.rendered_qa_html
-        
-        # Add divider if there are previous Q&A pairs
-        if st.session_state.rendered_qa_count > 0:
-            complete_html += '<div class="qa-divider"></div>'
-        
-        # Add current streaming Q&A pair
-        escaped_question = escape_html(current_question)
-        escaped_streamed = escape_html(processed_streamed)
-        complete_html += f'<div class="qa-pair"><div class="chat-question">You: {escaped_question}</div><div class="chat-answer">Bot: {escaped_streamed}</div></div>'
-        complete_html += '</div>'
-        
-        # Update the single container
-        conversation_placeholder.markdown(complete_html, unsafe_allow_html=True)
-        time.sleep(0.005)  # Small delay for streaming effect
+    # Everything around the streaming answer is built once: previous Q&A pairs, divider and question
+    stream_prefix = '<div class="chat-main-container">' + st.session_state.rendered_qa_html
+    if st.session_state.rendered_qa_count > 0:
+        stream_prefix += '<div class="qa-divider"></div>'
+    stream_prefix += f'<div class="qa-pair"><div class="chat-question">You: {escape_html(current_question)}</div><div class="chat-answer">Bot: '
+    stream_suffix = '</div></div></div>'
+    
+    # Deltas are appended to a list and the container is redrawn at most every
+    # STREAM_FLUSH_SECONDS or STREAM_FLUSH_CHARS, not once per token
+    parts = []
+    pending = 0
+    last_flush = time.monotonic()
+    try:
+        for delta in deltas:
+            parts.append(delta)
+            pending += len(delta)
+            if pending >= STREAM_FLUSH_CHARS or time.monotonic() - last_flush >= STREAM_FLUSH_SECONDS:
+                streamed_text = ''.join(parts).replace('\n\n', '\n')
+                conversation_placeholder.markdown(stream_prefix + escape_html(streamed_text) + stream_suffix, unsafe_allow_html=True)
+                pending = 0
+                last_flush = time.monotonic()
+    except Exception as e:
+        st.session_state.chatbot_error = f"Chatbot error: {str(e)}"
+        st.session_state.chatbot_loading = False
+        st.session_state.chatbot_input = ""
+        st.rerun()
+    response = ''.join(parts)
+    if answer_scope and routed_answer is None and cached_answer is None:
+        get_answer_cache().set(answer_scope, current_question, response, hour_expiry(context['hour']))
     
     # After streaming completes, add this Q&A pair to rendered HTML (no re-rendering!)
     # Process response: replace double newlines with single newline, trim extra spaces
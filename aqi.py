@@ -0,0 +1,133 @@
+import time
+import numpy as np
+
+# CPCB breakpoints: concentration at the lower edge of each category
+# (Good, Satisfactory, Moderate, Poor, Very Poor, Severe) plus one point past
+# Severe that fixes the slope used above the last breakpoint.
+# PM2.5/PM10 and the 24-hr pollutants are µg/m³ except CO (8-hr, mg/m³);
+# O3 and CO use their 8-hr averages.
+INDEX_BREAKPOINTS = [0, 50, 100, 200, 300, 400, 500]
+BREAKPOINTS = {
+    'PM2.5': [0, 30, 60, 90, 120, 250, 380],
+    'PM10': [0, 50, 100, 250, 350, 430, 510],
+    'NO2': [0, 40, 80, 180, 280, 400, 520],
+    'O3': [0, 50, 100, 168, 208, 748, 1288],
+    'CO': [0, 1, 2, 10, 17, 34, 51],
+    'SO2': [0, 40, 80, 380, 800, 1600, 2400],
+    'NH3': [0, 200, 400, 800, 1200, 1800, 2400],
+    'Pb': [0, 0.5, 1, 2, 3, 3.5, 4],
+}
+POLLUTANTS = tuple(BREAKPOINTS)
+CATEGORIES = ['Good', 'Satisfactory', 'Moderate', 'Poor', 'Very Poor', 'Severe']
+
+
+def _segments(pollutant):
+    conc = np.asarray(BREAKPOINTS[pollutant], dtype=float)
+    index = np.asarray(INDEX_BREAKPOINTS, dtype=float)
+    slope = np.diff(index) / np.diff(conc)
+    return conc, index, slope
+
+
+TABLES = {pollutant: _segments(pollutant) for pollutant in POLLUTANTS}
+
+
+def get_PM25_subindex(x):
+    if x <= 30:
+        return x * 50 / 30
+    elif x <= 60:
+        return 50 + (x - 30) * 50 / 30
+    elif x <= 90:
+        return 100 + (x - 60) * 100 / 30
+    elif x <= 120:
+        return 200 + (x - 90) * 100 / 30
+    elif x <= 250:
+        return 300 + (x - 120) * 100 / 130
+    elif x > 250:
+        return 400 + (x - 250) * 100 / 130
+    else:
+        return 0
+
+def get_PM10_subindex(x):
+    if x <= 50:
+        return x
+    elif x <= 100:
+        return x
+    elif x <= 250:
+        return 100 + (x - 100) * 100 / 150
+    elif x <= 350:
+        return 200 + (x - 250)
+    elif x <= 430:
+        return 300 + (x - 350) * 100 / 80
+    elif x > 430:
+        return 400 + (x - 430) * 100 / 80
+    else:
+        return 0
+
+
+def subindex(pollutant, values):
+    """CPCB sub-index of a pollutant for an array of concentrations.
+
+    Each value is placed in its category with one searchsorted pass and
+    interpolated linearly; values above the Severe breakpoint continue on the
+    Severe slope. NaN gives 0, like the scalar functions.
+    """
+    conc, index, slope = TABLES[pollutant]
+    values = np.asarray(values, dtype=float)
+    # side='left' puts a value equal to a breakpoint in the lower category (x <= bp)
+    seg = np.searchsorted(conc[1:-1], values, side='left')
+    out = index[seg] + (values - conc[seg]) * slope[seg]
+    return np.where(np.isnan(values), 0.0, out)
+
+
+def aqi(concentrations):
+    """Overall AQI and dominant pollutant per element.
+
+    `concentrations` maps pollutant names from POLLUTANTS to equally shaped
+    arrays. Returns (aqi, dominant) where dominant holds the name of the
+    pollutant with the highest sub-index, ties joined with ' & '.
+    """
+    names = [p for p in POLLUTANTS if p in concentrations]
+    if not names:
+        raise ValueError(f"No known pollutants in {list(concentrations)}; expected some of {POLLUTANTS}")
+    sub = np.stack([subindex(p, concentrations[p]) for p in names])
+    overall = sub.max(axis=0)
+
+    # Encode which pollutants hit the maximum as a bitmask, then name each distinct mask once
+    is_max = sub == overall
+    codes = np.zeros(overall.shape, dtype=np.int64)
+    for bit in range(len(names)):
+        codes |= is_max[bit].astype(np.int64) << bit
+    unique, inverse = np.unique(codes, return_inverse=True)
+    labels = np.array([' & '.join(n for bit, n in enumerate(names) if code >> bit & 1) for code in unique], dtype=object)
+    dominant = labels[inverse].reshape(overall.shape)
+    return overall, dominant
+
+
+def aqi_category(value):
+    """CPCB category name for an AQI value; a value on a breakpoint belongs to the lower category"""
+    return CATEGORIES[int(np.searchsorted(INDEX_BREAKPOINTS[1:-1], value, side='left'))]
+
+
+def pm_aqi(pm25, pm10):
+    """AQI from PM2.5 and PM10 arrays, the two pollutants the forecast models cover"""
+    return np.maximum(subindex('PM2.5', pm25), subindex('PM10', pm10))
+
+
+if __name__ == '__main__':
+    rng = np.random.default_rng(0)
+    n = 1_000_000
+    pm25 = rng.gamma(2.0, 80.0, n)
+    pm10 = rng.gamma(2.0, 130.0, n)
+
+    start = time.time()
+    scalar = [max(get_PM25_subindex(a), get_PM10_subindex(b)) for a, b in zip(pm25, pm10)]
+    scalar_time = time.time() - start
+
+    start = time.time()
+    vector, dominant = aqi({'PM2.5': pm25, 'PM10': pm10})
+    vector_time = time.time() - start
+
+    print(f"Max abs difference: {np.max(np.abs(np.asarray(scalar) - vector))}")
+    print(f"Scalar: {scalar_time:.3f} seconds for {n} elements")
+    print(f"Vectorized (with dominant pollutant): {vector_time:.3f} seconds for {n} elements")
+    print(f"Speedup: {scalar_time / vector_time:.0f}x")
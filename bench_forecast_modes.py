@@ -0,0 +1,124 @@
+"""
+Compare the chained (model_og) and direct (model_direct) forecast modes on a
+held-out test set: R² per pollutant and horizon, overall and for the winter
+months (November to February, the smog season the app is mostly used in),
+and inference latency.
+
+    python bench_forecast_modes.py test.csv
+    python bench_forecast_modes.py test.csv --modes chain,direct --runs 200
+
+The CSV has one row per station-hour with the observed features at that hour
+(the same names the models read; 'Predictions t+k' columns are not needed)
+and the targets as target_pm25_t+1 .. target_pm25_t+8 and
+target_pm10_t+1 .. target_pm10_t+8. The month is read from a 'month' column
+(1-12) if there is one, otherwise from the month_sin/month_cos features.
+
+Only model_og/ ships with the app: the direct models and the code that trains
+them are not in this repository, so model_direct/ has to be trained and
+exported separately before the direct mode can be compared.
+"""
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from inference import get_engine
+from model_registry import POLLUTANTS, HORIZONS
+
+
+WINTER_MONTHS=(11,12,1,2)
+
+
+def target_column(poll,time_step):
+    return f'target_{poll}_t+{time_step}'
+
+
+def months(df):
+    """Calendar month of each row, from 'month' or the month_sin/month_cos features (see Builder.extract_features)"""
+    if 'month' in df.columns:
+        return df['month'].to_numpy(dtype=int)
+    angle=np.arctan2(df['month_sin'].to_numpy(dtype=float),df['month_cos'].to_numpy(dtype=float))
+    return np.rint(angle*12/(2*np.pi)).astype(int)%12+1
+
+
+def r2_score(y_true,y_pred):
+    mask=~(np.isnan(y_true)|np.isnan(y_pred))
+    y_true,y_pred=y_true[mask],y_pred[mask]
+    ss_res=np.sum((y_true-y_pred)**2)
+    ss_tot=np.sum((y_true-y_true.mean())**2)
+    return 1-ss_res/ss_tot if ss_tot>0 else np.nan
+
+
+def evaluate(mode,df,runs,winter):
+    engine=get_engine(mode)
+    models=engine.models()
+    rows=df.reindex(columns=engine.vocabulary).to_numpy(dtype=float)
+    # Chain mode fills these from its own predictions, as it does in production
+    for time_step in HORIZONS[:-1]:
+        name=f'Predictions t+{time_step}'
+        if name in engine.vocabulary_index:
+            rows[:,engine.vocabulary_index[name]]=np.nan
+
+    predictions,_=engine.predict_rows(rows,models)
+    scores={}
+    for poll in POLLUTANTS:
+        for k,time_step in enumerate(HORIZONS):
+            y_true=df[target_column(poll,time_step)].to_numpy(dtype=float)
+            y_pred=predictions[poll][:,k].astype(float)
+            scores[(poll,time_step)]=r2_score(y_true,y_pred)
+            scores[(poll,time_step,'winter')]=r2_score(y_true[winter],y_pred[winter]) if winter.any() else np.nan
+
+    # Latency of one forecast (a single site, all 16 boosters), as the app runs it
+    engine.predict_rows(rows[:1],models)   # warm-up
+    latencies=[]
+    for i in range(runs):
+        start=time.perf_counter()
+        engine.predict_rows(rows[i%len(rows):i%len(rows)+1],models)
+        latencies.append(time.perf_counter()-start)
+    latencies=np.array(latencies)*1000
+
+    start=time.perf_counter()
+    engine.predict_rows(rows,models)
+    batch_seconds=time.perf_counter()-start
+    return scores,{'p50': np.percentile(latencies,50),'p95': np.percentile(latencies,95),'batch_rows_per_s': len(rows)/batch_seconds}
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('csv')
+    parser.add_argument('--modes',default='chain,direct')
+    parser.add_argument('--runs',type=int,default=200)
+    args=parser.parse_args(argv)
+
+    df=pd.read_csv(args.csv)
+    missing=[target_column(p,s) for p in POLLUTANTS for s in HORIZONS if target_column(p,s) not in df.columns]
+    if missing:
+        sys.exit(f"{args.csv} is missing target columns: {missing}")
+
+    if 'month' not in df.columns and not {'month_sin','month_cos'}<=set(df.columns):
+        sys.exit(f"{args.csv} needs a month column or the month_sin/month_cos features")
+
+    modes=args.modes.split(',')
+    winter=np.isin(months(df),WINTER_MONTHS)
+    results={mode: evaluate(mode,df,args.runs,winter) for mode in modes}
+
+    header='| Horizon | '+' | '.join(f'{poll.upper()} {mode}' for poll in POLLUTANTS for mode in modes)+' |'
+    for title,suffix in ((f"R² on {len(df)} rows",()),(f"Winter (Nov-Feb) R² on {int(winter.sum())} rows",('winter',))):
+        print(title)
+        print(header)
+        print('|'+'---|'*(1+len(POLLUTANTS)*len(modes)))
+        for time_step in HORIZONS:
+            cells=[f'{results[mode][0][(poll,time_step)+suffix]:.3f}' for poll in POLLUTANTS for mode in modes]
+            print(f'| t+{time_step} | '+' | '.join(cells)+' |')
+        print()
+
+    print('| Mode | p50 (ms) | p95 (ms) | batch rows/s |')
+    print('|---|---|---|---|')
+    for mode in modes:
+        latency=results[mode][1]
+        print(f"| {mode} | {latency['p50']:.2f} | {latency['p95']:.2f} | {latency['batch_rows_per_s']:.0f} |")
+    return results
+
+
+if __name__ == '__main__':
+    main()
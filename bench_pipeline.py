@@ -0,0 +1,307 @@
+"""
+Benchmark the forecast pipeline stage by stage against recorded API responses.
+
+Recorded Open-Meteo and Google Air Quality responses are served by a local
+fixture server, re-dated to the current hour, so runs are reproducible and
+never touch the live APIs. Each stage is timed separately for a cold run
+(empty caches, stores and model registry, new connections) and for warm
+runs, and the results are written as JSON so they can be compared across
+commits.
+
+    python bench_pipeline.py --record                 # save fresh fixtures from the live APIs (needs API keys)
+    python bench_pipeline.py                          # replay ./bench_fixtures, print JSON
+    python bench_pipeline.py --runs 50 --out bench.json
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+import builder
+from builder import Builder, ist_now, snap_to_grid, WEATHER_PLAN, AIR_QUALITY_PLAN, HISTORY_HOURS
+from http_client import get_client
+from cache import TTLCache
+from feature_plan import min_periods
+from feature_state import FeatureStateStore
+from history_store import HistoryStore
+from ingest import weather_frame, current_frame, history_frame
+from model_registry import ModelRegistry, POLLUTANTS, HORIZONS
+from inference import InferenceEngine, get_engine
+from predict import Predictor
+from aqi import pm_aqi
+from chatbot import build_chat_context
+
+FIXTURE_DIR='./bench_fixtures'
+FIXTURES=('weather','aq_current','aq_history')
+BENCH_LAT,BENCH_LON=28.6139,77.2090
+
+
+def load_fixtures(fixture_dir=FIXTURE_DIR):
+    fixtures={}
+    for name in FIXTURES:
+        path=os.path.join(fixture_dir,f'{name}.json')
+        if not os.path.exists(path):
+            sys.exit(f"Missing fixture {path}; run `python bench_pipeline.py --record` first")
+        with open(path) as f:
+            fixtures[name]=json.load(f)
+    return fixtures
+
+
+def record(fixture_dir=FIXTURE_DIR,lat=BENCH_LAT,lon=BENCH_LON):
+    """Save one live response per endpoint for (lat, lon)"""
+    b=Builder(lat,lon)
+    client=get_client()
+    end=pd.Timestamp.now(tz='UTC').floor('h').tz_localize(None)-pd.Timedelta(hours=1)
+    start=end-pd.Timedelta(hours=HISTORY_HOURS-1)
+    fixtures={
+        'weather': client.run(client.request_json('GET',weather_url(lat,lon),timeout=30)),
+        'aq_current': client.run(client.request_json('POST',current_url(),json=location_payload(lat,lon),timeout=30)),
+        'aq_history': {'hoursInfo': client.run(b._fetch_history_period(history_url(),start,end))},
+    }
+    os.makedirs(fixture_dir,exist_ok=True)
+    for name,data in fixtures.items():
+        with open(os.path.join(fixture_dir,f'{name}.json'),'w') as f:
+            json.dump(data,f)
+        print(f"Recorded {name} -> {fixture_dir}/{name}.json")
+
+
+def weather_url(lat,lon):
+    return f'{builder.OPEN_METEO_URL}/v1/forecast?latitude={lat}&longitude={lon}&hourly={builder.WEATHER_HOURLY}&timezone=auto&past_days=2&forecast_days=3'
+
+
+def current_url():
+    return f'{builder.AIR_QUALITY_URL}/v1/currentConditions:lookup?key={builder.GOOGLE_API}'
+
+
+def history_url():
+    return f'{builder.AIR_QUALITY_URL}/v1/history:lookup?key={builder.GOOGLE_API}'
+
+
+def location_payload(lat,lon):
+    return {"location": {"latitude": lat,"longitude": lon},"extraComputations": ["POLLUTANT_CONCENTRATION"]}
+
+
+def history_payload(lat,lon,start,end):
+    return dict(location_payload(lat,lon),pageSize=168,period={
+        "startTime": start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        "endTime": (end+pd.Timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ'),
+    })
+
+
+class FixtureServer():
+    """Local HTTP server answering the three upstream endpoints from recorded responses.
+
+    Responses are re-dated on every request: weather hours start two local days
+    back as with past_days=2, the current conditions carry the current UTC hour,
+    and history returns the requested period filled from the recorded hours at
+    the same distance from the newest one.
+    """
+    def __init__(self,fixtures):
+        self.fixtures=fixtures
+        self.recorded_hours=sorted(fixtures['aq_history']['hoursInfo'],key=lambda h: h['dateTime'],reverse=True)
+        self.loop=asyncio.new_event_loop()
+        self.url=None
+
+    async def weather(self,request):
+        data=json.loads(json.dumps(self.fixtures['weather']))
+        n=len(data['hourly']['time'])
+        start=ist_now().floor('D')-pd.Timedelta(days=2)
+        data['hourly']['time']=list(pd.date_range(start,periods=n,freq='h').strftime('%Y-%m-%dT%H:%M'))
+        return web.json_response(data)
+
+    async def current(self,request):
+        data=dict(self.fixtures['aq_current'])
+        data['dateTime']=pd.Timestamp.now(tz='UTC').floor('h').strftime('%Y-%m-%dT%H:%M:%SZ')
+        return web.json_response(data)
+
+    async def history(self,request):
+        body=await request.json()
+        start=pd.Timestamp(body['period']['startTime']).tz_localize(None)
+        end=pd.Timestamp(body['period']['endTime']).tz_localize(None)
+        newest=pd.Timestamp.now(tz='UTC').floor('h').tz_localize(None)-pd.Timedelta(hours=1)
+        hours=pd.date_range(start,end-pd.Timedelta(hours=1),freq='h')[::-1]
+        hours_info=[]
+        for hour in hours:
+            offset=int((newest-hour)/pd.Timedelta(hours=1))
+            recorded=self.recorded_hours[offset%len(self.recorded_hours)]
+            hours_info.append(dict(recorded,dateTime=hour.strftime('%Y-%m-%dT%H:%M:%SZ')))
+        return web.json_response({'hoursInfo': hours_info})
+
+    def _serve(self,ready):
+        asyncio.set_event_loop(self.loop)
+        try:
+            app=web.Application()
+            app.router.add_get('/v1/forecast',self.weather)
+            app.router.add_post('/v1/currentConditions:lookup',self.current)
+            app.router.add_post('/v1/history:lookup',self.history)
+            self.runner=web.AppRunner(app,access_log=None)
+            self.loop.run_until_complete(self.runner.setup())
+            site=web.TCPSite(self.runner,'127.0.0.1',0)
+            self.loop.run_until_complete(site.start())
+            host,port=self.runner.addresses[0][:2]
+            self.url=f'http://{host}:{port}'
+        except Exception as e:
+            # Reported by start() instead of leaving it waiting forever
+            self.error=e
+            ready.set()
+            return
+        ready.set()
+        self.loop.run_forever()
+
+    def start(self):
+        self.error=None
+        ready=threading.Event()
+        threading.Thread(target=self._serve,args=(ready,),daemon=True,name='fixture-server').start()
+        ready.wait()
+        if self.error is not None:
+            raise RuntimeError(f"Fixture server failed to start: {self.error}") from self.error
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(),self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def timed(fn,*args,**kwargs):
+    start=time.perf_counter()
+    result=fn(*args,**kwargs)
+    return result,(time.perf_counter()-start)*1000
+
+
+def reset_state(tmp_dir):
+    """Fresh response cache, history store and feature state, as a new process would have"""
+    builder.response_cache=TTLCache(maxsize=builder.RESPONSE_CACHE_SIZE)
+    builder.history_store=HistoryStore(os.path.join(tmp_dir,f'history_{time.time_ns()}.sqlite'))
+    builder.feature_states=FeatureStateStore(AIR_QUALITY_PLAN,os.path.join(tmp_dir,'feature_state'))
+
+
+def run_once(lat,lon,engine,registry,cold):
+    """Time every stage once; returns {stage: ms} plus per-horizon inference times"""
+    client=get_client()
+    t={}
+    end=pd.Timestamp.now(tz='UTC').floor('h').tz_localize(None)-pd.Timedelta(hours=1)
+    start=end-pd.Timedelta(hours=HISTORY_HOURS-1)
+
+    # HTTP: the three upstream calls, bypassing every cache
+    weather,t['http_weather']=timed(client.run,client.request_json('GET',weather_url(lat,lon)))
+    current,t['http_aq_current']=timed(client.run,client.request_json('POST',current_url(),json=location_payload(lat,lon)))
+    history,t['http_aq_history']=timed(client.run,client.request_json('POST',history_url(),json=history_payload(lat,lon,start,end)))
+
+    # Parsing into typed frames
+    df_weather,t['parse_weather']=timed(weather_frame,weather['hourly'])
+    _,t['parse_aq_current']=timed(current_frame,current)
+    _,t['parse_aq_history']=timed(history_frame,history['hoursInfo'])
+
+    # The Builder end to end, with its response cache and history store
+    b=Builder(lat,lon)
+    _,t['builder_merge']=timed(client.run,b.merge())
+    if b.critical_errors:
+        raise RuntimeError(f"Pipeline failed against the fixture server: {b.critical_errors}")
+
+    _,t['extract_features']=timed(Builder(lat,lon).extract_features)
+
+    # Feature aggregation as merge does it: weather plan, rolling air-quality state, 24h averages
+    def aggregate():
+        features=WEATHER_PLAN.evaluate(df_weather,b.curr_time)
+        df_final=pd.concat([b.aq_past,b.aq_curr])
+        index_here=df_final.index[-1]
+        features.update(builder.feature_states.features(snap_to_grid(lat,lon),df_final,index_here))
+        features['Average_pm25_24']=df_final['PM2.5 (µg/m³)'].rolling(window=24,min_periods=min_periods(24)).mean().loc[index_here]
+        features['Average_pm10_24']=df_final['PM10 (µg/m³)'].rolling(window=24,min_periods=min_periods(24)).mean().loc[index_here]
+        return features
+    _,t['feature_aggregation']=timed(aggregate)
+
+    if cold:
+        _,t['model_load']=timed(registry.warm_up)
+    else:
+        _,t['model_load']=timed(lambda: [registry.get(poll,time_step) for poll in POLLUTANTS for time_step in HORIZONS])
+
+    p=Predictor(lat,lon,builder=b)
+    p.set_current()
+    (predictions,timings),t['inference']=timed(engine.predict,[p.features])
+    p.set_predictions({poll: values[0] for poll,values in predictions.items()},timings)
+    _,t['build_averages']=timed(p.build_averages)
+
+    def convert():
+        series={name: [p.predictions_dic[key][name] for key in range(9)] for name in ('pm25','pm10','PM25_AVG_24','PM10_AVG_24')}
+        return pm_aqi(series['pm25'],series['pm10']),pm_aqi(series['PM25_AVG_24'],series['PM10_AVG_24'])
+    (aqi_live,_),t['aqi_conversion']=timed(convert)
+
+    aqi_live_dic={key: float(aqi_live[key]) for key in range(9)}
+    _,t['runtime_payload']=timed(lambda: build_chat_context(aqi_live_dic,ist_now().floor('h')))
+
+    horizons={f'{poll} t+{time_step}': seconds*1000 for (poll,time_step),seconds in timings.items()}
+    return t,horizons
+
+
+def summarize(samples):
+    values=np.array(samples)
+    return {'p50': float(np.percentile(values,50)),'p95': float(np.percentile(values,95)),'mean': float(values.mean())}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git','rev-parse','HEAD'],capture_output=True,text=True,check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--record',action='store_true')
+    parser.add_argument('--fixtures',default=FIXTURE_DIR)
+    parser.add_argument('--runs',type=int,default=20)
+    parser.add_argument('--out')
+    args=parser.parse_args(argv)
+
+    if args.record:
+        record(args.fixtures)
+        return None
+
+    server=FixtureServer(load_fixtures(args.fixtures))
+    url=server.start()
+    builder.OPEN_METEO_URL=url
+    builder.AIR_QUALITY_URL=url
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            reset_state(tmp_dir)
+            # Cold: empty stores, a registry and engine that have loaded nothing, no open connections
+            registry=ModelRegistry(get_engine().registry.model_dir)
+            engine=InferenceEngine(get_engine().mode,registry=registry)
+            cold,cold_horizons=run_once(BENCH_LAT,BENCH_LON,engine,registry,cold=True)
+
+            warm_runs=[run_once(BENCH_LAT,BENCH_LON,engine,registry,cold=False) for _ in range(args.runs)]
+    finally:
+        server.stop()
+
+    results={
+        'commit': git_commit(),
+        'timestamp': pd.Timestamp.now(tz='UTC').isoformat(),
+        'python': platform.python_version(),
+        'mode': engine.mode,
+        'backend': engine.backend,
+        'runs': args.runs,
+        'cold_ms': cold,
+        'cold_inference_ms': cold_horizons,
+        'warm_ms': {stage: summarize([t[stage] for t,_ in warm_runs]) for stage in cold},
+        'warm_inference_ms': {h: summarize([horizons[h] for _,horizons in warm_runs]) for h in cold_horizons},
+    }
+    output=json.dumps(results,indent=2)
+    if args.out:
+        with open(args.out,'w') as f:
+            f.write(output)
+    print(output)
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,13 @@ from dotenv import load_dotenv
 import os
 import streamlit as st
 import pytz
+from feature_plan import compile_plan, min_periods
+from http_client import get_client
+from cache import TTLCache
+from feature_state import FeatureStateStore
+from history_store import HistoryStore, missing_ranges
+from tracing import traced, current_span
+from ingest import AIR_QUALITY_COLUMNS, weather_frame, history_frame, current_frame
 
 GOOGLE_API=st.secrets["google"]["api_key"]
 OPEN_AI_API=st.secrets["open_ai"]["api_key"]
@@ -27,100 +34,134 @@ logger = logging.getLogger(__name__)
 feature_dic={'Benzene (µg/m³)': {'lag': [3], 'mean': [2, 24, 48, 6], 'std': [2, 24, 48, 6]}, 'CO (mg/m³)': {'lag': [5], 'mean': [2, 24, 48, 6], 'std': [24, 6]}, 'NH3 (µg/m³)': {'mean': [2, 24, 6], 'std': [48]}, 'NO (µg/m³)': {'std': [2, 6]}, 'NO2 (µg/m³)': {'lag': [1, 3, 5], 'mean': [24, 6], 'std': [2, 24, 48, 6]}, 'NOx (ppb)': {'lag': [1, 3, 5], 'mean': [24, 48, 6], 'std': [2, 24, 48, 6]}, 'Ozone (µg/m³)': {'lag': [1], 'mean': [48]}, 'PM10 (µg/m³)': {'lag': [1, 168, 2, 24, 5], 'mean': [12, 168, 24, 6], 'std': [12, 168, 2, 24, 48, 6]}, 'PM2.5 (µg/m³)': {'lag': [1, 168, 2, 24], 'mean': [168, 24], 'std': [24, 48, 6]}, 'Predictions t+1': {'base': True}, 'Predictions t+2': {'base': True}, 'Predictions t+3': {'base': True}, 'Predictions t+4': {'base': True}, 'Predictions t+5': {'base': True}, 'Predictions t+6': {'base': True}, 'Predictions t+7': {'base': True}, 'SO2 (µg/m³)': {'mean': [2, 24, 6], 'std': [24, 48]}, 'covid': {'base': True}, 'hour_cos': {'base': True, 't+': [2, 3, 4, 5, 6, 7, 8]}, 'hour_sin': {'base': True, 't+': [2, 3, 4, 5, 6, 7]}, 'lat': {'base': True}, 'long': {'base': True}, 'master': {'base': True, 't+': [2, 3, 4, 5, 6, 8], 'mean': [24, 6], 'std': [24, 6]}, 'master_2': {'t+': [2, 3, 4, 5, 6, 7, 8], 'mean': [6]}, 'master_3': {'base': True, 't+': [2, 3, 4, 5, 6, 7, 8], 'mean': [24, 3, 6], 'std': [24]}, 'master_4': {'base': True, 't+': [2, 3, 4, 5, 6, 7, 8], 'mean': [24, 3, 6], 'std': [24, 3, 6]}, 'month_cos': {'base': True}, 'month_sin': {'base': True}, 'rain (mm)': {'lag': [3], 'sum': [12, 24, 3, 48]}, 'relative_humidity_2m (%)': {'base': True, 't+': [2, 3, 4, 5, 6, 7, 8], 'lag': [1, 3, 5], 'mean': [24], 'std': [48, 6]}, 'rush_hour': {'base': True, 't+': [2, 3, 4, 5, 6, 7, 8]}, 'temperature_2m (°C)': {'base': True, 't+': [2, 3, 4, 5], 'lag': [5], 'mean': [24, 6], 'std': [2, 24, 6]}, 'weekday_cos': {'base': True, 't+': [3, 4, 5, 7, 8]}, 'weekday_sin': {'t+': [8]}, 'wind_direction_100m (°)_cos': {'mean': [48], 'std': [48]}, 'wind_direction_100m (°)_sin': {'t+': [2, 3, 4, 5, 6], 'lag': [1, 3], 'mean': [48], 'std': [24, 48]}, 'wind_direction_10m (°)_cos': {'lag': [5]}, 'wind_gusts_10m (km/h)': {'base': True, 't+': [2, 3, 4, 5, 6, 7, 8], 'lag': [1], 'mean': [24, 48, 6], 'std': [24, 48]}, 'wind_speed_100m (km/h)': {'base': True, 'mean': [48, 6], 'std': [24, 48]}, 'wind_speed_10m (km/h)': {'t+': [5], 'mean': [6], 'std': [48]}}
 
 
+WEATHER_BASES=['rain (mm)',
+    'relative_humidity_2m (%)',
+    'temperature_2m (°C)',
+    'wind_direction_100m (°)',
+    'wind_direction_10m (°)',
+    'wind_gusts_10m (km/h)',
+    'wind_speed_100m (km/h)',
+    'wind_speed_10m (km/h)',
+    'master',
+    'master_2',
+    'master_3',
+    'master_4',
+    'wind_direction_100m (°)_cos',
+    'wind_direction_100m (°)_sin',
+    'wind_direction_10m (°)_cos']
+
+AIR_QUALITY_BASES=['Benzene (µg/m³)',
+    'CO (mg/m³)',
+    'NH3 (µg/m³)',
+    'NO (µg/m³)',
+    'NO2 (µg/m³)',
+    'NOx (ppb)',
+    'Ozone (µg/m³)',
+    'PM10 (µg/m³)',
+    'PM2.5 (µg/m³)',
+    'SO2 (µg/m³)']
+
+# feature_dic compiled once at import into flat extraction plans
+WEATHER_PLAN=compile_plan(feature_dic,WEATHER_BASES)
+AIR_QUALITY_PLAN=compile_plan(feature_dic,AIR_QUALITY_BASES)
+
+# Upstream responses are shared by every lookup in the same grid cell and IST hour
+cache_config=st.secrets.get("cache",{})
+CACHE_GRID_DEG=float(cache_config.get("grid_deg",0.01))   # ~1.1 km cells
+RESPONSE_CACHE_SIZE=int(cache_config.get("response_cache_size",512))
+RESPONSE_CACHE_PATH=cache_config.get("response_cache_path")   # SQLite file, optional
+
+response_cache=TTLCache(maxsize=RESPONSE_CACHE_SIZE,path=RESPONSE_CACHE_PATH)
+
+# Upstream API roots, configurable so the pipeline benchmark can replay recorded responses
+api_config=st.secrets.get("api",{})
+OPEN_METEO_URL=api_config.get("open_meteo_url","https://api.open-meteo.com")
+AIR_QUALITY_URL=api_config.get("air_quality_url","https://airquality.googleapis.com")
+WEATHER_HOURLY='temperature_2m,wind_speed_10m,rain,wind_speed_80m,wind_speed_120m,wind_direction_10m,wind_direction_80m,wind_direction_120m,wind_gusts_10m,relative_humidity_2m'
+
+# Local copy of Google Air Quality history so warm cells only fetch the newest hours
+HISTORY_HOURS=167
+HISTORY_COLUMNS=AIR_QUALITY_COLUMNS
+history_store=HistoryStore(cache_config.get("history_store_path","./aq_history.sqlite"))
+
+
+class HistoryAPIError(Exception):
+    """Error message returned in a history:lookup response body"""
+
+
+# Rolling air-quality features per grid cell, advanced hour by hour between forecasts
+feature_states=FeatureStateStore(AIR_QUALITY_PLAN,cache_config.get("feature_state_dir","./feature_state"))
+
+
+def ist_now():
+    return pd.to_datetime(datetime.now())+pd.Timedelta(hours=5.5)
+
+
+def snap_to_grid(lat,lon,grid=CACHE_GRID_DEG):
+    """Centre of the grid cell containing (lat, lon)"""
+    return round(round(lat/grid)*grid,6),round(round(lon/grid)*grid,6)
+
+
+def hour_expiry(hour):
+    """Epoch time at which the IST hour bucket starting at `hour` ends"""
+    remaining=(hour+pd.Timedelta(hours=1)-ist_now()).total_seconds()
+    return time.time()+remaining
+
+
 
 class Builder():
-    def __init__(self,lattitude,longitude):
+    def __init__(self,lattitude,longitude,on_current=None):
         self.lat=lattitude
         self.long=longitude
-        self.curr_time=(pd.to_datetime(datetime.now())+pd.Timedelta(hours=5.5)).floor('h')
+        # Called with aq_curr as soon as current conditions are parsed, before the other stages finish
+        self.on_current=on_current
+        self.curr_time=ist_now().floor('h')
         self.final_model_dic={}
         self.critical_errors=[]
         self.errors=[]
         self.aq_curr=pd.DataFrame()
         self.aq_past=pd.DataFrame()
-        self.air_quality_bases=['Benzene (µg/m³)',
-        'CO (mg/m³)',
-        'NH3 (µg/m³)',
-        'NO (µg/m³)',
-        'NO2 (µg/m³)',
-        'NOx (ppb)',
-        'Ozone (µg/m³)',
-        'PM10 (µg/m³)',
-        'PM2.5 (µg/m³)',
-        'SO2 (µg/m³)']
+        self.air_quality_bases=AIR_QUALITY_BASES
         self.PM25=pd.Series()
         self.PM10=pd.Series()
     
+    async def _fetch_json(self,endpoint,method,url,**kwargs):
+        """Fetch an upstream endpoint, reusing a response for the same grid cell and IST hour"""
+        key=(endpoint,)+snap_to_grid(self.lat,self.long)+(self.curr_time.isoformat(),)
+        data=response_cache.get(key)
+        if data is not None:
+            current_span().add('cache_hits')
+            return data
+        current_span().add('cache_misses')
+        data=await get_client().request_json(method,url,timeout=10,**kwargs)
+        if isinstance(data,dict) and 'error' not in data:
+            response_cache.set(key,data,hour_expiry(self.curr_time))
+        return data
+
     def _log_error(self, error_msg, error_obj=None):
         """Helper method to log errors and set critical_errors"""
         error_desc = str(error_obj) if error_obj else error_msg
         logger.error(f"{error_msg}: {error_desc}")
+        current_span().set('error',error_msg)
         self.critical_errors.append(error_msg)
     
-    def lag(self,feature,index,df,window):
-    
-        return df.loc[index-pd.Timedelta(hours=window-1),feature]
-
-    def mean(self,feature,index,df,window):
-        
-        return df[feature].rolling(window).mean().loc[index]
-
-
-    def std(self,feature,index,df,window):
-        
-        return df[feature].rolling(window).std().loc[index]
-
-
-    def sum(self,feature,index,df,window):
-        
-        return df[feature].rolling(window).sum().loc[index]
-
-
-    def base(self,feature,index,df):
-        return df.loc[index+pd.Timedelta(hours=1),feature]
-
-
-    def future(self,feature,index,df,window):
-        return df.loc[index+pd.Timedelta(hours=window),feature]
-
-
-    
+    @traced('builder.weather_feats')
     async def weather_feats(self):
         # Check for critical errors from previous steps
         if self.critical_errors:
             return
         
         output=0
-        weather_bases=['rain (mm)',
-        'relative_humidity_2m (%)',
-        'temperature_2m (°C)',
-        'wind_direction_100m (°)',
-        'wind_direction_10m (°)',
-        'wind_gusts_10m (km/h)',
-        'wind_speed_100m (km/h)',
-        'wind_speed_10m (km/h)',
-        'master',
-        'master_2',
-        'master_3',
-        'master_4',
-        'wind_direction_100m (°)_cos',
-        'wind_direction_100m (°)_sin',
-        'wind_direction_10m (°)_cos']
 
        
-        url=f'https://api.open-meteo.com/v1/forecast?latitude={self.lat}&longitude={self.long}&hourly=temperature_2m,wind_speed_10m,rain,wind_speed_80m,wind_speed_120m,wind_direction_10m,wind_direction_80m,wind_direction_120m,wind_gusts_10m,relative_humidity_2m&timezone=auto&past_days=2&forecast_days=3'
+        url=f'{OPEN_METEO_URL}/v1/forecast?latitude={self.lat}&longitude={self.long}&hourly={WEATHER_HOURLY}&timezone=auto&past_days=2&forecast_days=3'
         
         # API Call 1: Weather API
-        timeout=aiohttp.ClientTimeout(total=10)
-        
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, timeout=timeout) as response:
-                try:
-                    response.raise_for_status()
-                    data = await response.json()
-                except Exception as e:
-                    self._log_error("Weather API request failed", e)
-                    return
+        try:
+            data = await self._fetch_json('weather', 'GET', url)
+        except Exception as e:
+            self._log_error("Weather API request failed", e)
+            return
                  
         
         # Parse JSON response
@@ -147,41 +188,8 @@ class Builder():
         
          
         
-        df_weather=pd.DataFrame()
-
-
-        for feat in data['hourly']:
-            
-           df_weather[feat]=data['hourly'][feat]
-
-
-        df_weather.set_index('time',inplace=True)
-        df_weather.index=pd.to_datetime(df_weather.index)
         try:
-            df_weather['temperature_2m (°C)']=df_weather['temperature_2m']
-            df_weather['relative_humidity_2m (%)']=df_weather['relative_humidity_2m']
-
-            df_weather['rain (mm)']=df_weather['rain']
-            df_weather['wind_speed_10m (km/h)']=df_weather['wind_speed_10m']
-        
-        
-            df_weather['wind_direction_10m (°)_cos']=np.cos(np.pi*(df_weather['wind_direction_10m'])/180).round(3)
-            df_weather['wind_direction_10m (°)_sin']=np.sin(np.pi*(df_weather['wind_direction_10m'])/180).round(3)
-        
-
-            df_weather['wind_gusts_10m (km/h)']=df_weather['wind_gusts_10m']
-            df_weather['wind_speed_100m (km/h)']=(df_weather['wind_speed_80m']+df_weather['wind_speed_120m'])/2
-        
-        
-            df_weather['wind_direction_100m (°)_cos']=((np.cos(np.pi*(df_weather['wind_direction_80m'])/180)+np.cos(np.pi*(df_weather['wind_direction_120m'])/180))/2).round(3)
-            df_weather['wind_direction_100m (°)_sin']=((np.sin(np.pi*(df_weather['wind_direction_80m'])/180)+np.sin(np.pi*(df_weather['wind_direction_120m'])/180))/2).round(3)
-        
-        
-            df_weather.drop(columns=['temperature_2m','relative_humidity_2m','rain','wind_speed_10m','wind_direction_10m','wind_gusts_10m','wind_speed_80m','wind_speed_120m','wind_direction_80m','wind_direction_120m',],inplace=True)
-            df_weather['master']=(df_weather['temperature_2m (°C)']**-1)*(df_weather['relative_humidity_2m (%)']**1.4)*(df_weather['wind_speed_100m (km/h)']**2.5)*(df_weather['wind_gusts_10m (km/h)']**-1)
-            df_weather['master_2']=(df_weather['temperature_2m (°C)']**-1)*(df_weather['relative_humidity_2m (%)']**1.4)*(df_weather['wind_speed_100m (km/h)']**2.5)
-            df_weather['master_3']=(df_weather['temperature_2m (°C)']**-1)*(df_weather['relative_humidity_2m (%)']**1.4)
-            df_weather['master_4']=(df_weather['temperature_2m (°C)']**-1)
+            df_weather=weather_frame(data['hourly'])
         except Exception as e:
             self._log_error("Weather API: Error processing weather data", e)
             return
@@ -191,30 +199,11 @@ class Builder():
 
         
         
-        for features in feature_dic:
-            if features in weather_bases:
-                
-                for hist_window in feature_dic[features]:
-                    if hist_window=='base':
-                        self.final_model_dic[f'{features}']=self.base(features,self.curr_time,df_weather)
-                    elif hist_window=='t+':
-                        for t_window in feature_dic[features]['t+']:
-                            self.final_model_dic[f'{features}_(t+{t_window})']=self.future(features,self.curr_time,df_weather,t_window)
-                    elif hist_window=='mean':
-                        for mean_window in feature_dic[features]['mean']:
-                            self.final_model_dic[f'{features}_mean_{mean_window}']=self.mean(features,self.curr_time,df_weather,mean_window)
-                    elif hist_window=='std':
-                        for std_window in feature_dic[features]['std']:
-                            self.final_model_dic[f'{features}_std_{std_window}']=self.std(features,self.curr_time,df_weather,std_window)
-                    elif hist_window=='sum':
-                        for sum_window in feature_dic[features]['sum']:
-                            self.final_model_dic[f'{features}_sum_{sum_window}']=self.sum(features,self.curr_time,df_weather,sum_window)
-                    elif hist_window=='lag':
-                        for lag_window in feature_dic[features]['lag']:
-                            self.final_model_dic[f'{features}_lag_{lag_window}']=self.lag(features,self.curr_time,df_weather,lag_window) 
+        self.final_model_dic.update(WEATHER_PLAN.evaluate(df_weather,self.curr_time))
         return None
         
 
+    @traced('builder.air_quality_feats_curr')
     async def air_quality_feats_curr(self):
         # Check for critical errors from previous steps
         if self.critical_errors:
@@ -235,18 +224,14 @@ class Builder():
         ]
         }
 
-        url=f'https://airquality.googleapis.com/v1/currentConditions:lookup?key={API_KEY}'
+        url=f'{AIR_QUALITY_URL}/v1/currentConditions:lookup?key={API_KEY}'
         
         # API Call 2: Current Air Quality API
-        timeout=aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, timeout=timeout) as response:
-                try:
-                    response.raise_for_status()
-                    data = await response.json()
-                except Exception as e:
-                    self._log_error("Current Air Quality API request failed", e)
-                    return
+        try:
+            data = await self._fetch_json('aq_current', 'POST', url, json=payload)
+        except Exception as e:
+            self._log_error("Current Air Quality API request failed", e)
+            return
         
         # Parse JSON response
         
@@ -264,55 +249,31 @@ class Builder():
             
         
         
-        MOLAR_VOLUME = 24.45  # L/mol @25°C, 1 atm
-
-        # molecular weights
-        MW_NO2 = 46.005
-        MW_CO  = 28.010
-        MW_SO2 = 64.066
-        MW_O3  = 48.000
-        MW_NH3 = 17.031
-        MW_C6H6 = 78.114  # Benzene
-        MW_NO = 30.006
-
-
         try:
-            main_dic_curr={}
-            main_dic_curr['timestamp']=data['dateTime']
-            data_dic_curr={}
-            for j in data['pollutants']:
-                data_dic_curr[j['code']]=j['concentration']['value']
-            main_dic_curr['PM2.5 (µg/m³)']=data_dic_curr.get('pm25',np.nan)
-            main_dic_curr['PM10 (µg/m³)']=data_dic_curr.get('pm10',np.nan)
-
-            if pd.isna(main_dic_curr['PM2.5 (µg/m³)']) or pd.isna(main_dic_curr['PM10 (µg/m³)']):
+            df_curr=current_frame(data)
+            if df_curr[['PM2.5 (µg/m³)','PM10 (µg/m³)']].isna().values.any():
                 self._log_error("Current Air Quality API: Missing critical PM2.5 or PM10 data")
                 return
-            
-            main_dic_curr['NOx (ppb)']=data_dic_curr.get('nox',np.nan)
-            main_dic_curr['NO2 (µg/m³)']=data_dic_curr.get('no2',np.nan)*MW_NO2/MOLAR_VOLUME 
-            main_dic_curr['CO (mg/m³)']=data_dic_curr.get('co',np.nan)*MW_CO/(MOLAR_VOLUME*1000)
-            main_dic_curr['SO2 (µg/m³)']=data_dic_curr.get('so2',np.nan)*MW_SO2/MOLAR_VOLUME
-            main_dic_curr['Ozone (µg/m³)']=data_dic_curr.get('o3',np.nan)*MW_O3/MOLAR_VOLUME
-            main_dic_curr['NH3 (µg/m³)']=data_dic_curr.get('nh3',np.nan) *MW_NH3/MOLAR_VOLUME
-            main_dic_curr['Benzene (µg/m³)']=data_dic_curr.get('c6h6',np.nan)
-            main_dic_curr['NO (µg/m³)']=data_dic_curr.get('no',np.nan) *MW_NO/MOLAR_VOLUME
-
-            df_curr=pd.DataFrame(main_dic_curr,index=[0])
             self.aq_curr=df_curr
         except Exception as e:
             self._log_error("Current Air Quality API: Error processing data", e)
             return
 
+        if self.on_current is not None:
+            try:
+                self.on_current(self.aq_curr)
+            except Exception as e:
+                logger.error(f"on_current callback failed: {e}")
 
-    async def air_quality_feats_past(self):
-        # Check for critical errors from previous steps
-        if self.critical_errors:
-            return
-        API_KEY=GOOGLE_API
+
+    async def _fetch_history_period(self,url,start,end):
+        """Every history hour in [start, end] (UTC), following nextPageToken across pages"""
         payload={
-            "hours":167,
-            "pageSize":167,
+            "period": {
+                "startTime": start.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                "endTime": (end+pd.Timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            },
+            "pageSize":168,
             "location": {
                 "latitude": self.lat,
                 "longitude": self.long
@@ -323,67 +284,64 @@ class Builder():
             
             ]
             }
+        hours_info=[]
+        while True:
+            data = await get_client().request_json('POST', url, json=payload, timeout=10)
+            if 'error' in data:
+                raise HistoryAPIError(data['error'].get('message', 'Unknown API error'))
+            hours_info.extend(data.get('hoursInfo',[]))
+            token=data.get('nextPageToken')
+            if not token:
+                return hours_info
+            payload=dict(payload,pageToken=token)
+
+    @traced('builder.air_quality_feats_past')
+    async def air_quality_feats_past(self):
+        # Check for critical errors from previous steps
+        if self.critical_errors:
+            return
+        API_KEY=GOOGLE_API
+        url=f'{AIR_QUALITY_URL}/v1/history:lookup?key={API_KEY}'
 
+        # The 167 complete UTC hours before the current one
+        end=pd.Timestamp.now(tz='UTC').floor('h').tz_localize(None)-pd.Timedelta(hours=1)
+        start=end-pd.Timedelta(hours=HISTORY_HOURS-1)
+        expected=pd.date_range(start,end,freq='h')
+        key=snap_to_grid(self.lat,self.long)
 
-        url=f'https://airquality.googleapis.com/v1/history:lookup?key={API_KEY}'
-        
-        # API Call 3: Historical Air Quality API
-        timeout=aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json=payload, timeout=timeout) as response:
-                try:
-                    response.raise_for_status()
-                    data = await response.json()
-                except Exception as e:
-                    self._log_error("Historical Air Quality API request failed", e)
-                    return
-        
-        # Parse JSON response
-        
-        
-        # Validate response structure
         try:
-            if 'error' in data:
-                error_msg = data['error'].get('message', 'Unknown API error')
-                self._log_error(f"Historical Air Quality API error: {error_msg}")
-                return
+            stored=history_store.read(key,start,end,HISTORY_COLUMNS)
         except Exception as e:
-            self._log_error("Historical Air Quality API: Error validating response", e)
-            return
-
-        MOLAR_VOLUME = 24.45  # L/mol @25°C, 1 atm
+            logger.error(f"History store read failed: {e}")
+            stored=pd.DataFrame(columns=HISTORY_COLUMNS,index=pd.DatetimeIndex([]),dtype=float)
+
+        # API Call 3: Historical Air Quality API, only for the hours the local store lacks
+        ranges=missing_ranges(expected,stored.index)
+        current_span().set('stored_hours',int(expected.isin(stored.index).sum())).set('fetched_ranges',len(ranges))
+        for range_start,range_end in ranges:
+            try:
+                hours_info = await self._fetch_history_period(url,range_start,range_end)
+            except HistoryAPIError as e:
+                self._log_error(f"Historical Air Quality API error: {e}")
+                return
+            except Exception as e:
+                self._log_error("Historical Air Quality API request failed", e)
+                return
 
-        # molecular weights
-        MW_NO2 = 46.005
-        MW_CO  = 28.010
-        MW_SO2 = 64.066
-        MW_O3  = 48.000
-        MW_NH3 = 17.031
-        MW_C6H6 = 78.114   # Benzene
-        MW_NO = 30.006
+            try:
+                # Only hours the API returned are stored; skipped ones stay missing and are asked for again next time.
+                # The API lists hours newest first, so sort before selecting the window
+                fetched=history_frame(hours_info).sort_index()
+                fetched=fetched[(fetched.index>=start)&(fetched.index<=end)]
+                stored=pd.concat([stored,fetched])
+                history_store.write(key,fetched)
+            except Exception as e:
+                self._log_error("Historical Air Quality API: Error processing historical data", e)
+                return
 
         try:
-            data_dic={}
-            main_dic={}
-            for counter,i in enumerate(data['hoursInfo']):
-                main_dic[counter]={}
-                main_dic[counter]['timestamp']=i['dateTime']
-                for j in i['pollutants']:
-                    data_dic[j['code']]=j['concentration']['value']
-                main_dic[counter]['PM2.5 (µg/m³)']=data_dic.get('pm25',np.nan)
-                main_dic[counter]['PM10 (µg/m³)']=data_dic.get('pm10',np.nan)
-                main_dic[counter]['NOx (ppb)']=data_dic.get('nox',np.nan)
-                main_dic[counter]['NO2 (µg/m³)']=data_dic.get('no2',np.nan)*MW_NO2/MOLAR_VOLUME 
-                main_dic[counter]['CO (mg/m³)']=data_dic.get('co',np.nan)*MW_CO/(MOLAR_VOLUME*1000)
-                main_dic[counter]['SO2 (µg/m³)']=data_dic.get('so2',np.nan)*MW_SO2/MOLAR_VOLUME
-                main_dic[counter]['Ozone (µg/m³)']=data_dic.get('o3',np.nan)*MW_O3/MOLAR_VOLUME
-                main_dic[counter]['NH3 (µg/m³)']=data_dic.get('nh3',np.nan) *MW_NH3/MOLAR_VOLUME
-                main_dic[counter]['Benzene (µg/m³)']=data_dic.get('c6h6',np.nan)
-                main_dic[counter]['NO (µg/m³)']=data_dic.get('no',np.nan) *MW_NO/MOLAR_VOLUME
-
-            df_past=pd.DataFrame(main_dic)
-            df_past=df_past.T
-            self.aq_past=df_past
+            # Hours still unavailable are NaN rows, so the frame covers every expected hour
+            self.aq_past=stored[~stored.index.duplicated(keep='last')].reindex(expected)
         except Exception as e:
             self._log_error("Historical Air Quality API: Error processing historical data", e)
             return
@@ -391,6 +349,7 @@ class Builder():
 
             
 
+    @traced('builder.extract_features')
     def extract_features(self):
         if self.critical_errors:
             return
@@ -442,7 +401,9 @@ class Builder():
             self.final_model_dic[f'rush_hour_(t+{i})']=df.loc[i,'rush_hour']
 
         
+    @traced('builder.merge')
     async def merge(self):
+        current_span().set('lat',self.lat).set('lon',self.long)
         # Check for critical errors before starting
         if self.critical_errors:
             return
@@ -464,11 +425,8 @@ class Builder():
             return
         
         try:
-            df_final=pd.concat([self.aq_curr,self.aq_past],ignore_index=True)
-            df_final=df_final.iloc[-1::-1]
-            df_final.set_index('timestamp',inplace=True)
-            df_final.index=pd.to_datetime(df_final.index)
-            df_final.index=df_final.index.tz_localize(None)
+            # Both frames are indexed by naive UTC hour: past hours oldest first, then the current one
+            df_final=pd.concat([self.aq_past,self.aq_curr])
             index_here=df_final.index[-1]
         except Exception as e:
             self._log_error("Error merging dataframes", e)
@@ -497,26 +455,10 @@ class Builder():
             return
             
         try:
-            for features in feature_dic:
-                if features in self.air_quality_bases:
-                    
-                    for hist_window in feature_dic[features]:
-                        if hist_window=='base':
-                            self.final_model_dic[f'{features}']=self.base(features,index_here,df_final)
-                        elif hist_window=='mean':
-                            for mean_window in feature_dic[features]['mean']:
-                                self.final_model_dic[f'{features}_mean_{mean_window}']=self.mean(features,index_here,df_final,mean_window)
-                        elif hist_window=='std':
-                            for std_window in feature_dic[features]['std']:
-                                self.final_model_dic[f'{features}_std_{std_window}']=self.std(features,index_here,df_final,std_window)
-                        elif hist_window=='sum':
-                            for sum_window in feature_dic[features]['sum']:
-                                self.final_model_dic[f'{features}_sum_{sum_window}']=self.sum(features,index_here,df_final,sum_window)
-                        elif hist_window=='lag':
-                            for lag_window in feature_dic[features]['lag']:
-                                self.final_model_dic[f'{features}_lag_{lag_window}']=self.lag(features,index_here,df_final,lag_window)
-            self.final_model_dic[f'Average_pm25_24']=df_final['PM2.5 (µg/m³)'].rolling(window=24).mean().loc[index_here]
-            self.final_model_dic[f'Average_pm10_24']=df_final['PM10 (µg/m³)'].rolling(window=24).mean().loc[index_here]
+            self.final_model_dic.update(feature_states.features(snap_to_grid(self.lat,self.long),df_final,index_here))
+            # Over the hours with data, so an hour the API skipped does not blank the average
+            self.final_model_dic[f'Average_pm25_24']=df_final['PM2.5 (µg/m³)'].rolling(window=24,min_periods=min_periods(24)).mean().loc[index_here]
+            self.final_model_dic[f'Average_pm10_24']=df_final['PM10 (µg/m³)'].rolling(window=24,min_periods=min_periods(24)).mean().loc[index_here]
             
             self.PM25=df_final['PM2.5 (µg/m³)']
             self.PM10=df_final['PM10 (µg/m³)']
@@ -533,7 +475,7 @@ class Builder():
 if __name__ == "__main__":
     time_start=time.time()
     new_builder=Builder(28.6139,77.2090)
-    asyncio.run(new_builder.merge())
+    get_client().run(new_builder.merge())
     print(new_builder.final_model_dic)
     time_end=time.time()
     print(f"Time taken: {time_end-time_start} seconds")
@@ -0,0 +1,113 @@
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache():
+    """Thread-safe LRU cache whose entries expire at an absolute wall-clock time.
+
+    Entries live in memory, bounded by `maxsize`. When `path` is given they are
+    also written to a SQLite file, so the cache survives process restarts;
+    a memory miss falls through to disk before counting as a miss.
+    """
+    def __init__(self,maxsize=1024,path=None,disk_maxsize=None):
+        self.maxsize=maxsize
+        self.path=path
+        self.disk_maxsize=disk_maxsize or maxsize*10
+        self._data=OrderedDict()
+        self._lock=threading.Lock()
+        self._writes=0
+        self._stats={'hits': 0,'disk_hits': 0,'misses': 0,'expired': 0,'evictions': 0}
+        self._db=None
+        if path:
+            self._db=sqlite3.connect(path,check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL, accessed REAL)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)')
+            self._db.commit()
+
+    def _disk_get(self,key,now):
+        row=self._db.execute('SELECT value, expires_at FROM cache WHERE key=?',(repr(key),)).fetchone()
+        if row is None:
+            return None
+        if row[1]<=now:
+            self._db.execute('DELETE FROM cache WHERE key=?',(repr(key),))
+            self._db.commit()
+            return None
+        self._db.execute('UPDATE cache SET accessed=? WHERE key=?',(now,repr(key)))
+        self._db.commit()
+        return pickle.loads(row[0]),row[1]
+
+    def _disk_set(self,key,value,expires_at,now):
+        self._db.execute('INSERT OR REPLACE INTO cache VALUES (?,?,?,?)',(repr(key),pickle.dumps(value),expires_at,now))
+        self._writes+=1
+        # Prune expired rows and trim to disk_maxsize every so often rather than on every write
+        if self._writes%100==0:
+            self._db.execute('DELETE FROM cache WHERE expires_at<=?',(now,))
+            self._db.execute('DELETE FROM cache WHERE key NOT IN (SELECT key FROM cache ORDER BY accessed DESC LIMIT ?)',(self.disk_maxsize,))
+        self._db.commit()
+
+    def _store(self,key,value,expires_at):
+        self._data[key]=(value,expires_at)
+        self._data.move_to_end(key)
+        while len(self._data)>self.maxsize:
+            self._data.popitem(last=False)
+            self._stats['evictions']+=1
+
+    def get(self,key,default=None):
+        now=time.time()
+        with self._lock:
+            entry=self._data.get(key)
+            if entry is not None:
+                if entry[1]>now:
+                    self._data.move_to_end(key)
+                    self._stats['hits']+=1
+                    return entry[0]
+                del self._data[key]
+                self._stats['expired']+=1
+            if self._db is not None:
+                try:
+                    found=self._disk_get(key,now)
+                except Exception as e:
+                    logger.error(f"Cache read failed for {key}: {e}")
+                    found=None
+                if found is not None:
+                    self._store(key,*found)
+                    self._stats['disk_hits']+=1
+                    return found[0]
+            self._stats['misses']+=1
+            return default
+
+    def set(self,key,value,expires_at):
+        now=time.time()
+        if expires_at<=now:
+            return
+        with self._lock:
+            self._store(key,value,expires_at)
+            if self._db is not None:
+                try:
+                    self._disk_set(key,value,expires_at,now)
+                except Exception as e:
+                    logger.error(f"Cache write failed for {key}: {e}")
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            if self._db is not None:
+                self._db.execute('DELETE FROM cache')
+                self._db.commit()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            stats=dict(self._stats)
+            stats['size']=len(self._data)
+        lookups=stats['hits']+stats['disk_hits']+stats['misses']
+        stats['hit_rate']=(stats['hits']+stats['disk_hits'])/lookups if lookups else 0.0
+        return stats
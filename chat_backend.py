@@ -0,0 +1,257 @@
+"""
+Async backend for the chatbot's Responses API calls.
+
+Requests run on the shared HTTP client's event loop (see http_client), so the
+Streamlit script thread only waits on a queue of stream events. One
+AsyncOpenAI client over a pooled httpx connection pool serves every session.
+
+Every answer has a deadline. Until the first token arrives an attempt may be
+retried: connection errors, timeouts, 429s and 5xx are retried with
+full-jitter exponential backoff while the deadline allows. With hedging on,
+a second attempt is fired when the first has not produced a token within the
+recent p95 time to first token; whichever answers first is streamed and the
+other is cancelled. Every SUMMARY_EVERY requests the p50/p95/p99 time to
+first token and total time, with the retry and hedge counters, are exported
+as a 'chat_backend.latency' span (see tracing).
+
+Configured from the [chat] secrets section:
+
+    base_url        = ""     # e.g. "http://127.0.0.1:8765/v1" for chat_stub_server.py; empty uses OpenAI
+    deadline        = 30     # seconds for a whole answer
+    max_retries     = 2
+    hedge           = false
+    max_connections = 20
+"""
+import time
+import queue
+import random
+import asyncio
+import logging
+import threading
+from collections import deque
+import numpy as np
+import httpx
+import openai
+from openai import AsyncOpenAI
+import streamlit as st
+from http_client import get_client
+from tracing import emit, current_span
+
+logger = logging.getLogger(__name__)
+
+chat_config=st.secrets.get("chat",{})
+CHAT_BASE_URL=chat_config.get("base_url") or None
+CHAT_DEADLINE=float(chat_config.get("deadline",30))
+CHAT_MAX_RETRIES=int(chat_config.get("max_retries",2))
+CHAT_HEDGE=bool(chat_config.get("hedge",False))
+CHAT_MAX_CONNECTIONS=int(chat_config.get("max_connections",20))
+CONNECT_TIMEOUT=5   # seconds
+BACKOFF_BASE=0.25   # seconds; attempt n sleeps uniform(0, min(BACKOFF_CAP, BACKOFF_BASE*2**n))
+BACKOFF_CAP=4
+HEDGE_MIN_SAMPLES=20   # time-to-first-token samples needed before hedging starts
+LATENCY_WINDOW=500     # recent requests kept for percentiles
+SUMMARY_EVERY=100   # requests between exported latency summaries
+
+RETRYABLE=(openai.APIConnectionError,openai.RateLimitError,openai.InternalServerError)
+TEXT_DELTA='response.output_text.delta'
+# An attempt has answered once it yields one of these
+FIRST_EVENTS=(TEXT_DELTA,'response.completed','response.failed','response.incomplete','error')
+
+
+class ChatBackend():
+    """Streams Responses API events with a deadline, retries and optional hedging"""
+    def __init__(self,api_key,base_url=CHAT_BASE_URL,deadline=CHAT_DEADLINE,max_retries=CHAT_MAX_RETRIES,hedge=CHAT_HEDGE,max_connections=CHAT_MAX_CONNECTIONS,hedge_min_samples=HEDGE_MIN_SAMPLES):
+        self.api_key=api_key
+        self.base_url=base_url
+        self.deadline=deadline
+        self.max_retries=max_retries
+        self.hedge=hedge
+        self.max_connections=max_connections
+        self.hedge_min_samples=hedge_min_samples
+        self._client=None
+        self._ttft=deque(maxlen=LATENCY_WINDOW)
+        self._total=deque(maxlen=LATENCY_WINDOW)
+        self._stats={'requests': 0,'attempts': 0,'retries': 0,'hedges': 0,'hedge_wins': 0,'timeouts': 0,'errors': 0}
+        self._lock=threading.Lock()
+
+    def _openai(self):
+        # Only called on the client loop: the httpx pool belongs to the loop that uses it
+        if self._client is None:
+            http=httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.max_connections,max_keepalive_connections=self.max_connections),
+                timeout=httpx.Timeout(self.deadline,connect=CONNECT_TIMEOUT),
+            )
+            # Retries are ours, bounded by the deadline
+            self._client=AsyncOpenAI(api_key=self.api_key,base_url=self.base_url,http_client=http,max_retries=0)
+        return self._client
+
+    def _count(self,key,amount=1):
+        with self._lock:
+            self._stats[key]+=amount
+
+    def hedge_threshold(self):
+        """Seconds to wait for a first token before hedging, or None when hedging is off or unwarmed"""
+        if not self.hedge:
+            return None
+        with self._lock:
+            samples=list(self._ttft)
+        if not samples or len(samples)<self.hedge_min_samples:
+            return None
+        return float(np.percentile(samples,95))
+
+    async def _attempt(self,request):
+        """Open a stream and read up to its first token. Returns (stream, events read so far)"""
+        self._count('attempts')
+        start=time.monotonic()
+        stream=await self._openai().responses.create(**request,stream=True)
+        events=[]
+        try:
+            while True:
+                event=await stream.__anext__()
+                events.append(event)
+                if event.type in FIRST_EVENTS:
+                    break
+        except StopAsyncIteration:
+            pass
+        except BaseException:
+            # Includes cancellation when the other hedged attempt won
+            await stream.close()
+            raise
+        if events and events[-1].type==TEXT_DELTA:
+            # Per attempt, so retries and backoff don't inflate the hedge threshold
+            with self._lock:
+                self._ttft.append(time.monotonic()-start)
+        return stream,events
+
+    async def _first(self,request):
+        """Returns (stream, events, hedge_won) from the first attempt to answer"""
+        first=asyncio.ensure_future(self._attempt(request))
+        tasks=[first]
+        try:
+            threshold=self.hedge_threshold()
+            if threshold is not None:
+                await asyncio.wait(tasks,timeout=threshold)
+            if threshold is None or first.done():
+                stream,events=await first
+                return stream,events,False
+
+            self._count('hedges')
+            current_span().set('hedged',True)
+            tasks.append(asyncio.ensure_future(self._attempt(request)))
+            pending=set(tasks)
+            error=None
+            while pending:
+                done,pending=await asyncio.wait(pending,return_when=asyncio.FIRST_COMPLETED)
+                winner=None
+                for task in done:
+                    if task.exception() is not None:
+                        error=task.exception()
+                    elif winner is None:
+                        winner=task
+                    else:
+                        # Both answered at once; keep one
+                        await task.result()[0].close()
+                if winner is not None:
+                    hedge_won=winner is not first
+                    if hedge_won:
+                        self._count('hedge_wins')
+                    return winner.result()+(hedge_won,)
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _open(self,request,deadline):
+        for retry in range(self.max_retries+1):
+            try:
+                return await asyncio.wait_for(self._first(request),deadline-time.monotonic())
+            except RETRYABLE as e:
+                delay=random.uniform(0,min(BACKOFF_CAP,BACKOFF_BASE*2**retry))
+                if retry==self.max_retries or time.monotonic()+delay>=deadline:
+                    raise
+                self._count('retries')
+                current_span().add('retries')
+                logger.warning(f"Chat request failed ({type(e).__name__}: {e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    async def _stream_events(self,request,out):
+        start=time.monotonic()
+        deadline=start+self.deadline
+        stream,events,hedge_won=await self._open(request,deadline)
+        current_span().set('hedge_won',hedge_won)
+        try:
+            for event in events:
+                out.put(('event',event))
+            while True:
+                try:
+                    event=await stream.__anext__()
+                except StopAsyncIteration:
+                    break
+                out.put(('event',event))
+        finally:
+            await stream.close()
+        with self._lock:
+            self._total.append(time.monotonic()-start)
+
+    async def _pump(self,request,out):
+        self._count('requests')
+        try:
+            await asyncio.wait_for(self._stream_events(request,out),self.deadline)
+            out.put(('done',None))
+        except asyncio.TimeoutError:
+            self._count('timeouts')
+            out.put(('error',TimeoutError(f"No complete answer within {self.deadline:.0f}s")))
+        except Exception as e:
+            self._count('errors')
+            out.put(('error',e))
+        if self._stats['requests']%SUMMARY_EVERY==0:
+            emit('chat_backend.latency',**self.latency_summary())
+
+    def events(self,request):
+        """Submit request (keyword arguments of responses.create) and return a generator of its stream events.
+
+        The request starts on the shared client loop right away, in the
+        caller's context, so it is traced under the span active at the call.
+        The generator raises the final error, or TimeoutError once the
+        deadline passes. Closing it cancels the request.
+        """
+        out=queue.Queue()
+        deadline=time.monotonic()+self.deadline
+        future=get_client().submit(self._pump(request,out))
+        return self._drain(out,future,deadline)
+
+    def _drain(self,out,future,deadline):
+        try:
+            while True:
+                try:
+                    # A little slack over the deadline so the loop side reports its own timeout
+                    kind,value=out.get(timeout=max(0.0,deadline-time.monotonic())+1)
+                except queue.Empty:
+                    raise TimeoutError(f"No complete answer within {self.deadline:.0f}s")
+                if kind=='event':
+                    yield value
+                elif kind=='error':
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+    def latency_summary(self):
+        """p50/p95/p99 time to first token and total time (ms) over recent requests, plus counters"""
+        with self._lock:
+            stats=dict(self._stats)
+            samples={'ttft': list(self._ttft),'total': list(self._total)}
+        for name,values in samples.items():
+            if values:
+                for q in (50,95,99):
+                    stats[f'{name}_p{q}_ms']=float(np.percentile(values,q))*1000
+        return stats
+
+
+backend=ChatBackend(st.secrets["open_ai"]["api_key"])
+
+
+def get_backend():
+    return backend
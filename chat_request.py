@@ -0,0 +1,117 @@
+"""
+Request layout for the chatbot's Responses API calls.
+
+    [developer: SYSTEM_PROMPT] [assistant: CONTEXT_PROMPT]   static prefix, identical bytes on every call
+    [assistant: runtime payload]                             compact canonical JSON, changes once an hour
+    [conversation history ...]                               trimmed to a token budget, oldest turns first
+    [user: message]
+
+OpenAI caches the longest previously seen prompt prefix (in 128-token steps
+past the first 1024), so everything that rarely changes goes first: the two
+static prompts are shared by every request, and the payload sits before the
+history so a follow-up question in the same hour reuses the whole earlier
+turn as well.
+
+Configured from the [chat] secrets section:
+
+    history_tokens = 1500   # budget for conversation history in the request
+"""
+import json
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import streamlit as st
+from prompts import SYSTEM_PROMPT, CONTEXT_PROMPT
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+chat_config=st.secrets.get("chat",{})
+HISTORY_TOKEN_BUDGET=int(chat_config.get("history_tokens",1500))
+TOKEN_ENCODING='o200k_base'   # gpt-4o / gpt-4o-mini
+CHARS_PER_TOKEN=4   # estimate used when tiktoken is not installed
+
+# Built once so the prefix is the same objects, and the same bytes, on every call
+STATIC_INPUT=(
+    {"role": "developer","content": SYSTEM_PROMPT},
+    {"role": "assistant","content": CONTEXT_PROMPT},
+)
+
+
+def _load_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception as e:
+        # The BPE file is downloaded on first use; fall back to the estimate offline
+        logger.warning(f"tiktoken encoding {TOKEN_ENCODING} unavailable, estimating tokens: {e}")
+        return None
+
+
+encoding=_load_encoding()
+
+
+def count_tokens(text):
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return -(-len(text)//CHARS_PER_TOKEN)
+
+
+def _json_default(value):
+    if isinstance(value,(pd.Timestamp,datetime)):
+        return value.isoformat()
+    if isinstance(value,np.generic):
+        return value.item()
+    raise TypeError(f"Cannot serialize {type(value).__name__} in runtime payload")
+
+
+def payload_json(payload):
+    """Compact canonical JSON: sorted keys, no whitespace, so equal payloads are equal bytes"""
+    return json.dumps(payload,sort_keys=True,separators=(',',':'),ensure_ascii=False,default=_json_default)
+
+
+def trim_history(history,budget=HISTORY_TOKEN_BUDGET):
+    """Most recent messages whose content fits in budget tokens, in their original order.
+
+    Messages are dropped from the oldest end; an assistant reply left without
+    its question is dropped too, so history always starts with a user turn.
+    """
+    kept=[]
+    used=0
+    for msg in reversed(history):
+        tokens=count_tokens(msg["content"])
+        if used+tokens>budget:
+            break
+        kept.append(msg)
+        used+=tokens
+    kept.reverse()
+    while kept and kept[0]["role"]!="user":
+        kept.pop(0)
+    return kept
+
+
+def build_request(message,payload,history=None):
+    """Returns (input_array, prompt_tokens) with prompt_tokens counted locally"""
+    runtime_prompt=f"<Runtime payload>{payload_json(payload)}</Runtime payload>"
+    input_array=list(STATIC_INPUT)
+    input_array.append({"role": "assistant","content": runtime_prompt})
+    input_array.extend({"role": msg["role"],"content": msg["content"]} for msg in trim_history(history or []))
+    input_array.append({"role": "user","content": message})
+    prompt_tokens=sum(count_tokens(item["content"]) for item in input_array)
+    return input_array,prompt_tokens
+
+
+def record_usage(s,usage):
+    """Copy the API-reported token usage, including prompt-cache hits, onto span s"""
+    if usage is None:
+        return
+    details=getattr(usage,'input_tokens_details',None)
+    cached=getattr(details,'cached_tokens',0) or 0
+    s.set('input_tokens',usage.input_tokens).set('output_tokens',usage.output_tokens).set('cached_tokens',cached)
+    logger.info(f"Chat request: {usage.input_tokens} input tokens ({cached} cached), {usage.output_tokens} output tokens")
@@ -0,0 +1,158 @@
+"""
+Local stand-in for the OpenAI Responses API, for exercising the chat backend
+without network access or quota.
+
+Answers POST /v1/responses, streamed (server-sent events) or not, with a
+canned reply. Latency, a slow tail and failures are configurable, so the
+deadline, retry and hedging paths can be driven on purpose. Tests pass a
+`script` of per-request outcomes ('ok', 'slow', 'error', 'slow_error') and run the server
+in a background thread with start()/stop().
+
+    python chat_stub_server.py --port 8765 --ttft 0.3 --slow-rate 0.1 --slow-ttft 3 --error-rate 0.05
+
+and point the app at it in the Streamlit secrets:
+
+    [chat]
+    base_url = "http://127.0.0.1:8765/v1"
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import threading
+from aiohttp import web
+
+REPLY=("The best window in the next 8 hours is 2 PM to 5 PM, with an average AQI (Live) of 182 (Moderate). "
+       "This is a stub reply from chat_stub_server.py.")
+
+
+class ChatStubServer():
+    def __init__(self,ttft=0.2,token_delay=0.01,slow_rate=0.0,slow_ttft=3.0,error_rate=0.0,seed=None,script=None):
+        self.ttft=ttft
+        self.token_delay=token_delay
+        self.slow_rate=slow_rate
+        self.slow_ttft=slow_ttft
+        self.error_rate=error_rate
+        self.rng=random.Random(seed)
+        self.script=list(script or [])
+        self.requests=0
+        self.completed=0
+        self.disconnected=0   # streams the client closed before the reply finished
+        self.loop=None
+        self.runner=None
+        self.url=None
+
+    def _outcome(self):
+        if self.script:
+            return self.script.pop(0)
+        if self.rng.random()<self.error_rate:
+            return 'error'
+        return 'slow' if self.rng.random()<self.slow_rate else 'ok'
+
+    def _response(self,body,status,text=None):
+        output=[]
+        if text is not None:
+            output=[{
+                'id': f'msg_{uuid.uuid4().hex}','type': 'message','role': 'assistant','status': 'completed',
+                'content': [{'type': 'output_text','text': text,'annotations': []}],
+            }]
+        prompt=json.dumps(body.get('input',''))
+        return {
+            'id': f'resp_{uuid.uuid4().hex}','object': 'response','created_at': int(time.time()),
+            'status': status,'model': body.get('model','stub'),'output': output,
+            'usage': {
+                'input_tokens': len(prompt)//4,'input_tokens_details': {'cached_tokens': 0},
+                'output_tokens': len(text or '')//4,'output_tokens_details': {'reasoning_tokens': 0},
+                'total_tokens': (len(prompt)+len(text or ''))//4,
+            },
+        }
+
+    async def responses(self,request):
+        self.requests+=1
+        body=await request.json()
+        outcome=self._outcome()
+        if outcome=='slow_error':
+            await asyncio.sleep(self.slow_ttft)
+        if outcome in ('error','slow_error'):
+            return web.json_response({'error': {'message': 'Stub server error','type': 'server_error'}},status=500)
+        ttft=self.slow_ttft if outcome=='slow' else self.ttft
+        if not body.get('stream'):
+            await asyncio.sleep(ttft)
+            self.completed+=1
+            return web.json_response(self._response(body,'completed',REPLY))
+
+        response=web.StreamResponse(headers={'Content-Type': 'text/event-stream','Cache-Control': 'no-cache'})
+        await response.prepare(request)
+        sequence=0
+
+        async def send(event):
+            nonlocal sequence
+            event['sequence_number']=sequence
+            sequence+=1
+            await response.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode())
+
+        try:
+            # Headers and response.created go out at once, as with the real API; the wait is before the first token
+            await send({'type': 'response.created','response': self._response(body,'in_progress')})
+            await asyncio.sleep(ttft)
+            item_id=f'msg_{uuid.uuid4().hex}'
+            for i,word in enumerate(REPLY.split(' ')):
+                await send({'type': 'response.output_text.delta','item_id': item_id,'output_index': 0,'content_index': 0,'delta': word if i==0 else ' '+word})
+                await asyncio.sleep(self.token_delay)
+            await send({'type': 'response.completed','response': self._response(body,'completed',REPLY)})
+            await response.write_eof()
+        except (ConnectionError,asyncio.CancelledError):
+            self.disconnected+=1
+            raise
+        self.completed+=1
+        return response
+
+    def app(self):
+        app=web.Application()
+        app.router.add_post('/v1/responses',self.responses)
+        return app
+
+    def _serve(self,ready,host,port):
+        asyncio.set_event_loop(self.loop)
+        self.runner=web.AppRunner(self.app(),access_log=None)
+        self.loop.run_until_complete(self.runner.setup())
+        site=web.TCPSite(self.runner,host,port)
+        self.loop.run_until_complete(site.start())
+        host,port=self.runner.addresses[0][:2]
+        self.url=f'http://{host}:{port}'
+        ready.set()
+        self.loop.run_forever()
+
+    def start(self,host='127.0.0.1',port=0):
+        """Serve from a background thread (port 0 picks a free one); returns the base URL"""
+        self.loop=asyncio.new_event_loop()
+        ready=threading.Event()
+        threading.Thread(target=self._serve,args=(ready,host,port),daemon=True,name='chat-stub-server').start()
+        ready.wait()
+        return self.url
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(),self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def main(argv=None):
+    parser=argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host',default='127.0.0.1')
+    parser.add_argument('--port',type=int,default=8765)
+    parser.add_argument('--ttft',type=float,default=0.2,help='seconds before the first token')
+    parser.add_argument('--token-delay',type=float,default=0.01,help='seconds between streamed words')
+    parser.add_argument('--slow-rate',type=float,default=0.0,help='fraction of requests that wait --slow-ttft instead')
+    parser.add_argument('--slow-ttft',type=float,default=3.0)
+    parser.add_argument('--error-rate',type=float,default=0.0,help='fraction of requests answered with HTTP 500')
+    parser.add_argument('--seed',type=int,default=None)
+    args=parser.parse_args(argv)
+
+    server=ChatStubServer(args.ttft,args.token_delay,args.slow_rate,args.slow_ttft,args.error_rate,args.seed)
+    web.run_app(server.app(),host=args.host,port=args.port,access_log=None)
+
+
+if __name__ == '__main__':
+    main()
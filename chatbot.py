@@ -1,100 +1,122 @@
 
-from openai import OpenAI
 import numpy as np
 from datetime import datetime
 import pandas as pd
-from prompts import SYSTEM_PROMPT, CONTEXT_PROMPT
+from chat_request import build_request, record_usage
+from chat_backend import get_backend
 from dotenv import load_dotenv
 import os
+import re
+import time
 import streamlit as st
+from tracing import traced, span, use_span, current_span
+from aqi import aqi_category
 
 
 GOOGLE_API = st.secrets["google"]["api_key"]
 OPEN_AI_API = st.secrets["open_ai"]["api_key"]
 
-client=OpenAI(api_key=OPEN_AI_API)
-
-def get_response(message, aqi_live_dic, location, conversation_history=None):
+# Sent with every Responses API request
+RESPONSE_OPTIONS = {"model": "gpt-4o-mini", "temperature": 0.3, "max_output_tokens": 400}
+
+def build_input(message, chat_context, location, conversation_history=None):
+    """Validate the inputs and build the Responses API input array. Returns (input_array, prompt_tokens, error)"""
+    # Validate inputs
+    if not message or not isinstance(message, str):
+        return None, 0, "Invalid message input"
+    if not chat_context or not isinstance(chat_context, dict) or "payload" not in chat_context:
+        return None, 0, "Invalid AQI data"
+    if not location or not isinstance(location, str):
+        return None, 0, "Invalid location"
+    
+    if conversation_history:
+        if not isinstance(conversation_history, list):
+            return None, 0, "Conversation history must be a list"
+        for msg in conversation_history:
+            if not isinstance(msg, dict) or "role" not in msg or "content" not in msg:
+                return None, 0, "Invalid conversation history format"
+    
+    # The payload is shared by every session in the cell; only the address is per session
+    payload=dict(chat_context["payload"], location=location)
+    # Static prompts first, then the payload, then history trimmed to the token budget (see chat_request)
+    input_array, prompt_tokens = build_request(message, payload, conversation_history)
+    return input_array, prompt_tokens, None
+
+class ChatbotStreamError(Exception):
+    """The Responses API stream reported an error or ended without output"""
+
+
+def _stream_deltas(input_array, prompt_tokens):
+    """Submit the request and return a generator of its text deltas"""
+    s = span('chatbot.stream', prompt_tokens=prompt_tokens)
+    # Active only while the request is submitted (the backend's attempts and retries attach to it there);
+    # the generator ends it when the stream finishes instead of holding it across yields
+    with use_span(s):
+        events = get_backend().events(dict(RESPONSE_OPTIONS, input=input_array))
+    return _deltas(s, events, time.perf_counter())
+
+
+def _deltas(s, events, start):
+    received = 0
+    error = None
     try:
-        # Validate inputs
-        if not message or not isinstance(message, str):
-            return None, "Invalid message input"
-        if not aqi_live_dic or not isinstance(aqi_live_dic, dict):
-            return None, "Invalid AQI data"
-        if not location or not isinstance(location, str):
-            return None, "Invalid location"
-        
-        windows=create_windows(aqi_live_dic)
-        payload=build_aqi_runtime_payload(windows,location)
-        system_prompt=SYSTEM_PROMPT
-        context_prompt=CONTEXT_PROMPT
-
-        runtime_prompt=f"""
-        <Runtime payload>
-        {payload}
-        </Runtime payload>
-        """
-
-        # Build input array with system prompts and conversation history
-        input_array = [
-            {
-                "role": "developer",
-                "content": system_prompt
-            },
-            {
-                "role": "assistant",
-                "content": context_prompt
-            }
-        ]
-        
-        # Add conversation history if provided
-        # Best practice: Include history BEFORE runtime payload so model has context
-        if conversation_history:
-            # Add a brief context marker if history exists (helps model understand it's historical)
-            if not isinstance(conversation_history, list):
-                return None, "Conversation history must be a list"
-            for msg in conversation_history:
-                if not isinstance(msg, dict) or "role" not in msg or "content" not in msg:
-                    return None, "Invalid conversation history format"
-                input_array.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
-        
-        # Add runtime payload (current AQI data) - this comes after history
-        input_array.append({
-            "role": "assistant",
-            "content": runtime_prompt
-        })
-        
-        # Add current user message (most recent, highest priority)
-        input_array.append({
-            "role": "user",
-            "content": message
-        })
-
-        response=client.responses.create(
-            model="gpt-4o-mini",
-            temperature=0.3,
-            max_output_tokens=400,
-            input=input_array
-        )
-        
-        if not hasattr(response, 'output_text') or not response.output_text:
-            return None, "Empty or invalid response from API"
-        
-        
-        return response.output_text, None
+        for event in events:
+            if event.type == "response.output_text.delta":
+                if not received:
+                    s.set('ttft_ms', (time.perf_counter() - start) * 1000)
+                received += len(event.delta)
+                yield event.delta
+            elif event.type == "response.completed":
+                record_usage(s, getattr(event.response, 'usage', None))
+            elif event.type == "error":
+                raise ChatbotStreamError(getattr(event, 'message', 'Unknown streaming error'))
+            elif event.type in ("response.failed", "response.incomplete") and not received:
+                raise ChatbotStreamError(f"Response {event.type.split('.')[-1]}")
+        if not received:
+            raise ChatbotStreamError("Empty or invalid response from API")
     except Exception as e:
-        return None, f"Chatbot error: {str(e)}"
+        error = e
+        raise
+    finally:
+        s.set('output_chars', received).end(error)
+
+
+def get_response_stream(message, chat_context, location, conversation_history=None):
+    """Returns (generator of text deltas, error) as the model produces them.
+
+    Inputs are validated up front; a failure during streaming raises
+    ChatbotStreamError (or the OpenAI error) from the generator.
+    """
+    input_array, prompt_tokens, error = build_input(message, chat_context, location, conversation_history)
+    if error:
+        return None, error
+    return _stream_deltas(input_array, prompt_tokens), None
+
 
 
 
 
+def ist_hour():
+    return (pd.to_datetime(datetime.now())+pd.Timedelta(hours=5.5)).floor('h')
 
-def create_windows(aqi_live_dic):
+
+def build_chat_context(aqi_live_dic, hour):
+    """Runtime payload for one forecast, built once and reused by every question in that IST hour.
+
+    `hour` is the IST hour the forecast was made for (its step 0). Windows are
+    laid out from it, so the context is only valid during that hour; after it
+    the caller needs a new forecast, not a context rebuilt from the old one.
+    """
+    windows=create_windows(aqi_live_dic, hour.hour)
+    # Hourly values stay out of the model's payload; the intent router answers hour questions from them
+    hourly=[round(float(aqi_live_dic[k]), 1) for k in range(9)]
+    return {"hour": hour, "payload": build_aqi_runtime_payload(windows, hour), "hourly": hourly}
+
+
+def create_windows(aqi_live_dic, curr_hour=None):
     windows={}
-    curr_hour=((pd.to_datetime(datetime.now())+pd.Timedelta(hours=5.5)).floor('h')).hour
+    if curr_hour is None:
+        curr_hour=ist_hour().hour
     for i in range(1,8):
         h=curr_hour+i
         window_bench=[aqi_live_dic[k] for k in range(i-1, i+2)]  # List of values for h-1, h, h+1
@@ -126,11 +148,13 @@ def window_confidence(start, end):
 
 
 
-def build_aqi_runtime_payload(windows,location):
+def build_aqi_runtime_payload(windows,hour=None,location=None):
     """
     Input:
         windows: list of dicts
                  [{"aqi": float, "confidence": float}, ...]
+        hour: IST hour the windows were laid out from (defaults to now)
+        location: address; left out for payloads shared between sessions
 
     Output:
         JSON-ready dict with windows, transitions, trend summary, best window
@@ -186,8 +210,8 @@ def build_aqi_runtime_payload(windows,location):
             mean_dyn = "moving_away_from_mean"
 
         transitions.append({
-            "from": windows[i]['window_hours'],
-            "to": windows[i+1]['window_hours'],
+            "from": w1["window_hours"],
+            "to": w2["window_hours"],
             "delta": round(delta, 2),
             "direction": direction,
             "strength": strength,
@@ -216,7 +240,8 @@ def build_aqi_runtime_payload(windows,location):
     best_idx=best_idx+1
 
     # ---------- final payload ----------
-    return {
+    hour=ist_hour() if hour is None else hour
+    payload={
         "mean_aqi": round(mean_aqi, 2),
         "windows": windows,                 # untouched
         "transitions": transitions,         # derived
@@ -227,8 +252,161 @@ def build_aqi_runtime_payload(windows,location):
             "confidence": windows[best_idx]["window_confidence"],
             "hours": windows[best_idx]['window_hours']
         },
-        "current_datetime": (pd.to_datetime(datetime.now())+pd.Timedelta(hours=5.5)).floor('h'),
-        "current_hour": (pd.to_datetime(datetime.now())+pd.Timedelta(hours=5.5)).floor('h').hour,
-        "location" : location
+        "current_datetime": hour.isoformat(),
+        "current_hour": hour.hour
     }
-
+    if location is not None:
+        payload["location"]=location
+    return payload
+
+
+# ---------- intent router ----------
+# Questions the payload answers directly are served from templates; anything
+# open-ended, about health, about pollutants the payload lacks, about another
+# place or a time of day the 8-hour forecast may not cover goes to the model.
+ROUTER_MAX_WORDS = 14
+OPEN_ENDED = re.compile(r"\b(why|how come|explain|safe|unsafe|health\w*|asthma\w*|kids?|child\w*|elderly|older|pregnan\w*|mask\w*|purifier|cause\w*|compare\w*|difference|vs|versus|than|pm ?2\.?5|pm ?10|today|tonight|morning|afternoon|evening|night|later|tomorrow|yesterday|week|forecast accuracy|accurate)\b")
+AQI_WORDS = re.compile(r"\b(aqi|air|quality|pollution|polluted|smog)\b")
+# "in Gurgaon", "at the airport"... a place other than the session's location
+OTHER_PLACE = re.compile(r"\b(in|at|near|around|for|of|from) (?!(?:the|a|an|my|this|here|me|us|aqi|air|quality|pollution|smog)\b|\d)[a-z]+")
+INTENT_PATTERNS = {
+    "best_window": re.compile(r"\b(best|ideal|good|safest|cleanest|least polluted) (time|window|hour|slot)\b|\bwhen (should|can|could) i\b|\bwhen (is it|will it be|will the air be) (best|good|better|cleanest)\b|\bwhen to (go|step|head|run|walk|jog|exercise)\b"),
+    "trend": re.compile(r"\btrend\b|\b(getting|get|become|becoming) (better|worse|cleaner)\b|\b(improv\w*|worsen\w*|rising|falling|increas\w*|decreas\w*)\b"),
+    "current": re.compile(r"\b(right now|currently|current|at the moment|now)\b"),
+}
+CLOCK_TIME = re.compile(r"\b(\d{1,2})(?::(\d{2}))?\s*(am|pm)\b|\b(\d{1,2}):(\d{2})\b")
+HOURS_AHEAD = re.compile(r"\bin (\d|an|one) hours?\b")
+
+
+def _asked_hour_offset(question, curr_hour):
+    """Hours ahead of curr_hour named in the question: None if no time is named, -1 if it is outside the forecast"""
+    match = CLOCK_TIME.search(question)
+    if match:
+        if match.group(1):
+            hour = int(match.group(1))
+            if not 1 <= hour <= 12:
+                return -1
+            hour = hour % 12 + (12 if match.group(3) == "pm" else 0)
+        else:
+            hour = int(match.group(4))
+            if hour > 23:
+                return -1
+        offset = (hour - curr_hour) % 24
+        return offset if offset <= 8 else -1
+    match = HOURS_AHEAD.search(question)
+    if match:
+        offset = 1 if match.group(1) in ("an", "one") else int(match.group(1))
+        return offset if offset <= 8 else -1
+    return None
+
+
+def classify_question(question, curr_hour):
+    """(intent, hour_offset) for questions the payload answers by itself, else None"""
+    q = question.lower()
+    # Every intent is about the air here, so the question has to say so
+    if len(q.split()) > ROUTER_MAX_WORDS or OPEN_ENDED.search(q) or OTHER_PLACE.search(q) or not AQI_WORDS.search(q):
+        return None
+    offset = _asked_hour_offset(q, curr_hour)
+    if offset == -1:
+        return None
+    intents = [name for name, pattern in INTENT_PATTERNS.items() if pattern.search(q)]
+    if offset is not None:
+        # "AQI at 5pm" asks about that hour; a time next to another intent is ambiguous
+        if intents:
+            return None
+        return "hour", offset
+    if len(intents) != 1:
+        return None
+    return intents[0], None
+
+
+def _hour_label(hour):
+    hour = hour % 24
+    return f"{hour % 12 or 12} {'AM' if hour < 12 else 'PM'}"
+
+
+def _window_label(hours):
+    return f"{_hour_label(hours[0])} to {_hour_label(hours[1] + 1)}"
+
+
+def _confidence_label(confidence):
+    if confidence >= 0.85:
+        return "high"
+    if confidence >= 0.70:
+        return "good"
+    if confidence >= 0.55:
+        return "moderate"
+    return "low"
+
+
+def _describe(value):
+    return f"{value:.0f} ({aqi_category(value)})"
+
+
+def _answer_best_window(context, offset):
+    payload = context["payload"]
+    best = payload["best_window"]
+    answer = (f"The best window in the next 8 hours is {_window_label(best['hours'])}, "
+              f"with an average AQI (Live) of {_describe(best['aqi'])}, "
+              f"compared with the 8-hour mean of {payload['mean_aqi']:.0f}. "
+              f"Forecast confidence for this window is {_confidence_label(best['confidence'])} ({best['confidence']:.2f}).")
+    if best["confidence"] < 0.70:
+        answer += " It lies late in the forecast, so treat it as a tentative pick."
+    return answer
+
+
+def _answer_current(context, offset):
+    value = context["hourly"][0]
+    return f"The current AQI (Live) is {_describe(value)}, from this hour's PM2.5 and PM10 readings."
+
+
+def _answer_hour(context, offset):
+    hour = context["hour"].hour + offset
+    value = context["hourly"][offset]
+    confidence = lead_time_confidence(offset)
+    return (f"At {_hour_label(hour)} the forecast AQI (Live) is {_describe(value)}, "
+            f"{offset} hour{'s' if offset != 1 else ''} ahead with {_confidence_label(confidence)} confidence ({confidence:.2f}). "
+            f"The 8-hour mean is {context['payload']['mean_aqi']:.0f}.")
+
+
+def _answer_trend(context, offset):
+    payload = context["payload"]
+    windows = payload["windows"]
+    first, last = windows[min(windows)], windows[max(windows)]
+    trend = payload["trend_summary"]["trend"]
+    if trend == "stable":
+        answer = f"Air quality is expected to stay about the same over the next 8 hours, around an AQI (Live) of {payload['mean_aqi']:.0f}."
+    else:
+        wording = {"rising": "worsen", "falling": "improve", "mixed": "go up and down"}[trend]
+        answer = f"Air quality is expected to {wording} over the next 8 hours."
+    answer += (f" The {_window_label(first['window_hours'])} window averages {_describe(first['window_score'])} "
+               f"and the {_window_label(last['window_hours'])} window {_describe(last['window_score'])}.")
+    biggest = max(payload["transitions"], key=lambda t: abs(t["delta"]))
+    if biggest["strength"] == "strong":
+        hours = biggest["to"]
+        answer += f" The sharpest change is {'a rise' if biggest['delta'] > 0 else 'a drop'} of {abs(biggest['delta']):.0f} into {_window_label(hours)}."
+    return answer
+
+
+INTENT_ANSWERS = {
+    "best_window": _answer_best_window,
+    "current": _answer_current,
+    "hour": _answer_hour,
+    "trend": _answer_trend,
+}
+
+
+@traced('chatbot.route_question')
+def route_question(message, chat_context):
+    """Template answer for a structured question (best window, current AQI, trend, specific hour), or None for the model"""
+    if not message or not chat_context or "hourly" not in chat_context:
+        return None
+    # Every template speaks of "now" and "the next 8 hours"; that only holds during the forecast's own hour
+    if chat_context["hour"] != ist_hour():
+        return None
+    routed = classify_question(message, chat_context["hour"].hour)
+    if routed is None:
+        return None
+    intent, offset = routed
+    current_span().set('intent', intent)
+    return INTENT_ANSWERS[intent](chat_context, offset)
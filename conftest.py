@@ -0,0 +1,15 @@
+"""
+Shared pytest setup.
+
+The app modules read their configuration from st.secrets at import time;
+tests get placeholder keys and defaults everywhere else instead of a
+.streamlit/secrets.toml.
+"""
+import streamlit
+
+TEST_SECRETS={
+    "google": {"api_key": "test-google-key"},
+    "open_ai": {"api_key": "test-openai-key"},
+}
+
+streamlit.secrets=TEST_SECRETS
@@ -0,0 +1,84 @@
+"""
+Convert the horizon models under model_og/ from JSON to UBJSON and benchmark
+startup load time and memory for both formats.
+
+    python convert_models.py           # write model_{poll}_t+{step}.ubj next to each .json
+    python convert_models.py --bench   # compare JSON vs UBJSON load time and RSS
+"""
+import os
+import sys
+import json
+import subprocess
+import xgboost as xgb
+from model_registry import MODEL_DIR, POLLUTANTS, HORIZONS
+
+# Run in a fresh interpreter per format so each measurement starts from a cold process
+# (the OS page cache is not dropped, so repeated runs measure warm-cache reads)
+BENCH_SNIPPET = """
+import sys, json, time, resource
+from model_registry import load_booster, POLLUTANTS, HORIZONS
+
+def rss_kb():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * resource.getpagesize() // 1024
+
+model_dir, fmt = sys.argv[1], sys.argv[2]
+rss_before = rss_kb()
+start = time.perf_counter()
+models = []
+for poll in POLLUTANTS:
+    for step in HORIZONS:
+        models.append(load_booster(f'{model_dir}/model_{poll}_t+{step}.{fmt}'))
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'load_seconds': elapsed,
+    'rss_delta_kb': rss_kb() - rss_before,
+    'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+}))
+"""
+
+
+def convert(model_dir=MODEL_DIR):
+    for poll in POLLUTANTS:
+        for step in HORIZONS:
+            src=os.path.join(model_dir,f'model_{poll}_t+{step}.json')
+            dst=os.path.join(model_dir,f'model_{poll}_t+{step}.ubj')
+            model=xgb.Booster()
+            model.load_model(src)
+            # Write to a temp file and rename so a running registry never sees a half-written model
+            tmp=dst+'.tmp'
+            model.save_model(tmp)
+            os.replace(tmp,dst)
+            print(f"{src} ({os.path.getsize(src)/1024:.0f} KB) -> {dst} ({os.path.getsize(dst)/1024:.0f} KB)")
+
+
+def bench(model_dir=MODEL_DIR,repeats=3):
+    here=os.path.dirname(os.path.abspath(__file__))
+    results={}
+    for fmt in ('json','ubj'):
+        runs=[]
+        for _ in range(repeats):
+            out=subprocess.run(
+                [sys.executable,'-c',BENCH_SNIPPET,model_dir,fmt],
+                cwd=here,capture_output=True,text=True,check=True
+            )
+            runs.append(json.loads(out.stdout))
+        results[fmt]={
+            'load_seconds': min(r['load_seconds'] for r in runs),
+            'rss_delta_kb': min(r['rss_delta_kb'] for r in runs),
+            'peak_rss_kb': min(r['peak_rss_kb'] for r in runs),
+        }
+
+    size={fmt: sum(os.path.getsize(os.path.join(model_dir,f'model_{p}_t+{s}.{fmt}')) for p in POLLUTANTS for s in HORIZONS) for fmt in ('json','ubj')}
+    print(f"On-disk size: json {size['json']/1024:.0f} KB, ubj {size['ubj']/1024:.0f} KB")
+    print(f"{'format':<14}{'load (s)':>10}{'RSS delta (MB)':>16}{'peak RSS (MB)':>15}")
+    for label,r in results.items():
+        print(f"{label:<14}{r['load_seconds']:>10.3f}{r['rss_delta_kb']/1024:>16.1f}{r['peak_rss_kb']/1024:>15.1f}")
+    return results
+
+
+if __name__ == '__main__':
+    if '--bench' in sys.argv:
+        bench()
+    else:
+        convert()
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+# One output feature: which column it reads, how, and over how many hours
+FeatureSpec=namedtuple('FeatureSpec',['name','column','op','window'])
+
+REDUCTIONS=('mean','std','sum')
+# Share of a rolling window's hours that must be present; the rest may be missing (NaN)
+MIN_COVERAGE=0.5
+
+
+def min_periods(window):
+    """Hours with data a rolling window needs to produce a value, as pandas rolling(window, min_periods=...)"""
+    return max(1,int(np.ceil(window*MIN_COVERAGE)))
+
+
+def feature_name(feature,op,window):
+    if op=='base':
+        return f'{feature}'
+    if op=='t+':
+        return f'{feature}_(t+{window})'
+    return f'{feature}_{op}_{window}'
+
+
+def shift_hours(op,window):
+    """Offset in hours, relative to the anchor timestamp, of the row a point feature reads"""
+    if op=='base':
+        return 1
+    if op=='t+':
+        return window
+    if op=='lag':
+        return -(window-1)
+    raise ValueError(f"Not a point feature op: {op}")
+
+
+def compile_plan(feature_dic,columns):
+    """Flatten the feature_dic entries for the given columns into an ordered FeaturePlan"""
+    specs=[]
+    for feature in feature_dic:
+        if feature not in columns:
+            continue
+        for op in feature_dic[feature]:
+            if op=='base':
+                specs.append(FeatureSpec(feature_name(feature,op,1),feature,op,1))
+            elif op in ('t+','lag')+REDUCTIONS:
+                for window in feature_dic[feature][op]:
+                    specs.append(FeatureSpec(feature_name(feature,op,window),feature,op,window))
+    return FeaturePlan(specs)
+
+
+class FeaturePlan():
+    """Precompiled feature extraction for one set of source columns.
+
+    Rolling features only ever need the `window` rows ending at the anchor
+    timestamp, so each one is a single NumPy reduction over a tail slice.
+    Missing hours are skipped, as pandas rolling(window, min_periods=...)
+    does, and a window with fewer than min_periods(window) hours is NaN.
+    Point features (base, t+, lag) are resolved with one index lookup for all
+    the timestamps they need.
+    """
+    def __init__(self,specs):
+        self.specs=list(specs)
+        self.columns=list(dict.fromkeys(spec.column for spec in self.specs))
+
+        # column -> window -> [(name, op)] so each tail slice is taken once
+        self.reductions={}
+        # column -> [(name, hour offset)]
+        self.points={}
+        for spec in self.specs:
+            if spec.op in REDUCTIONS:
+                self.reductions.setdefault(spec.column,{}).setdefault(spec.window,[]).append((spec.name,spec.op))
+            else:
+                self.points.setdefault(spec.column,[]).append((spec.name,shift_hours(spec.op,spec.window)))
+        self.offsets=sorted({offset for points in self.points.values() for _,offset in points})
+
+    def __len__(self):
+        return len(self.specs)
+
+    def evaluate(self,df,index):
+        """Compute every feature in the plan for the row at `index` of an hourly-indexed frame"""
+        if not df.index.is_unique:
+            df=df[~df.index.duplicated(keep='last')]
+
+        targets=pd.DatetimeIndex([index+pd.Timedelta(hours=offset) for offset in [0]+self.offsets])
+        positions=df.index.get_indexer(targets)
+        if (positions<0).any():
+            raise KeyError(f"Missing timestamps: {list(targets[positions<0])}")
+        anchor=positions[0]
+        position_of=dict(zip(self.offsets,positions[1:]))
+
+        results={}
+        for column in self.columns:
+            values=df[column].to_numpy(dtype=float)
+            for name,offset in self.points.get(column,()):
+                results[name]=values[position_of[offset]]
+            for window,ops in self.reductions.get(column,{}).items():
+                # pandas rolling(window) yields NaN until a full window is available
+                if anchor+1<window:
+                    for name,_ in ops:
+                        results[name]=np.nan
+                    continue
+                tail=values[anchor-window+1:anchor+1]
+                tail=tail[~np.isnan(tail)]
+                for name,op in ops:
+                    if len(tail)<min_periods(window) or (op=='std' and len(tail)<2):
+                        results[name]=np.nan
+                    elif op=='mean':
+                        results[name]=tail.mean()
+                    elif op=='sum':
+                        results[name]=tail.sum()
+                    else:
+                        results[name]=tail.std(ddof=1)
+
+        # Keep feature_dic order, matching the dict the old per-feature loop produced
+        return {spec.name: results[spec.name] for spec in self.specs}
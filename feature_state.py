@@ -0,0 +1,284 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from feature_plan import min_periods
+
+logger = logging.getLogger(__name__)
+
+FEATURE_STATE_DIR='./feature_state'
+
+
+class RollingState():
+    """Incremental air-quality feature state for one location.
+
+    Keeps a ring buffer of the last `capacity` hours of every column plus, for
+    each rolling window the plan uses, running sums, sums of squares and NaN
+    counts. Adding an hour is O(columns x windows) regardless of window length;
+    mean/std/sum/lag features are then read straight off the running totals.
+
+    Only complete history hours are pushed. The current hour's provisional
+    value is passed to features() instead, which applies it to the totals
+    without storing it, so the next history value for that hour does not
+    look like a revision.
+    """
+    # Rebuild the running sums from the buffer this often to shed float drift
+    REBUILD_EVERY=168
+
+    def __init__(self,plan):
+        self.plan=plan
+        self.columns=list(plan.columns)
+        self.windows=sorted({spec.window for spec in plan.specs if spec.op in ('mean','std','sum')})
+        self.capacity=max([spec.window for spec in plan.specs]+[1])
+        for spec in plan.specs:
+            if spec.op not in ('mean','std','sum','lag'):
+                raise ValueError(f"RollingState cannot serve '{spec.op}' features ({spec.name})")
+        self.column_index={column: i for i,column in enumerate(self.columns)}
+        self.window_index={window: k for k,window in enumerate(self.windows)}
+        self.reset()
+
+    def reset(self):
+        shape=(len(self.columns),len(self.windows))
+        self.buffer=np.full((len(self.columns),self.capacity),np.nan)
+        self.sums=np.zeros(shape)
+        self.sumsq=np.zeros(shape)
+        self.nans=np.zeros(shape,dtype=np.int64)
+        self.head=0
+        self.count=0
+        self.updates=0
+        self.last_hour=None
+        # Hours pushed as NaN because the frame lacked them; they may still arrive
+        self.missing=[]
+
+    def _age(self,age):
+        """Column values written `age` hours before the newest one"""
+        return self.buffer[:,(self.head-1-age)%self.capacity]
+
+    def push(self,hour,values):
+        """Add the next hour of values (one per column, in self.columns order)"""
+        values=np.asarray(values,dtype=float)
+        nan=np.isnan(values)
+        clean=np.where(nan,0.0,values)
+        for k,window in enumerate(self.windows):
+            if self.count>=window:
+                # The value that was `window-1` hours old drops out of this window
+                leaving=self._age(window-1)
+                leaving_nan=np.isnan(leaving)
+                leaving_clean=np.where(leaving_nan,0.0,leaving)
+                self.sums[:,k]-=leaving_clean
+                self.sumsq[:,k]-=leaving_clean**2
+                self.nans[:,k]-=leaving_nan
+            self.sums[:,k]+=clean
+            self.sumsq[:,k]+=clean**2
+            self.nans[:,k]+=nan
+        self.buffer[:,self.head]=values
+        self.head=(self.head+1)%self.capacity
+        self.count=min(self.count+1,self.capacity)
+        self.last_hour=pd.Timestamp(hour)
+        self.updates+=1
+        if self.updates%self.REBUILD_EVERY==0:
+            self._rebuild_sums()
+
+    def _rebuild_sums(self):
+        history=np.stack([self._age(age) for age in range(self.count)],axis=1) if self.count else np.empty((len(self.columns),0))
+        for k,window in enumerate(self.windows):
+            tail=history[:,:window]
+            nan=np.isnan(tail)
+            clean=np.where(nan,0.0,tail)
+            self.sums[:,k]=clean.sum(axis=1)
+            self.sumsq[:,k]=(clean**2).sum(axis=1)
+            self.nans[:,k]=nan.sum(axis=1)
+
+    @classmethod
+    def from_frame(cls,plan,df,index):
+        """Full rebuild from an hourly frame, using the hours up to and including `index`.
+
+        Slots are hours, not rows: an hour missing from the frame is pushed as
+        NaN, so lags and windows keep pointing at the right timestamps.
+        """
+        state=cls(plan)
+        if not df.index.is_unique:
+            df=df[~df.index.duplicated(keep='last')]
+        hours=pd.date_range(index-pd.Timedelta(hours=state.capacity-1),index,freq='h')
+        # Hours before the frame starts are left out, like a window that has not filled yet
+        hours=hours[hours>=df.index.min()]
+        state._push_hours(df,hours)
+        return state
+
+    def _push_hours(self,df,hours):
+        if not len(hours):
+            return
+        rows=df[self.columns].reindex(hours).to_numpy(dtype=float)
+        for hour,values in zip(hours,rows):
+            self.push(hour,values)
+        oldest=self.last_hour-pd.Timedelta(hours=self.capacity-1)
+        self.missing=[hour for hour in self.missing if hour>=oldest]+list(hours.difference(df.index))
+
+    def _matches(self,df):
+        """True if the newest buffered hour still holds the frame's value and no missing hour has arrived.
+
+        Only the tail is compared, so the check costs O(columns), not the whole buffer.
+        """
+        if any(hour in df.index for hour in self.missing):
+            return False
+        if self.last_hour not in df.index:
+            return self.last_hour in self.missing
+        current=df.loc[self.last_hour,self.columns].to_numpy(dtype=float)
+        return np.array_equal(self._age(0),current,equal_nan=True)
+
+    def advance(self,df,index):
+        """Push the hours after last_hour up to `index`.
+
+        Returns False, so the caller rebuilds from the frame, when the frame
+        revised an hour already in the buffer or the jump is longer than the
+        buffer. Hours missing from the frame are pushed as NaN.
+        """
+        if self.last_hour is None or index<self.last_hour:
+            return False
+        if not df.index.is_unique:
+            df=df[~df.index.duplicated(keep='last')]
+        expected=pd.date_range(self.last_hour+pd.Timedelta(hours=1),index,freq='h')
+        if len(expected)>self.capacity or not self._matches(df):
+            return False
+        self._push_hours(df,expected)
+        return True
+
+    def _with_current(self,current):
+        """(sums, sumsq, nans, count, lag) as if `current` had been pushed, without changing the state"""
+        current=np.asarray(current,dtype=float)
+        nan=np.isnan(current)
+        clean=np.where(nan,0.0,current)
+        sums=self.sums+clean[:,None]
+        sumsq=self.sumsq+(clean**2)[:,None]
+        nans=self.nans+nan[:,None]
+        for k,window in enumerate(self.windows):
+            if self.count>=window:
+                leaving=self._age(window-1)
+                leaving_nan=np.isnan(leaving)
+                leaving_clean=np.where(leaving_nan,0.0,leaving)
+                sums[:,k]-=leaving_clean
+                sumsq[:,k]-=leaving_clean**2
+                nans[:,k]-=leaving_nan
+        lag=lambda age: current if age==0 else self._age(age-1)
+        return sums,sumsq,nans,min(self.count+1,self.capacity),lag
+
+    def features(self,current=None):
+        """Feature values for the newest hour, in plan order.
+
+        With `current` (one value per column), for the hour after the newest
+        one, treating those values as provisional.
+        """
+        if current is None:
+            sums,sumsq,nans,count,lag=self.sums,self.sumsq,self.nans,self.count,self._age
+        else:
+            sums,sumsq,nans,count,lag=self._with_current(current)
+        results={}
+        for spec in self.plan.specs:
+            c=self.column_index[spec.column]
+            if spec.op=='lag':
+                results[spec.name]=lag(spec.window-1)[c] if count>=spec.window else np.nan
+                continue
+            k=self.window_index[spec.window]
+            window=spec.window
+            # Over the hours with data, as FeaturePlan.evaluate: NaN before the window fills or below min_periods
+            n=window-nans[c,k]
+            if count<window or n<min_periods(window):
+                results[spec.name]=np.nan
+            elif spec.op=='sum':
+                results[spec.name]=sums[c,k]
+            elif spec.op=='mean':
+                results[spec.name]=sums[c,k]/n
+            elif n>1:
+                var=(sumsq[c,k]-sums[c,k]**2/n)/(n-1)
+                results[spec.name]=np.sqrt(max(var,0.0))
+            else:
+                results[spec.name]=np.nan
+        return results
+
+    def save(self,path):
+        tmp=path+'.tmp.npz'
+        np.savez(tmp,columns=np.array(self.columns),windows=np.array(self.windows),
+                 buffer=self.buffer,sums=self.sums,sumsq=self.sumsq,nans=self.nans,
+                 head=self.head,count=self.count,updates=self.updates,
+                 last_hour=np.array(self.last_hour.isoformat() if self.last_hour is not None else ''),
+                 missing=np.array([hour.isoformat() for hour in self.missing],dtype=str))
+        os.replace(tmp,path)
+
+    @classmethod
+    def load(cls,plan,path):
+        state=cls(plan)
+        with np.load(path) as data:
+            # A state saved for a different feature_dic, or by an older version, cannot be reused
+            if 'missing' not in data.files or list(data['columns'])!=state.columns or list(data['windows'])!=state.windows or data['buffer'].shape!=state.buffer.shape:
+                return None
+            state.buffer=data['buffer']
+            state.sums=data['sums']
+            state.sumsq=data['sumsq']
+            state.nans=data['nans']
+            state.head=int(data['head'])
+            state.count=int(data['count'])
+            state.updates=int(data['updates'])
+            last_hour=str(data['last_hour'])
+            state.last_hour=pd.Timestamp(last_hour) if last_hour else None
+            state.missing=[pd.Timestamp(hour) for hour in data['missing']]
+        return state
+
+
+class FeatureStateStore():
+    """Per-location RollingState objects, kept in a bounded in-memory LRU and persisted as .npz files"""
+    def __init__(self,plan,state_dir=FEATURE_STATE_DIR,maxsize=1024):
+        self.plan=plan
+        self.state_dir=state_dir
+        self.maxsize=maxsize
+        self._states=OrderedDict()
+        self._lock=threading.Lock()
+        self.stats={'incremental': 0,'rebuilds': 0}
+
+    def _path(self,key):
+        return os.path.join(self.state_dir,'_'.join(f'{part:.6f}' for part in key)+'.npz')
+
+    def _load(self,key):
+        state=self._states.get(key)
+        if state is not None:
+            return state
+        path=self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            return RollingState.load(self.plan,path)
+        except Exception as e:
+            logger.error(f"Failed to load feature state {path}: {e}")
+            return None
+
+    def features(self,key,df,index):
+        """Air-quality features at `index` for a location, updating its state incrementally when possible.
+
+        The row at `index` is the provisional current hour: the state is kept
+        up to the hour before and the current values are only applied when
+        the features are read.
+        """
+        if not df.index.is_unique:
+            df=df[~df.index.duplicated(keep='last')]
+        history_end=index-pd.Timedelta(hours=1)
+        current=df[self.plan.columns].reindex([index]).to_numpy(dtype=float)[0]
+        with self._lock:
+            state=self._load(key)
+            previous_hour=state.last_hour if state is not None else None
+            if state is not None and state.advance(df,history_end):
+                self.stats['incremental']+=1
+            else:
+                state=RollingState.from_frame(self.plan,df,history_end)
+                self.stats['rebuilds']+=1
+            self._states[key]=state
+            self._states.move_to_end(key)
+            while len(self._states)>self.maxsize:
+                self._states.popitem(last=False)
+            if state.last_hour!=previous_hour:
+                try:
+                    os.makedirs(self.state_dir,exist_ok=True)
+                    state.save(self._path(key))
+                except Exception as e:
+                    logger.error(f"Failed to save feature state for {key}: {e}")
+            return state.features(current)
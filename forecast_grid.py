@@ -0,0 +1,211 @@
+"""
+Hourly forecast grid over the Delhi-NCR service area.
+
+At the top of each IST hour the grid job runs the forecast pipeline for every
+cell of a regular lat/lon grid and saves the 9-step (t..t+8) PM2.5/PM10/AQI
+results as one .npz file. The app then answers any in-bounds address from that
+file with a nearest-cell or bilinear lookup, and only runs the full pipeline
+when the grid is missing or stale.
+
+    python forecast_grid.py          # run the hourly job forever
+    python forecast_grid.py --once   # compute the current hour's grid and exit
+"""
+import os
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+import streamlit as st
+from aqi import pm_aqi
+from builder import ist_now
+from predict import BatchPredictor
+
+logger = logging.getLogger(__name__)
+
+LAT_MIN = 28.20  # South: Covers Manesar & Southern Gurgaon
+LAT_MAX = 28.90  # North: Covers Narela & North Delhi border
+LON_MIN = 76.80  # West: Covers Manesar & Dwarka Expressway
+LON_MAX = 77.70  # East: Covers Narela & North Delhi border
+
+grid_config = st.secrets.get("grid", {})
+GRID_STEP = float(grid_config.get("step_deg", 0.05))
+GRID_STORE_DIR = grid_config.get("store_dir", "./grid_store")
+GRID_LOOKUP = grid_config.get("lookup", "bilinear")   # 'bilinear' or 'nearest'
+GRID_START_DELAY = 120   # seconds after the hour before computing, so upstream hourly data is published
+
+# Per-cell series stored for each forecast step 0..8
+FIELDS = ('pm25', 'pm10', 'PM25_AVG_24', 'PM10_AVG_24', 'aqi', 'aqi_live')
+STEPS = 9
+
+def grid_axes(step=GRID_STEP):
+    lats = np.round(np.arange(LAT_MIN, LAT_MAX + step / 2, step), 6)
+    lons = np.round(np.arange(LON_MIN, LON_MAX + step / 2, step), 6)
+    return lats, lons
+
+
+class GridForecast():
+    """Forecast for every grid cell at one IST hour, stored as a (field, lat, lon, step) array"""
+    def __init__(self, hour, lats, lons, values):
+        self.hour = pd.Timestamp(hour)
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.values = np.asarray(values, dtype=np.float32)
+        self.field_index = {field: i for i, field in enumerate(FIELDS)}
+
+    def in_bounds(self, lat, lon):
+        return self.lats[0] <= lat <= self.lats[-1] and self.lons[0] <= lon <= self.lons[-1]
+
+    def _position(self, axis, value):
+        # Fractional index of `value` along an evenly spaced axis
+        step = axis[1] - axis[0] if len(axis) > 1 else 1.0
+        return (value - axis[0]) / step
+
+    def _result(self, cell):
+        """Turn a (field, step) array into the AQI_builder return triple"""
+        if np.isnan(cell).any():
+            return None
+        f = self.field_index
+        predictions_dic = {}
+        AQI_dic = {}
+        AQI_live_dic = {}
+        for key in range(STEPS):
+            predictions_dic[key] = {
+                'pm25': float(cell[f['pm25'], key]),
+                'pm10': float(cell[f['pm10'], key]),
+                'PM25_AVG_24': float(cell[f['PM25_AVG_24'], key]),
+                'PM10_AVG_24': float(cell[f['PM10_AVG_24'], key]),
+            }
+            AQI_dic[key] = float(cell[f['aqi'], key])
+            AQI_live_dic[key] = float(cell[f['aqi_live'], key])
+        return AQI_dic, AQI_live_dic, predictions_dic
+
+    def nearest(self, lat, lon):
+        i = int(np.clip(np.rint(self._position(self.lats, lat)), 0, len(self.lats) - 1))
+        j = int(np.clip(np.rint(self._position(self.lons, lon)), 0, len(self.lons) - 1))
+        return self._result(self.values[:, i, j, :])
+
+    def bilinear(self, lat, lon):
+        y = np.clip(self._position(self.lats, lat), 0, len(self.lats) - 1)
+        x = np.clip(self._position(self.lons, lon), 0, len(self.lons) - 1)
+        i0, j0 = int(np.floor(y)), int(np.floor(x))
+        i1, j1 = min(i0 + 1, len(self.lats) - 1), min(j0 + 1, len(self.lons) - 1)
+        wy, wx = y - i0, x - j0
+        corners = self.values[:, [i0, i0, i1, i1], [j0, j1, j0, j1], :]
+        if np.isnan(corners).any():
+            # A corner cell failed to forecast: use the nearest cell instead
+            return self.nearest(lat, lon)
+        weights = np.array([(1 - wy) * (1 - wx), (1 - wy) * wx, wy * (1 - wx), wy * wx], dtype=np.float32)
+        cell = np.einsum('k,fks->fs', weights, corners)
+        # Interpolate concentrations, then derive AQI from them so the two stay consistent
+        f = self.field_index
+        cell[f['aqi']] = pm_aqi(cell[f['PM25_AVG_24']], cell[f['PM10_AVG_24']])
+        cell[f['aqi_live']] = pm_aqi(cell[f['pm25']], cell[f['pm10']])
+        return self._result(cell)
+
+    def lookup(self, lat, lon, method=GRID_LOOKUP):
+        """(AQI_dic, AQI_live_dic, predictions_dic) for a location, or None if it cannot be answered"""
+        if not self.in_bounds(lat, lon):
+            return None
+        if method == 'nearest':
+            return self.nearest(lat, lon)
+        return self.bilinear(lat, lon)
+
+    def save(self, path):
+        tmp = path + '.tmp.npz'
+        np.savez(tmp, hour=np.array(self.hour.isoformat()), lats=self.lats, lons=self.lons, values=self.values, fields=np.array(FIELDS))
+        # Atomic swap so the app never reads a half-written grid
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            if tuple(data['fields']) != FIELDS:
+                raise ValueError(f"Grid store {path} has fields {tuple(data['fields'])}, expected {FIELDS}")
+            return cls(str(data['hour']), data['lats'], data['lons'], data['values'])
+
+
+def compute_grid(hour, step=GRID_STEP, chunk_size=50):
+    """Run the forecast pipeline for every grid cell, chunk_size cells per BatchPredictor"""
+    lats, lons = grid_axes(step)
+    values = np.full((len(FIELDS), len(lats), len(lons), STEPS), np.nan, dtype=np.float32)
+    cells = [(i, j) for i in range(len(lats)) for j in range(len(lons))]
+    f = {field: i for i, field in enumerate(FIELDS)}
+    failed = 0
+    for start in range(0, len(cells), chunk_size):
+        chunk = cells[start:start + chunk_size]
+        batch = BatchPredictor([(lats[i], lons[j]) for i, j in chunk])
+        batch.predict()
+        for (i, j), (predictions_dic, error) in zip(chunk, batch.results()):
+            if predictions_dic is None:
+                failed += 1
+                continue
+            for field in ('pm25', 'pm10', 'PM25_AVG_24', 'PM10_AVG_24'):
+                values[f[field], i, j, :] = [predictions_dic[key][field] for key in range(STEPS)]
+
+    values[f['aqi']] = pm_aqi(values[f['PM25_AVG_24']], values[f['PM10_AVG_24']])
+    values[f['aqi_live']] = pm_aqi(values[f['pm25']], values[f['pm10']])
+    # Keep failed cells as NaN so lookups skip them
+    missing = np.isnan(values[f['pm25']])
+    values[f['aqi']][missing] = np.nan
+    values[f['aqi_live']][missing] = np.nan
+    if failed:
+        logger.error(f"Grid forecast for {hour}: {failed}/{len(cells)} cells failed")
+    return GridForecast(hour, lats, lons, values)
+
+
+def grid_path(store_dir=GRID_STORE_DIR):
+    return os.path.join(store_dir, 'latest.npz')
+
+
+_loaded = {'mtime': None, 'grid': None}
+
+
+def get_current_grid(store_dir=GRID_STORE_DIR):
+    """The stored grid if it was computed for the current IST hour, else None"""
+    path = grid_path(store_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    if mtime != _loaded['mtime']:
+        try:
+            _loaded['grid'] = GridForecast.load(path)
+            _loaded['mtime'] = mtime
+        except Exception as e:
+            logger.error(f"Failed to load forecast grid {path}: {e}")
+            return None
+    grid = _loaded['grid']
+    if grid is None or grid.hour != ist_now().floor('h'):
+        return None
+    return grid
+
+
+def run_once(store_dir=GRID_STORE_DIR, step=GRID_STEP):
+    hour = ist_now().floor('h')
+    os.makedirs(store_dir, exist_ok=True)
+    start = time.time()
+    grid = compute_grid(hour, step)
+    grid.save(grid_path(store_dir))
+    print(f"Grid for {hour} ({len(grid.lats)}x{len(grid.lons)} cells) computed in {time.time() - start:.1f} seconds")
+    return grid
+
+
+def run_forever(store_dir=GRID_STORE_DIR, step=GRID_STEP):
+    while True:
+        try:
+            current = get_current_grid(store_dir)
+            if current is None:
+                run_once(store_dir, step)
+        except Exception as e:
+            logger.error(f"Grid forecast run failed: {e}")
+        now = ist_now()
+        next_run = now.floor('h') + pd.Timedelta(hours=1) + pd.Timedelta(seconds=GRID_START_DELAY)
+        time.sleep(max((next_run - now).total_seconds(), 1))
+
+
+if __name__ == '__main__':
+    if '--once' in sys.argv:
+        run_once()
+    else:
+        run_forever()
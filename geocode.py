@@ -0,0 +1,78 @@
+import re
+import time
+import requests
+import streamlit as st
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from cache import TTLCache
+
+GOOGLE_API = st.secrets["google"]["api_key"]
+
+GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+
+cache_config = st.secrets.get("cache", {})
+GEOCODE_CACHE_SIZE = int(cache_config.get("geocode_cache_size", 4096))
+GEOCODE_CACHE_PATH = cache_config.get("geocode_cache_path", "geocode_cache.sqlite")
+GEOCODE_TTL = 30 * 24 * 3600  # Addresses rarely move; refresh resolved coordinates monthly
+
+geocode_cache = TTLCache(maxsize=GEOCODE_CACHE_SIZE, path=GEOCODE_CACHE_PATH, disk_maxsize=GEOCODE_CACHE_SIZE * 25)
+
+# One pooled session so repeated lookups reuse the TLS connection to Google
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+
+def normalize_address(address):
+    """Case- and whitespace-folded form of an address, used as the cache key"""
+    address = " ".join(address.casefold().split())
+    address = re.sub(r"\s*,\s*", ", ", address)
+    return address.strip(" ,")
+
+
+def get_location(address):
+    """Geocode address to latitude and longitude"""
+    key = normalize_address(address)
+    cached = geocode_cache.get(key)
+    if cached is not None:
+        return cached + (None,)
+
+    try:
+        # Use tuple timeout: (connect_timeout, read_timeout) in seconds
+        # This ensures both connection and read operations timeout properly
+        response = session.get(GEOCODE_URL, params={"address": key, "key": GOOGLE_API}, timeout=(5, 3))  # 5s to connect, 3s to read
+        response.raise_for_status()  # Raise exception for bad status codes
+        data = response.json()
+
+        # Check API response status
+        status = data.get('status', 'UNKNOWN_ERROR')
+        if status != 'OK':
+            return None, None, None, f"Geocoding error: {status}"
+
+        if not data.get('results'):
+            return None, None, None, "No results found for this address"
+
+        lat = data['results'][0]['geometry']['location']['lat']
+        lon = data['results'][0]['geometry']['location']['lng']
+        location = data['results'][0]['formatted_address']
+        geocode_cache.set(key, (lat, lon, location), time.time() + GEOCODE_TTL)
+        return lat, lon, location, None
+
+    except requests.exceptions.Timeout as e:
+        return None, None, None, f"Request timed out after 5 seconds. Please try again."
+    except requests.exceptions.ConnectionError as e:
+        return None, None, None, f"Connection error: Unable to reach the geocoding service."
+    except requests.exceptions.RequestException as e:
+        return None, None, None, f"Network error: {str(e)}"
+    except (KeyError, IndexError) as e:
+        return None, None, None, f"Error parsing geocoding response: {str(e)}"
+    except Exception as e:
+        return None, None, None, f"Unexpected error: {str(e)}"
+
+
+def get_locations(addresses, max_workers=8):
+    """Geocode many addresses concurrently; returns get_location tuples in input order"""
+    # Each distinct normalized address is looked up once, however often it appears
+    unique = list(dict.fromkeys(normalize_address(a) for a in addresses))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        results = dict(zip(unique, pool.map(get_location, unique)))
+    return [results[normalize_address(a)] for a in addresses]
@@ -0,0 +1,73 @@
+import sqlite3
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+HISTORY_STORE_PATH='./aq_history.sqlite'
+RETENTION_HOURS=24*8   # the features look back 168 hours; keep a day of slack
+
+
+class HistoryStore():
+    """Local time series of Google Air Quality history hours, keyed by grid cell and UTC hour.
+
+    Stored long-format (one row per cell, hour and pollutant column) so the
+    column set can follow the Builder without schema changes. Only hours the
+    API returned are written; an hour it skipped stays absent, so
+    missing_ranges asks for it again on the next forecast. A NULL value is a
+    pollutant the API left out of an hour it did return.
+    """
+    def __init__(self,path=HISTORY_STORE_PATH,retention_hours=RETENTION_HOURS):
+        self.path=path
+        self.retention_hours=retention_hours
+        self._lock=threading.Lock()
+        self._writes=0
+        self._db=sqlite3.connect(path,check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS aq_history (cell_lat REAL, cell_lon REAL, hour TEXT, pollutant TEXT, value REAL, PRIMARY KEY (cell_lat, cell_lon, hour, pollutant))')
+        self._db.commit()
+
+    def read(self,key,start,end,columns):
+        """Hourly frame (naive UTC index) for hours in [start, end] that are present in the store"""
+        with self._lock:
+            rows=self._db.execute(
+                'SELECT hour, pollutant, value FROM aq_history WHERE cell_lat=? AND cell_lon=? AND hour>=? AND hour<=?',
+                (key[0],key[1],start.isoformat(),end.isoformat())
+            ).fetchall()
+        if not rows:
+            return pd.DataFrame(columns=columns,index=pd.DatetimeIndex([]),dtype=float)
+        df=pd.DataFrame(rows,columns=['hour','pollutant','value'])
+        df=df.pivot(index='hour',columns='pollutant',values='value')
+        df.index=pd.to_datetime(df.index)
+        return df.reindex(columns=columns).astype(float).sort_index()
+
+    def write(self,key,df):
+        """Upsert an hourly frame (naive UTC index, one column per pollutant)"""
+        records=[
+            (key[0],key[1],hour.isoformat(),column,None if pd.isna(value) else float(value))
+            for hour,row in zip(df.index,df.to_numpy(dtype=float))
+            for column,value in zip(df.columns,row)
+        ]
+        if not records:
+            return
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO aq_history VALUES (?,?,?,?,?)',records)
+            self._writes+=1
+            if self._writes%50==0:
+                cutoff=(pd.Timestamp.now(tz='UTC').tz_localize(None)-pd.Timedelta(hours=self.retention_hours)).isoformat()
+                self._db.execute('DELETE FROM aq_history WHERE hour<?',(cutoff,))
+            self._db.commit()
+
+
+def missing_ranges(expected,present):
+    """Contiguous (start, end) hour ranges of `expected` that are not in `present`"""
+    missing=expected.difference(present)
+    if len(missing)==0:
+        return []
+    # A new range starts wherever the gap to the previous missing hour exceeds one hour
+    hours=missing.values.astype('datetime64[h]').astype(np.int64)
+    breaks=np.flatnonzero(np.diff(hours)!=1)
+    starts=np.concatenate([[0],breaks+1])
+    ends=np.concatenate([breaks,[len(missing)-1]])
+    return [(missing[s],missing[e]) for s,e in zip(starts,ends)]
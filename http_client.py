@@ -0,0 +1,158 @@
+import json
+import atexit
+import asyncio
+import logging
+import threading
+import contextvars
+from urllib.parse import urlsplit
+import aiohttp
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings shared by every per-host session
+LIMIT_PER_HOST=20
+KEEPALIVE_TIMEOUT=60   # seconds an idle connection is kept open for reuse
+DNS_CACHE_TTL=300      # seconds
+
+
+class HttpClient():
+    """Long-lived HTTP client shared by every Builder in the process.
+
+    Owns a background event loop thread and one aiohttp session per host, so
+    repeated forecasts reuse warm keep-alive connections instead of paying a
+    TCP+TLS handshake per request. Coroutines are submitted with run()/submit().
+    """
+    def __init__(self,limit_per_host=LIMIT_PER_HOST,keepalive_timeout=KEEPALIVE_TIMEOUT,dns_cache_ttl=DNS_CACHE_TTL):
+        self.limit_per_host=limit_per_host
+        self.keepalive_timeout=keepalive_timeout
+        self.dns_cache_ttl=dns_cache_ttl
+        self._loop=None
+        self._thread=None
+        self._sessions={}
+        self._stats={}
+        self._lock=threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop=asyncio.new_event_loop()
+                self._thread=threading.Thread(target=self._loop.run_forever,name='http-client-loop',daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def submit(self,coro):
+        """Schedule a coroutine on the client loop and return a concurrent.futures.Future"""
+        # Run it in a copy of the caller's context so contextvars (e.g. the active trace span) carry over
+        return asyncio.run_coroutine_threadsafe(_in_context(coro,contextvars.copy_context()),self.loop)
+
+    def run(self,coro,timeout=None):
+        """Run a coroutine on the client loop and block until it finishes"""
+        return self.submit(coro).result(timeout)
+
+    def _host_stats(self,host):
+        stats=self._stats.get(host)
+        if stats is None:
+            stats={'requests': 0,'errors': 0,'connections_created': 0,'connections_reused': 0,'bytes_received': 0}
+            self._stats[host]=stats
+        return stats
+
+    def _session(self,host):
+        # Only called from the client loop, so no locking is needed here
+        session=self._sessions.get(host)
+        if session is not None and not session.closed:
+            return session
+
+        stats=self._host_stats(host)
+
+        async def on_create(session,ctx,params):
+            stats['connections_created']+=1
+
+        async def on_reuse(session,ctx,params):
+            stats['connections_reused']+=1
+
+        trace=aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        connector=aiohttp.TCPConnector(
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        session=aiohttp.ClientSession(connector=connector,trace_configs=[trace])
+        self._sessions[host]=session
+        return session
+
+    async def _request_json(self,method,url,timeout,**kwargs):
+        host=urlsplit(url).netloc
+        session=self._session(host)
+        stats=self._host_stats(host)
+        stats['requests']+=1
+        try:
+            with span('http.request',method=method,host=host) as s:
+                async with session.request(method,url,timeout=aiohttp.ClientTimeout(total=timeout),**kwargs) as response:
+                    s.set('status',response.status)
+                    response.raise_for_status()
+                    body=await response.read()
+                    stats['bytes_received']+=len(body)
+                    s.set('bytes_received',len(body))
+                    return json.loads(body)
+        except Exception:
+            stats['errors']+=1
+            raise
+
+    async def request_json(self,method,url,timeout=10,**kwargs):
+        """Send a request through the pooled session for the URL's host and return the decoded JSON body"""
+        coro=self._request_json(method,url,timeout,**kwargs)
+        try:
+            running=asyncio.get_running_loop()
+        except RuntimeError:
+            running=None
+        if running is self._loop:
+            return await coro
+        # Called from another loop (e.g. asyncio.run in a script): hop onto the client loop
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stats(self):
+        """Per-host request and connection reuse counters"""
+        out={}
+        for host,stats in self._stats.items():
+            stats=dict(stats)
+            connections=stats['connections_created']+stats['connections_reused']
+            stats['reuse_rate']=stats['connections_reused']/connections if connections else 0.0
+            out[host]=stats
+        return out
+
+    async def _close_sessions(self):
+        sessions=list(self._sessions.values())
+        self._sessions.clear()
+        for session in sessions:
+            await session.close()
+
+    def close(self):
+        with self._lock:
+            loop=self._loop
+            self._loop=None
+        if loop is None or loop.is_closed():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_sessions(),loop).result(5)
+        except Exception as e:
+            logger.error(f"Error closing HTTP sessions: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+
+
+async def _in_context(coro,context):
+    # The task already runs in its own context copy, so these sets do not leak to other tasks
+    for var,value in context.items():
+        var.set(value)
+    return await coro
+
+
+client=HttpClient()
+atexit.register(client.close)
+
+
+def get_client():
+    return client
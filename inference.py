@@ -0,0 +1,202 @@
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import streamlit as st
+from model_registry import get_registry, POLLUTANTS, HORIZONS, MODEL_DIR, DIRECT_MODEL_DIR
+from tree_compile import compile_booster
+from tracing import span
+
+inference_config=st.secrets.get("inference",{})
+# 'chain': t+k reads the t+1..t+k-1 predictions (model_og). 'direct': every horizon
+# model reads only observed features (model_direct), so all 16 calls run at once
+FORECAST_MODE=inference_config.get("mode","chain")
+MODEL_DIRS={'chain': MODEL_DIR,'direct': inference_config.get("direct_model_dir",DIRECT_MODEL_DIR)}
+# Threads per booster call; by default the cores are split across the calls that run side by side
+INFERENCE_NTHREAD=inference_config.get("nthread")
+# 'xgboost': Booster.inplace_predict. 'numpy': boosters flattened by tree_compile into array evaluators
+INFERENCE_BACKEND=inference_config.get("backend","xgboost")
+BACKENDS=('xgboost','numpy')
+LATENCY_WINDOW=512   # per-horizon latency samples kept for latency_summary()
+
+
+def prediction_feature(time_step):
+    """Feature through which the t+k prediction feeds the later horizons"""
+    return f'Predictions t+{time_step}'
+
+
+class InferenceEngine():
+    """t+1..t+8 inference for both pollutants.
+
+    Every feature any model reads gets a fixed column in one vocabulary, and
+    each booster gets an index map from that vocabulary to its feature_names
+    order. A forecast is then one float64 row per site, built once; each
+    horizon gathers its columns with the index map and predicts in place.
+
+    In 'chain' mode each horizon writes its output back into the prediction
+    column the next horizon reads, and the independent pm25 and pm10 chains
+    run on two threads (XGBoost releases the GIL while predicting). In
+    'direct' mode nothing is written back, so all 16 calls run at once.
+    """
+    def __init__(self,mode=FORECAST_MODE,registry=None,nthread=INFERENCE_NTHREAD,backend=INFERENCE_BACKEND):
+        if mode not in MODEL_DIRS:
+            raise ValueError(f"Unknown forecast mode '{mode}', expected one of {list(MODEL_DIRS)}")
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}', expected one of {BACKENDS}")
+        self.mode=mode
+        self.backend=backend
+        self.registry=registry or get_registry(MODEL_DIRS[mode])
+        workers=len(POLLUTANTS) if mode=='chain' else len(POLLUTANTS)*len(HORIZONS)
+        self.nthread=int(nthread) if nthread else max(1,(os.cpu_count() or 2)//workers)
+        self.vocabulary=[prediction_feature(time_step) for time_step in HORIZONS[:-1]] if mode=='chain' else []
+        self.vocabulary_index={name: i for i,name in enumerate(self.vocabulary)}
+        self._maps={}
+        self._lock=threading.Lock()
+        self._pool=ThreadPoolExecutor(max_workers=workers,thread_name_prefix=f'inference-{mode}')
+        self.latency={(poll,time_step): deque(maxlen=LATENCY_WINDOW) for poll in POLLUTANTS for time_step in HORIZONS}
+
+    def _prepare(self,entry):
+        """(predictor, index map) for a loaded booster: the index map holds the vocabulary
+        positions of its features in feature_names order"""
+        cached=self._maps.get(entry.path)
+        if cached is not None and cached[0] is entry:
+            return cached[1],cached[2]
+        with self._lock:
+            if self.mode=='direct':
+                chained=[name for name in entry.feature_names if name.startswith('Predictions t+')]
+                if chained:
+                    raise ValueError(f"{entry.path} reads {chained}; direct mode needs models trained on observed features only")
+            for name in entry.feature_names:
+                if name not in self.vocabulary_index:
+                    self.vocabulary_index[name]=len(self.vocabulary)
+                    self.vocabulary.append(name)
+            index=np.array([self.vocabulary_index[name] for name in entry.feature_names],dtype=np.intp)
+            if self.backend=='numpy':
+                predictor=compile_booster(entry.booster)
+            else:
+                # Set once per loaded booster, not per call: set_param is not free
+                entry.booster.set_param({'nthread': self.nthread})
+                predictor=entry.booster
+            self._maps[entry.path]=(entry,predictor,index)
+        return predictor,index
+
+    def models(self):
+        """(predictor, index map) for every pollutant and horizon, taken together so one forecast uses one model set"""
+        models={}
+        for poll in POLLUTANTS:
+            for time_step in HORIZONS:
+                models[(poll,time_step)]=self._prepare(self.registry.get(poll,time_step))
+        return models
+
+    def feature_rows(self,feature_dics):
+        """One row per site over the vocabulary; features a site lacks are NaN"""
+        # A reloaded booster can extend the vocabulary in _prepare meanwhile; size and index come from one snapshot.
+        # The vocabulary only grows, so the snapshot covers every model prepared before this call
+        with self._lock:
+            size=len(self.vocabulary)
+            vocabulary_index=dict(self.vocabulary_index)
+        rows=np.full((len(feature_dics),size),np.nan)
+        for row,dic in zip(rows,feature_dics):
+            for name,value in dic.items():
+                i=vocabulary_index.get(name)
+                if i is not None:
+                    row[i]=value
+        return rows
+
+    def _run_chain(self,poll,rows,models):
+        rows=rows.copy()
+        out=np.empty((len(rows),len(HORIZONS)),dtype=np.float32)
+        timings={}
+        for k,time_step in enumerate(HORIZONS):
+            predictor,index=models[(poll,time_step)]
+            start=time.perf_counter()
+            predictions=predictor.inplace_predict(rows[:,index])
+            timings[time_step]=time.perf_counter()-start
+            out[:,k]=predictions
+            if time_step!=HORIZONS[-1]:
+                rows[:,self.vocabulary_index[prediction_feature(time_step)]]=predictions
+        return out,timings
+
+    def _run_direct(self,poll,time_step,rows,models):
+        predictor,index=models[(poll,time_step)]
+        start=time.perf_counter()
+        predictions=predictor.inplace_predict(rows[:,index])
+        return predictions,time.perf_counter()-start
+
+    def predict_rows(self,rows,models):
+        """Forecast vocabulary rows built against `models` (see feature_rows)"""
+        with span('inference.predict',mode=self.mode,backend=self.backend,rows=len(rows)) as s:
+            predictions,timings=self._predict_rows(rows,models)
+            for (poll,time_step),seconds in timings.items():
+                s.set(f'{poll}.t+{time_step}_ms',seconds*1000)
+        return predictions,timings
+
+    def _predict_rows(self,rows,models):
+        predictions={}
+        timings={}
+        if self.mode=='chain':
+            futures={poll: self._pool.submit(self._run_chain,poll,rows,models) for poll in POLLUTANTS}
+            for poll,future in futures.items():
+                predictions[poll],chain_timings=future.result()
+                for time_step,seconds in chain_timings.items():
+                    timings[(poll,time_step)]=seconds
+        else:
+            futures={key: self._pool.submit(self._run_direct,*key,rows,models) for key in models}
+            for poll in POLLUTANTS:
+                predictions[poll]=np.empty((len(rows),len(HORIZONS)),dtype=np.float32)
+            for (poll,time_step),future in futures.items():
+                values,timings[(poll,time_step)]=future.result()
+                predictions[poll][:,HORIZONS.index(time_step)]=values
+        for key,seconds in timings.items():
+            self.latency[key].append(seconds)
+        return predictions,timings
+
+    def predict(self,feature_dics):
+        """Forecast every site in `feature_dics`.
+
+        Returns ({poll: (n_sites, 8) array}, {(poll, time_step): seconds}).
+        """
+        # Models first: loading a booster can add features to the vocabulary
+        models=self.models()
+        return self.predict_rows(self.feature_rows(feature_dics),models)
+
+    def latency_summary(self):
+        """p50/p95 booster latency in milliseconds per pollutant and horizon"""
+        summary={}
+        for (poll,time_step),samples in self.latency.items():
+            if samples:
+                ms=np.array(samples)*1000
+                summary[f'{poll} t+{time_step}']={'p50': float(np.percentile(ms,50)),'p95': float(np.percentile(ms,95)),'n': len(ms)}
+        return summary
+
+
+engines={}
+_engine_lock=threading.Lock()
+
+
+def get_engine(mode=None):
+    """Shared engine for a forecast mode, FORECAST_MODE by default"""
+    mode=mode or FORECAST_MODE
+    if mode not in engines:
+        with _engine_lock:
+            if mode not in engines:
+                engines[mode]=InferenceEngine(mode)
+    return engines[mode]
+
+
+if __name__ == '__main__':
+    rng=np.random.default_rng(0)
+    inference=get_engine()
+    inference.models()
+    print(f"Mode: {inference.mode} ({inference.registry.model_dir}), backend {inference.backend}, nthread {inference.nthread}")
+    dic={name: rng.normal() for name in inference.vocabulary}
+    inference.predict([dic])
+    start=time.time()
+    runs=200
+    for _ in range(runs):
+        inference.predict([dic])
+    print(f"One forecast (16 boosters): {(time.time()-start)/runs*1000:.2f} ms")
+    for name,stats in inference.latency_summary().items():
+        print(f"{name}: p50 {stats['p50']:.3f} ms, p95 {stats['p95']:.3f} ms")
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+# Decoders for the upstream payloads. Each one walks the decoded JSON once,
+# writing values into preallocated float64 arrays, and builds its DataFrame
+# from those arrays in one go so every column comes out float64.
+
+MOLAR_VOLUME = 24.45  # L/mol @25°C, 1 atm
+
+# molecular weights
+MW_NO2 = 46.005
+MW_CO  = 28.010
+MW_SO2 = 64.066
+MW_O3  = 48.000
+MW_NH3 = 17.031
+MW_C6H6 = 78.114  # Benzene
+MW_NO = 30.006
+
+# Google pollutant code -> (column, factor from the API unit to the column unit)
+POLLUTANT_COLUMNS={
+    'pm25': ('PM2.5 (µg/m³)',1.0),
+    'pm10': ('PM10 (µg/m³)',1.0),
+    'nox': ('NOx (ppb)',1.0),
+    'no2': ('NO2 (µg/m³)',MW_NO2/MOLAR_VOLUME),
+    'co': ('CO (mg/m³)',MW_CO/(MOLAR_VOLUME*1000)),
+    'so2': ('SO2 (µg/m³)',MW_SO2/MOLAR_VOLUME),
+    'o3': ('Ozone (µg/m³)',MW_O3/MOLAR_VOLUME),
+    'nh3': ('NH3 (µg/m³)',MW_NH3/MOLAR_VOLUME),
+    'c6h6': ('Benzene (µg/m³)',1.0),
+    'no': ('NO (µg/m³)',MW_NO/MOLAR_VOLUME),
+}
+POLLUTANT_CODES=list(POLLUTANT_COLUMNS)
+POLLUTANT_INDEX={code: i for i,code in enumerate(POLLUTANT_CODES)}
+AIR_QUALITY_COLUMNS=[column for column,_ in POLLUTANT_COLUMNS.values()]
+UNIT_FACTORS=np.array([factor for _,factor in POLLUTANT_COLUMNS.values()])
+
+WEATHER_VARIABLES=['temperature_2m','wind_speed_10m','rain','wind_speed_80m','wind_speed_120m',
+    'wind_direction_10m','wind_direction_80m','wind_direction_120m','wind_gusts_10m','relative_humidity_2m']
+
+
+def _utc_index(timestamps):
+    return pd.DatetimeIndex(pd.to_datetime(timestamps,utc=True)).tz_localize(None)
+
+
+def _pollutant_row(row,present,pollutants):
+    for j in pollutants:
+        k=POLLUTANT_INDEX.get(j['code'])
+        if k is not None:
+            row[k]=j['concentration']['value']
+            present[k]=True
+
+
+def _carry_forward(values,present):
+    """Fill each pollutant an hour did not report with the last reported value, in payload order"""
+    rows=np.where(present,np.arange(len(values))[:,None],-1)
+    np.maximum.accumulate(rows,axis=0,out=rows)
+    filled=values[np.maximum(rows,0),np.arange(values.shape[1])]
+    filled[rows<0]=np.nan
+    return filled
+
+
+def history_frame(hours_info):
+    """history:lookup hoursInfo -> float64 frame indexed by naive UTC hour, one column per pollutant.
+
+    A pollutant missing from an hour takes the value from the previous hour of
+    the payload, as the original dict-based parser did.
+    """
+    n=len(hours_info)
+    values=np.full((n,len(POLLUTANT_CODES)),np.nan)
+    present=np.zeros(values.shape,dtype=bool)
+    timestamps=[]
+    for i,hour in enumerate(hours_info):
+        timestamps.append(hour['dateTime'])
+        _pollutant_row(values[i],present[i],hour.get('pollutants',[]))
+    values=_carry_forward(values,present)*UNIT_FACTORS
+    return pd.DataFrame(values,index=_utc_index(timestamps),columns=AIR_QUALITY_COLUMNS)
+
+
+def current_frame(data):
+    """currentConditions:lookup response -> one-row float64 frame indexed by naive UTC hour"""
+    values=np.full((1,len(POLLUTANT_CODES)),np.nan)
+    present=np.zeros(values.shape,dtype=bool)
+    _pollutant_row(values[0],present[0],data['pollutants'])
+    return pd.DataFrame(values*UNIT_FACTORS,index=_utc_index([data['dateTime']]),columns=AIR_QUALITY_COLUMNS)
+
+
+def weather_frame(hourly):
+    """Open-Meteo 'hourly' block -> float64 frame of the model's weather columns, indexed by local hour"""
+    raw={var: np.array(hourly[var],dtype=np.float64) for var in WEATHER_VARIABLES}
+    temperature=raw['temperature_2m']
+    humidity=raw['relative_humidity_2m']
+    gusts=raw['wind_gusts_10m']
+    speed_100=(raw['wind_speed_80m']+raw['wind_speed_120m'])/2
+    columns={
+        'temperature_2m (°C)': temperature,
+        'relative_humidity_2m (%)': humidity,
+        'rain (mm)': raw['rain'],
+        'wind_speed_10m (km/h)': raw['wind_speed_10m'],
+        'wind_direction_10m (°)_cos': np.cos(np.pi*raw['wind_direction_10m']/180).round(3),
+        'wind_direction_10m (°)_sin': np.sin(np.pi*raw['wind_direction_10m']/180).round(3),
+        'wind_gusts_10m (km/h)': gusts,
+        'wind_speed_100m (km/h)': speed_100,
+        'wind_direction_100m (°)_cos': ((np.cos(np.pi*raw['wind_direction_80m']/180)+np.cos(np.pi*raw['wind_direction_120m']/180))/2).round(3),
+        'wind_direction_100m (°)_sin': ((np.sin(np.pi*raw['wind_direction_80m']/180)+np.sin(np.pi*raw['wind_direction_120m']/180))/2).round(3),
+    }
+    # master features; a zero temperature or gust gives inf, as the pandas version did
+    with np.errstate(divide='ignore',invalid='ignore'):
+        master_4=temperature**-1
+        master_3=master_4*humidity**1.4
+        master_2=master_3*speed_100**2.5
+        columns.update(master=master_2*gusts**-1,master_2=master_2,master_3=master_3,master_4=master_4)
+    return pd.DataFrame(columns,index=pd.DatetimeIndex(pd.to_datetime(hourly['time'])))
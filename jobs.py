@@ -0,0 +1,101 @@
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+jobs_config=st.secrets.get("jobs",{})
+JOB_WORKERS=int(jobs_config.get("max_workers",4))   # forecasts computed at once, across every session
+JOB_KEEP_SECONDS=600   # finished jobs stay retrievable this long
+
+
+class Job():
+    """Handle for a submitted job. The UI polls it; the worker reports through update()"""
+    def __init__(self,key):
+        self.id=uuid.uuid4().hex
+        self.key=key
+        self.state='queued'
+        self.progress={}
+        self.result=None
+        self.error=None
+        self.submitted_at=time.time()
+        self.finished_at=None
+        self._done=threading.Event()
+
+    def update(self,**progress):
+        """Publish partial results (e.g. current conditions) before the job finishes"""
+        self.progress.update(progress)
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self,timeout=None):
+        return self._done.wait(timeout)
+
+
+class JobExecutor():
+    """Bounded worker pool shared by every session in the process.
+
+    Sessions submit work and get a Job back immediately instead of blocking
+    their script thread. A job already queued or running for the same key is
+    shared rather than started twice.
+    """
+    def __init__(self,max_workers=JOB_WORKERS,keep_seconds=JOB_KEEP_SECONDS):
+        self.max_workers=max_workers
+        self.keep_seconds=keep_seconds
+        self._pool=ThreadPoolExecutor(max_workers=max_workers,thread_name_prefix='job')
+        self._jobs={}
+        self._active={}
+        self._lock=threading.Lock()
+
+    def submit(self,key,fn,*args,**kwargs):
+        """Run fn(job, *args, **kwargs) on the pool and return its Job"""
+        with self._lock:
+            self._prune()
+            job=self._active.get(key)
+            if job is not None:
+                return job
+            job=Job(key)
+            self._jobs[job.id]=job
+            self._active[key]=job
+        self._pool.submit(self._run,job,fn,args,kwargs)
+        return job
+
+    def _run(self,job,fn,args,kwargs):
+        job.state='running'
+        try:
+            job.result=fn(job,*args,**kwargs)
+            job.state='done'
+        except Exception as e:
+            logger.error(f"Job {job.key} failed: {e}")
+            job.error=str(e)
+            job.state='failed'
+        finally:
+            job.finished_at=time.time()
+            with self._lock:
+                if self._active.get(job.key) is job:
+                    del self._active[job.key]
+            job._done.set()
+
+    def _prune(self):
+        cutoff=time.time()-self.keep_seconds
+        for job_id in [i for i,job in self._jobs.items() if job.finished_at is not None and job.finished_at<cutoff]:
+            del self._jobs[job_id]
+
+    def get(self,job_id):
+        return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            states=[job.state for job in self._jobs.values()]
+        return {state: states.count(state) for state in ('queued','running','done','failed')}
+
+
+executor=JobExecutor()
+
+
+def get_executor():
+    return executor
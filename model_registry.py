@@ -0,0 +1,140 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+import xgboost as xgb
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR='./model_og'
+# Direct-horizon models: each t+k model reads only observed features, no earlier predictions
+DIRECT_MODEL_DIR='./model_direct'
+POLLUTANTS=('pm25','pm10')
+HORIZONS=tuple(range(1,9))
+
+# On-disk formats looked for. 'ubj' files are produced by convert_models.py next to
+# the JSON originals; the most recently written file wins, so a retrained .json
+# replaces an older .ubj. On equal mtimes the earlier format in this tuple wins.
+MODEL_FORMATS=('ubj','json')
+
+# How often (seconds) a cached booster re-checks its file on disk for hot reload
+RELOAD_CHECK_INTERVAL=30
+
+ModelEntry=namedtuple('ModelEntry',['booster','feature_names','path','mtime_ns','size'])
+
+
+def load_booster(path,nthread=4):
+    """Load a booster from a JSON or UBJSON model file (XGBoost picks the format from the extension)"""
+    model=xgb.Booster({'nthread': nthread})
+    model.load_model(path)
+    return model
+
+
+class ModelRegistry():
+    """Process-wide cache of the pm25/pm10 t+1..t+8 boosters.
+
+    Boosters are loaded once (lazily or through warm_up) and shared by every
+    Predictor in the process. A cached booster is swapped for a fresh one when
+    its file on disk changes.
+    """
+    def __init__(self,model_dir=MODEL_DIR,nthread=4,reload_check_interval=RELOAD_CHECK_INTERVAL,formats=MODEL_FORMATS):
+        self.model_dir=model_dir
+        self.nthread=nthread
+        self.formats=formats
+        self.reload_check_interval=reload_check_interval
+        self.version=0
+        self._entries={}
+        self._last_checked={}
+        self._lock=threading.Lock()
+
+    def path(self,poll,time_step):
+        """Path of the most recently written model file among the formats"""
+        newest=None
+        for rank,fmt in enumerate(self.formats):
+            path=os.path.join(self.model_dir,f'model_{poll}_t+{time_step}.{fmt}')
+            try:
+                mtime=os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            if newest is None or (mtime,-rank)>newest[0]:
+                newest=((mtime,-rank),path)
+        if newest is None:
+            return os.path.join(self.model_dir,f'model_{poll}_t+{time_step}.{self.formats[-1]}')
+        return newest[1]
+
+    def _load(self,poll,time_step):
+        path=self.path(poll,time_step)
+        stat=os.stat(path)
+        model=load_booster(path,self.nthread)
+        return ModelEntry(model,list(model.feature_names),path,stat.st_mtime_ns,stat.st_size)
+
+    def _is_stale(self,key,entry):
+        path=self.path(*key)
+        if path!=entry.path and os.path.exists(path):
+            # A newer file in another format appeared (or the loaded one disappeared)
+            return True
+        try:
+            stat=os.stat(entry.path)
+        except OSError:
+            # Keep serving the loaded booster while the file is being replaced
+            return False
+        return stat.st_mtime_ns!=entry.mtime_ns or stat.st_size!=entry.size
+
+    def get(self,poll,time_step):
+        """Return the ModelEntry for a pollutant/horizon, loading or reloading it if needed"""
+        key=(poll,time_step)
+        entry=self._entries.get(key)
+        now=time.monotonic()
+        if entry is not None:
+            if now-self._last_checked.get(key,0)<self.reload_check_interval:
+                return entry
+            self._last_checked[key]=now
+            if not self._is_stale(key,entry):
+                return entry
+
+        with self._lock:
+            # Another thread may have loaded it while we waited on the lock
+            current=self._entries.get(key)
+            if current is not None and current is not entry:
+                return current
+            new_entry=self._load(poll,time_step)
+            self._entries[key]=new_entry
+            self._last_checked[key]=now
+            self.version+=1
+            if entry is not None:
+                logger.info(f"Reloaded model {new_entry.path}")
+            return new_entry
+
+    def warm_up(self):
+        """Load every horizon model up front. Returns the list of models that failed to load"""
+        failed=[]
+        for poll in POLLUTANTS:
+            for time_step in HORIZONS:
+                try:
+                    self.get(poll,time_step)
+                except Exception as e:
+                    logger.error(f"Model warm-up failed for {poll} t+{time_step}: {e}")
+                    failed.append((poll,time_step))
+        return failed
+
+    def reload(self):
+        """Drop every cached booster so the next get() reads the files again"""
+        with self._lock:
+            self._entries.clear()
+            self._last_checked.clear()
+            self.version+=1
+
+
+registry=ModelRegistry()
+# One registry per model set, so the chain and direct boosters can be served side by side
+registries={MODEL_DIR: registry}
+_registries_lock=threading.Lock()
+
+
+def get_registry(model_dir=MODEL_DIR):
+    if model_dir not in registries:
+        with _registries_lock:
+            if model_dir not in registries:
+                registries[model_dir]=ModelRegistry(model_dir)
+    return registries[model_dir]
@@ -6,81 +6,63 @@ import asyncio
 import time
 import matplotlib.pyplot as plt
 import xgboost as xgb
+from http_client import get_client
+from inference import get_engine
+from tracing import traced
+from feature_plan import min_periods
+
+# The AQI needs every step's PM values; a NaN would be drawn as AQI 0
+COVERAGE_ERROR="Not enough recent PM2.5/PM10 readings for this location to forecast the AQI"
 
 class Predictor():
-    def __init__(self,lat,lon):
-        new=Builder(lat,lon)
-        asyncio.run(new.merge())
+    def __init__(self,lat,lon,builder=None,on_current=None):
+        # A Builder that has already been merged can be passed in (used by BatchPredictor)
+        new=builder
+        if new is None:
+            new=Builder(lat,lon,on_current=on_current)
+            # Runs on the shared HTTP client loop so upstream connections stay warm between forecasts
+            get_client().run(new.merge())
         self.critical_errors=None
         if new.critical_errors:
             self.critical_errors=new.critical_errors
         
-        self.pm25_dic=new.final_model_dic.copy()
-        self.pm10_dic=new.final_model_dic.copy()
+        self.features=new.final_model_dic.copy()
         self.PM25=new.PM25
         self.PM10=new.PM10
         self.predictions_dic={}
         self.pm25list=[]
         self.pm10list=[]
+        # Booster latency of the last predict(), seconds per (poll, time_step)
+        self.timings={}
         
         
     
-    def build_model(self,poll,time_step):
-        path=f'./model_og/model_{poll}_t+{time_step}.json'
-        model=xgb.Booster({'nthread': 4})  # init model
-        model.load_model(path)  # load model data
-        return model
-    
-    def predict_pm25(self):
-        self.predictions_dic[0]={}
-        self.predictions_dic[0]['pm25']=self.PM25.iloc[-1]
-        self.predictions_dic[0]['PM25_AVG_24']=self.PM25.rolling(window=24).mean().iloc[-1]
-        
-        for time_step in range(1,9):
-            model=self.build_model('pm25',time_step)
-            
-            final_feats=model.feature_names
-            final_feats=list(final_feats)  
-            dic={}
-            for i in final_feats:
-                dic[i]=self.pm25_dic.get(i,np.nan)
-
-            X_train=pd.DataFrame(dic,index=[0])
-            predictions=model.predict(xgb.DMatrix(X_train))
-            if time_step!=8:
-                self.pm25_dic[f'Predictions t+{time_step}']=predictions
-            
-            # Properly initialize dictionary if key does not exist
-            if time_step not in self.predictions_dic:
-                self.predictions_dic[time_step] = {}
-            
-            self.predictions_dic[time_step]['pm25']=predictions[0]
-            self.pm25list.append(predictions[0])
-        
-    
-    def predict_pm10(self):
-        
-        self.predictions_dic[0]['pm10']=self.PM10.iloc[-1]
-        self.predictions_dic[0]['PM10_AVG_24']=self.PM10.rolling(window=24).mean().iloc[-1]
-       
-        
-        for time_step in range(1,9):
-            model=self.build_model('pm10',time_step)
-           
-            final_feats=model.feature_names
-            final_feats=list(final_feats)  
-            dic={}
-            for i in final_feats:
-                dic[i]=self.pm10_dic.get(i,np.nan)
-            X_train=pd.DataFrame(dic,index=[0])
-            predictions=model.predict(xgb.DMatrix(X_train))
-            if time_step!=8:
-                self.pm10_dic[f'Predictions t+{time_step}']=predictions[0]
-            if time_step not in self.predictions_dic:
-                self.predictions_dic[time_step]={}
-            
-            self.predictions_dic[time_step]['pm10']=predictions[0]
-            self.pm10list.append(predictions[0])
+    def set_current(self):
+        """Step 0: the latest observed hour and its 24-hour averages"""
+        self.predictions_dic[0]={
+            'pm25': self.PM25.iloc[-1],
+            'PM25_AVG_24': self.PM25.rolling(window=24,min_periods=min_periods(24)).mean().iloc[-1],
+            'pm10': self.PM10.iloc[-1],
+            'PM10_AVG_24': self.PM10.rolling(window=24,min_periods=min_periods(24)).mean().iloc[-1],
+        }
+
+    def set_predictions(self,predictions,timings=None):
+        """Store one site's (8,) arrays from InferenceEngine.predict under steps 1..8"""
+        for poll in ('pm25','pm10'):
+            values=predictions[poll]
+            for k,time_step in enumerate(range(1,9)):
+                self.predictions_dic.setdefault(time_step,{})[poll]=values[k]
+            getattr(self,f'{poll}list').extend(values)
+        self.timings=timings or {}
+
+    @traced('predictor.predict')
+    def predict(self):
+        """Step 0 plus both chained t+1..t+8 forecasts and their 24-hour averages"""
+        self.set_current()
+        predictions,timings=get_engine().predict([self.features])
+        self.set_predictions({poll: values[0] for poll,values in predictions.items()},timings)
+        self.build_averages()
+        self.check_coverage()
 
     def build_averages(self):
         index=self.PM25.index[-1]
@@ -96,25 +78,89 @@ class Predictor():
         self.PM10=pd.concat([self.PM10,pm10extra])
 
         
-        pm25_24avg=self.PM25.rolling(window=24).mean().iloc[-8:].values
-        pm10_24avg=self.PM10.rolling(window=24).mean().iloc[-8:].values
+        pm25_24avg=self.PM25.rolling(window=24,min_periods=min_periods(24)).mean().iloc[-8:].values
+        pm10_24avg=self.PM10.rolling(window=24,min_periods=min_periods(24)).mean().iloc[-8:].values
         for i in range(1,9):
             if len(pm25_24avg) >= i:
                 self.predictions_dic[i]['PM25_AVG_24']=pm25_24avg[i-1]
             if len(pm10_24avg) >= i:
                 self.predictions_dic[i]['PM10_AVG_24']=pm10_24avg[i-1]
+
+    def check_coverage(self):
+        """Flag the forecast as failed if any step lacks a PM value or 24-hour average"""
+        for values in self.predictions_dic.values():
+            if any(pd.isna(values.get(name)) for name in ('pm25','pm10','PM25_AVG_24','PM10_AVG_24')):
+                self.critical_errors=[COVERAGE_ERROR]
+                return
         
 
 
 
+class BatchPredictor():
+    """Forecast many locations together.
+
+    Every site's features are built concurrently, then the inference engine
+    runs each horizon as a single N-row prediction, so a batch costs 16
+    booster calls instead of 16 per site. The t+k predictions of all sites
+    feed their t+k+1 rows.
+    """
+    def __init__(self,coordinates,max_concurrency=8):
+        self.coordinates=list(coordinates)
+        self.max_concurrency=max_concurrency
+        builders=[Builder(lat,lon) for lat,lon in self.coordinates]
+        get_client().run(self._merge_all(builders))
+
+        # Position in `coordinates` -> Predictor, only for sites that built without critical errors
+        self.predictors={}
+        self.critical_errors={}
+        for i,((lat,lon),builder) in enumerate(zip(self.coordinates,builders)):
+            predictor=Predictor(lat,lon,builder=builder)
+            if predictor.critical_errors:
+                self.critical_errors[i]=predictor.critical_errors
+            else:
+                self.predictors[i]=predictor
+
+    async def _merge_all(self,builders):
+        # Bound the number of sites hitting the upstream APIs at once
+        semaphore=asyncio.Semaphore(self.max_concurrency)
+        async def merge_one(builder):
+            async with semaphore:
+                await builder.merge()
+        await asyncio.gather(*(merge_one(b) for b in builders))
+
+    @traced('batch_predictor.predict')
+    def predict(self):
+        sites=list(self.predictors.values())
+        if not sites:
+            return
+        predictions,timings=get_engine().predict([p.features for p in sites])
+        for i,p in enumerate(sites):
+            p.set_current()
+            p.set_predictions({poll: values[i] for poll,values in predictions.items()},timings)
+            p.build_averages()
+            p.check_coverage()
+
+    def results(self):
+        """List aligned with `coordinates` of (predictions_dic, error) pairs"""
+        out=[]
+        for i in range(len(self.coordinates)):
+            predictor=self.predictors.get(i)
+            if predictor is not None and not predictor.critical_errors:
+                out.append((predictor.predictions_dic,None))
+            else:
+                # Builder errors, or check_coverage after predict
+                errors=self.critical_errors.get(i) or (predictor.critical_errors if predictor is not None else None) or ['Forecast not available']
+                out.append((None,errors[0]))
+        return out
+
+
 
 if __name__ == '__main__':
     time_start=time.time()
     new=Predictor(28.653048,77.308243)
-    new.predict_pm25()
-    new.predict_pm10()
-    new.build_averages()
+    new.predict()
     print(new.predictions_dic)
+    print(f"Inference: {sum(new.timings.values())*1000:.2f} ms across 16 boosters")
     time_end=time.time()
     print(f"Time taken: {time_end-time_start} seconds")
 
@@ -0,0 +1,67 @@
+import time
+from types import SimpleNamespace
+import pytest
+from answer_cache import AnswerCache, STATS_EVERY, normalize, trigrams, similarity
+
+SCOPE=(28.6,77.2,'2026-01-01T09:00:00','Connaught Place, New Delhi')
+
+
+@pytest.fixture
+def cache():
+    return AnswerCache(threshold=0.8)
+
+
+def store(cache,question,answer='cached answer'):
+    cache.set(SCOPE,question,answer,time.time()+3600)
+
+
+def test_exact_match_after_normalization(cache):
+    store(cache,'When is the best time to go out?')
+    assert cache.get(SCOPE,'when is the BEST time, to go out') == 'cached answer'
+    assert cache.stats()['exact_hits'] == 1
+
+
+def test_near_duplicate_hit(cache):
+    store(cache,'when is the best time to go out')
+    assert cache.get(SCOPE,'when is the best time to go outside') == 'cached answer'
+    assert cache.stats()['similar_hits'] == 1
+
+
+@pytest.mark.parametrize('stored,asked',[
+    ('what is the best time for a run outside today','what is the worst time for a run outside today'),
+    ('should i go out for a walk this evening','should i not go out for a walk this evening'),
+    ('what is the aqi at 5pm','what is the aqi at 6pm'),
+    ('is the air quality good for a walk now','is the air quality good for a walk tonight'),
+])
+def test_different_meaning_is_a_miss(cache,stored,asked):
+    # Close enough on trigrams alone, but the answers differ
+    assert similarity(trigrams(normalize(stored)),trigrams(normalize(asked))) >= 0.6
+    store(cache,stored)
+    assert cache.get(SCOPE,asked) is None
+    assert cache.stats()['misses'] == 1
+
+
+def test_scopes_are_separate(cache):
+    store(cache,'when is the best time to go out')
+    other=SCOPE[:2]+('2026-01-01T10:00:00',SCOPE[3])
+    assert cache.get(other,'when is the best time to go out') is None
+
+
+def test_expired_scope_is_a_miss(cache):
+    cache.set(SCOPE,'when is the best time to go out','old answer',time.time()+0.05)
+    time.sleep(0.1)
+    assert cache.get(SCOPE,'when is the best time to go out') is None
+
+
+def test_hit_rates_are_exported(cache,monkeypatch):
+    import tracing
+    spans=[]
+    monkeypatch.setattr(tracing,'TRACING_ENABLED',True)
+    monkeypatch.setattr(tracing,'exporter',SimpleNamespace(export=spans.append))
+    store(cache,'when is the best time to go out')
+    for i in range(STATS_EVERY):
+        cache.get(SCOPE,'when is the best time to go out' if i%4 else f'what is the aqi at {i}')
+    summaries=[s for s in spans if s.name=='answer_cache.stats']
+    assert len(summaries)==1
+    assert summaries[0].attributes['lookups']==STATS_EVERY
+    assert summaries[0].attributes['hit_rate']==pytest.approx(0.75)
@@ -0,0 +1,78 @@
+import asyncio
+import numpy as np
+import pandas as pd
+import pytest
+import builder
+from builder import Builder, HISTORY_HOURS
+from history_store import HistoryStore
+
+LAT,LON=28.6139,77.2090
+PM_COLUMNS=['PM2.5 (µg/m³)','PM10 (µg/m³)']
+
+
+def hour_info(hour,pm25,pm10):
+    return {
+        'dateTime': hour.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'pollutants': [
+            {'code': 'pm25','concentration': {'value': pm25,'units': 'MICROGRAMS_PER_CUBIC_METER'}},
+            {'code': 'pm10','concentration': {'value': pm10,'units': 'MICROGRAMS_PER_CUBIC_METER'}},
+        ],
+    }
+
+
+def pm25_at(hour):
+    # Distinct per hour, so a misplaced row shows up
+    return float(hour.value//3_600_000_000_000%1000)
+
+
+@pytest.fixture
+def history_api(tmp_path,monkeypatch):
+    monkeypatch.setattr(builder,'history_store',HistoryStore(str(tmp_path/'history.sqlite')))
+    calls=[]
+    skip=set()
+
+    async def fetch(self,url,start,end):
+        calls.append((start,end))
+        # Newest first, as the Air Quality API returns them
+        hours=pd.date_range(start,end,freq='h')[::-1]
+        return [hour_info(hour,pm25_at(hour),2*pm25_at(hour)) for hour in hours if hour not in skip]
+
+    monkeypatch.setattr(Builder,'_fetch_history_period',fetch)
+    return calls,skip
+
+
+def expected_hours():
+    end=pd.Timestamp.now(tz='UTC').floor('h').tz_localize(None)-pd.Timedelta(hours=1)
+    return pd.date_range(end-pd.Timedelta(hours=HISTORY_HOURS-1),end,freq='h')
+
+
+def test_newest_first_payload_fills_every_hour(history_api):
+    calls,_=history_api
+    b=Builder(LAT,LON)
+    asyncio.run(b.air_quality_feats_past())
+
+    assert not b.critical_errors
+    hours=expected_hours()
+    assert list(b.aq_past.index)==list(hours)
+    np.testing.assert_array_equal(b.aq_past['PM2.5 (µg/m³)'].to_numpy(),[pm25_at(h) for h in hours])
+    np.testing.assert_array_equal(b.aq_past['PM10 (µg/m³)'].to_numpy(),[2*pm25_at(h) for h in hours])
+    assert len(calls)==1
+
+
+def test_skipped_hours_are_refetched(history_api):
+    calls,skip=history_api
+    hours=expected_hours()
+    skip.update(hours[[10,11,100]])
+    b=Builder(LAT,LON)
+    asyncio.run(b.air_quality_feats_past())
+    pm=b.aq_past[PM_COLUMNS]
+    assert pm.loc[hours[[10,11,100]]].isna().all().all()
+    assert pm.drop(hours[[10,11,100]]).notna().all().all()
+
+    # Next forecast: only the skipped hours are requested again
+    skip.clear()
+    calls.clear()
+    b=Builder(LAT,LON)
+    asyncio.run(b.air_quality_feats_past())
+    assert calls==[(hours[10],hours[11]),(hours[100],hours[100])]
+    assert b.aq_past[PM_COLUMNS].notna().all().all()
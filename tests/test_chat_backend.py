@@ -0,0 +1,115 @@
+import time
+from types import SimpleNamespace
+import pytest
+from chat_backend import ChatBackend, TEXT_DELTA
+from chat_stub_server import ChatStubServer, REPLY
+
+REQUEST={'model': 'stub','input': [{'role': 'user','content': 'When is the air best?'}]}
+
+
+@pytest.fixture
+def serve():
+    servers=[]
+
+    def start(**kwargs):
+        server=ChatStubServer(**dict({'ttft': 0.01,'token_delay': 0.0},**kwargs))
+        url=server.start()
+        servers.append(server)
+        return server,url+'/v1'
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def answer(backend):
+    return ''.join(event.delta for event in backend.events(REQUEST) if event.type==TEXT_DELTA)
+
+
+def wait_for(condition,timeout=5):
+    end=time.monotonic()+timeout
+    while not condition():
+        if time.monotonic()>end:
+            return False
+        time.sleep(0.02)
+    return True
+
+
+def test_streams_reply(serve):
+    server,url=serve()
+    backend=ChatBackend('test',base_url=url,deadline=5)
+    assert answer(backend)==REPLY
+    assert backend.latency_summary()['requests']==1
+
+
+def test_server_error_is_retried(serve):
+    server,url=serve(script=['error','ok'])
+    backend=ChatBackend('test',base_url=url,deadline=5,max_retries=2)
+    assert answer(backend)==REPLY
+    assert server.requests==2
+    stats=backend.latency_summary()
+    assert stats['retries']==1
+    assert stats['attempts']==2
+
+
+def test_retries_are_bounded(serve):
+    server,url=serve(script=['error','error','error'])
+    backend=ChatBackend('test',base_url=url,deadline=5,max_retries=1)
+    with pytest.raises(Exception):
+        answer(backend)
+    assert server.requests==2
+
+
+def test_deadline_raises_timeout(serve):
+    server,url=serve(script=['slow'],slow_ttft=3)
+    backend=ChatBackend('test',base_url=url,deadline=0.5)
+    start=time.monotonic()
+    with pytest.raises(TimeoutError):
+        answer(backend)
+    assert time.monotonic()-start<2
+    assert backend.latency_summary()['timeouts']==1
+
+
+def test_slow_attempt_is_hedged_and_loser_closed(serve):
+    server,url=serve(script=['ok','ok','ok','slow','ok'],slow_ttft=1.5)
+    backend=ChatBackend('test',base_url=url,deadline=5,hedge=True,hedge_min_samples=3)
+    for _ in range(3):
+        answer(backend)
+    assert backend.hedge_threshold() is not None
+
+    start=time.monotonic()
+    assert answer(backend)==REPLY
+    assert time.monotonic()-start<1.5
+    stats=backend.latency_summary()
+    assert stats['hedges']==1
+    assert stats['hedge_wins']==1
+    # The slow attempt's stream was closed, not left to finish
+    assert wait_for(lambda: server.disconnected==1)
+    assert server.completed==4
+
+
+def test_ttft_is_measured_per_attempt(serve):
+    server,url=serve(script=['slow_error','ok'],slow_ttft=0.5)
+    backend=ChatBackend('test',base_url=url,deadline=5,max_retries=2)
+    answer(backend)
+    stats=backend.latency_summary()
+    # The failed half-second attempt and the backoff are not part of the sample
+    assert stats['ttft_p99_ms']<300
+    assert stats['total_p50_ms']>=500
+
+
+def test_latency_summary_is_exported(serve,monkeypatch):
+    import tracing
+    import chat_backend
+    spans=[]
+    monkeypatch.setattr(tracing,'TRACING_ENABLED',True)
+    monkeypatch.setattr(tracing,'exporter',SimpleNamespace(export=spans.append))
+    monkeypatch.setattr(chat_backend,'SUMMARY_EVERY',2)
+    server,url=serve()
+    backend=ChatBackend('test',base_url=url,deadline=5)
+    answer(backend)
+    answer(backend)
+    assert wait_for(lambda: any(s.name=='chat_backend.latency' for s in spans))
+    summary=next(s for s in spans if s.name=='chat_backend.latency').attributes
+    assert summary['requests']==2
+    assert summary['ttft_p95_ms']>0
+    assert summary['total_p99_ms']>=summary['ttft_p99_ms']
@@ -0,0 +1,55 @@
+import pytest
+from chatbot import classify_question
+
+CURR_HOUR=15   # 3 PM IST
+
+ROUTED=[
+    ("What's the AQI right now?", ("current", None)),
+    ("what is the current aqi", ("current", None)),
+    ("how is the air quality now", ("current", None)),
+    ("is the air getting better?", ("trend", None)),
+    ("Is the air quality improving?", ("trend", None)),
+    ("what is the pollution trend", ("trend", None)),
+    ("when will the air be best", ("best_window", None)),
+    ("what is the best time to go out based on aqi", ("best_window", None)),
+    ("AQI at 5pm?", ("hour", 2)),
+    ("what will the aqi be at 11 pm", ("hour", 8)),
+    ("aqi in 3 hours", ("hour", 3)),
+    ("air quality at 16:00", ("hour", 1)),
+]
+
+FALL_THROUGH=[
+    # Not about the air at all
+    "When should I take my medicine?",
+    "when can i leave for the airport",
+    "When is the best time to go for a run?",
+    "should i go out now",
+    # Another place, or a comparison
+    "What is the AQI right now in Gurgaon vs Noida",
+    "aqi in delhi now",
+    "what's the air quality at the airport",
+    "is aqi better than yesterday",
+    # A time of day the 8-hour forecast may not cover
+    "Is it getting worse tonight?",
+    "is the aqi getting worse tonight",
+    "When is the best time for air quality today?",
+    "aqi at 9am",
+    "aqi tomorrow morning",
+    # Health and open-ended questions
+    "Is it safe for kids now?",
+    "why is the air so bad",
+    "what is the pm2.5 now",
+    # More than one intent
+    "what is the current aqi and the trend",
+    "best time to go out at 5pm for clean air",
+]
+
+
+@pytest.mark.parametrize("question,expected",ROUTED)
+def test_routed(question,expected):
+    assert classify_question(question,CURR_HOUR)==expected
+
+
+@pytest.mark.parametrize("question",FALL_THROUGH)
+def test_falls_through_to_model(question):
+    assert classify_question(question,CURR_HOUR) is None
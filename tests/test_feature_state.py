@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+from feature_plan import compile_plan
+from feature_state import RollingState, FeatureStateStore
+
+FEATURE_DIC={
+    'PM2.5 (µg/m³)': {'lag': [1,2,3,6],'mean': [3,6,12],'std': [3,6],'sum': [3]},
+    'PM10 (µg/m³)': {'lag': [1,2],'mean': [3,24],'std': [3]},
+}
+COLUMNS=list(FEATURE_DIC)
+CELL=(28.6,77.2)
+
+
+@pytest.fixture
+def plan():
+    return compile_plan(FEATURE_DIC,COLUMNS)
+
+
+def hourly_frame(hours=48,seed=0):
+    rng=np.random.default_rng(seed)
+    index=pd.date_range('2026-01-01',periods=hours,freq='h')
+    return pd.DataFrame(rng.gamma(2.0,60.0,(hours,len(COLUMNS))),index=index,columns=COLUMNS)
+
+
+def expected_features(plan,df,index):
+    # Reference: the frame on a complete hourly index, missing hours as NaN rows
+    full=df.reindex(pd.date_range(df.index.min(),index,freq='h'))
+    return plan.evaluate(full,index)
+
+
+def assert_same(got,expected):
+    assert list(got)==list(expected)
+    for name in expected:
+        np.testing.assert_allclose(got[name],expected[name],rtol=1e-9,equal_nan=True,err_msg=name)
+
+
+def test_from_frame_matches_plan(plan):
+    df=hourly_frame()
+    index=df.index[-1]
+    assert_same(RollingState.from_frame(plan,df,index).features(),expected_features(plan,df,index))
+
+
+def test_from_frame_with_gap_matches_plan(plan):
+    df=hourly_frame()
+    gapped=df.drop(df.index[[40,44]])
+    index=df.index[-1]
+    assert_same(RollingState.from_frame(plan,gapped,index).features(),expected_features(plan,gapped,index))
+
+
+def test_advance_over_gap_matches_rebuild(plan):
+    df=hourly_frame()
+    state=RollingState.from_frame(plan,df,df.index[40])
+    gapped=df.drop(df.index[43])
+    assert state.advance(gapped,df.index[-1])
+    assert_same(state.features(),expected_features(plan,gapped,df.index[-1]))
+
+
+def test_advance_rebuilds_on_revised_newest_hour(plan):
+    df=hourly_frame()
+    index=df.index[-1]
+    state=RollingState.from_frame(plan,df,index)
+    revised=df.copy()
+    revised.iloc[-1,0]+=50.0
+    # Same hour, but the newest buffered hour changed upstream
+    assert not state.advance(revised,index)
+    assert state.advance(df,index)
+
+
+def test_advance_rebuilds_when_missing_hour_arrives(plan):
+    df=hourly_frame()
+    state=RollingState.from_frame(plan,df.drop(df.index[30]),df.index[40])
+    assert state.missing==[df.index[30]]
+    # The skipped hour was fetched again: the buffer has NaN where the frame now has data
+    assert not state.advance(df,df.index[-1])
+    assert state.advance(df.drop(df.index[30]),df.index[-1])
+
+
+def test_provisional_current_hour(plan):
+    df=hourly_frame()
+    index=df.index[-1]
+    state=RollingState.from_frame(plan,df,index-pd.Timedelta(hours=1))
+    current=df.loc[index,COLUMNS].to_numpy(dtype=float)
+    assert_same(state.features(current),expected_features(plan,df,index))
+    # Nothing was pushed for the provisional hour
+    assert state.last_hour==index-pd.Timedelta(hours=1)
+
+
+def test_store_keeps_provisional_hour_out_of_state(plan,tmp_path):
+    df=hourly_frame()
+    store=FeatureStateStore(plan,str(tmp_path))
+    hour=df.index[40]
+    # The current-conditions value for `hour` differs from the history value that arrives an hour later
+    provisional=df.loc[:hour].copy()
+    provisional.iloc[-1]+=7.0
+    assert_same(store.features(CELL,provisional,hour),expected_features(plan,provisional,hour))
+    for k in range(41,len(df)):
+        hour=df.index[k]
+        frame=df.loc[:hour].copy()
+        frame.iloc[-1]+=7.0
+        assert_same(store.features(CELL,frame,hour),expected_features(plan,frame,hour))
+    assert store.stats=={'incremental': len(df)-41,'rebuilds': 1}
+
+    # Reloaded from disk, the state carries on incrementally
+    reloaded=FeatureStateStore(plan,str(tmp_path))
+    reloaded.features(CELL,df,df.index[-1])
+    assert reloaded.stats=={'incremental': 1,'rebuilds': 0}
+
+
+def test_missing_hours_do_not_blank_windows(plan):
+    df=hourly_frame()
+    index=df.index[-1]
+    # Hours the API skipped 5, 6 and 40 hours ago
+    gapped=df.drop(index-pd.to_timedelta([5,6,40],unit='h'))
+    features=RollingState.from_frame(plan,gapped,index).features()
+    reductions=[spec.name for spec in plan.specs if spec.op in ('mean','std','sum')]
+    assert not any(np.isnan(features[name]) for name in reductions)
+    # Means are over the hours with data
+    window=df['PM2.5 (µg/m³)'].reindex(pd.date_range(index-pd.Timedelta(hours=11),index,freq='h')).drop(index-pd.to_timedelta([5,6],unit='h'))
+    assert features['PM2.5 (µg/m³)_mean_12']==pytest.approx(window.mean())
@@ -0,0 +1,28 @@
+import numpy as np
+import pandas as pd
+from history_store import HistoryStore, missing_ranges
+
+COLUMNS=['PM2.5 (µg/m³)','PM10 (µg/m³)']
+KEY=(28.6,77.2)
+
+
+def test_skipped_hours_are_requested_again(tmp_path):
+    store=HistoryStore(str(tmp_path/'history.sqlite'))
+    expected=pd.date_range('2026-01-01',periods=12,freq='h')
+    # The API returned every hour but 3, 4 and 9
+    returned=expected.delete([3,4,9])
+    store.write(KEY,pd.DataFrame(np.arange(len(returned)*2,dtype=float).reshape(-1,2),index=returned,columns=COLUMNS))
+
+    stored=store.read(KEY,expected[0],expected[-1],COLUMNS)
+    assert list(stored.index)==list(returned)
+    assert missing_ranges(expected,stored.index)==[(expected[3],expected[4]),(expected[9],expected[9])]
+
+
+def test_missing_pollutant_reads_back_as_nan(tmp_path):
+    store=HistoryStore(str(tmp_path/'history.sqlite'))
+    hours=pd.date_range('2026-01-01',periods=2,freq='h')
+    store.write(KEY,pd.DataFrame([[10.0,np.nan],[11.0,20.0]],index=hours,columns=COLUMNS))
+
+    stored=store.read(KEY,hours[0],hours[-1],COLUMNS)
+    assert np.isnan(stored.iloc[0,1])
+    assert missing_ranges(hours,stored.index)==[]
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+from predict import Predictor, COVERAGE_ERROR
+
+
+def predictor(pm25,pm10):
+    index=pd.date_range('2026-01-01',periods=len(pm25),freq='h')
+    builder=SimpleNamespace(critical_errors=[],final_model_dic={},PM25=pd.Series(pm25,index=index),PM10=pd.Series(pm10,index=index))
+    p=Predictor(28.6,77.2,builder=builder)
+    p.set_current()
+    p.set_predictions({'pm25': np.full(8,80.0),'pm10': np.full(8,150.0)})
+    p.build_averages()
+    p.check_coverage()
+    return p
+
+
+def test_missing_hours_still_give_averages():
+    pm25=np.full(168,100.0)
+    pm10=np.full(168,200.0)
+    # Hours the API skipped 5, 6 and 40 hours before the current one
+    pm25[[-6,-7,-41]]=np.nan
+    pm10[[-6,-7,-41]]=np.nan
+    p=predictor(pm25,pm10)
+    assert not p.critical_errors
+    assert p.predictions_dic[0]['PM25_AVG_24']==100.0
+    for step in range(9):
+        assert not any(np.isnan(v) for v in p.predictions_dic[step].values())
+
+
+def test_thin_coverage_is_an_error_not_nan():
+    pm25=np.full(168,np.nan)
+    pm10=np.full(168,200.0)
+    pm25[-3:]=100.0
+    p=predictor(pm25,pm10)
+    assert p.critical_errors==[COVERAGE_ERROR]
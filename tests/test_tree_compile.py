@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+import xgboost as xgb
+from tree_compile import compile_booster, parity_rows
+
+FEATURES=[f'f{i}' for i in range(8)]
+
+
+@pytest.fixture(scope='module')
+def booster():
+    rng=np.random.default_rng(0)
+    X=rng.normal(size=(2000,len(FEATURES))).astype(np.float32)
+    X[rng.random(X.shape)<0.05]=np.nan
+    X0,X1,X2,X3=(np.nan_to_num(X[:,i]) for i in range(4))
+    # Targets of order one, so float32 rounding stays well under the tolerance
+    y=0.3*X0+0.1*X1**2-0.1*X2*X3+rng.normal(scale=0.01,size=len(X))
+    train=xgb.DMatrix(X,label=y,feature_names=FEATURES)
+    return xgb.train({'objective': 'reg:squarederror','max_depth': 5,'eta': 0.3,'base_score': 0.5},train,num_boost_round=40)
+
+
+def test_compiled_matches_inplace_predict(booster):
+    compiled=compile_booster(booster)
+    assert compiled.num_trees==40
+    assert compiled.feature_names==FEATURES
+    # Values on and around the split thresholds, where a float32/float64 slip would show
+    X=parity_rows(compiled,5000,np.random.default_rng(1))
+    diff=np.max(np.abs(compiled.predict(X)-booster.inplace_predict(X)))
+    assert diff<1e-5
+
+
+def test_single_row(booster):
+    compiled=compile_booster(booster)
+    row=np.full(len(FEATURES),np.nan,dtype=np.float32)
+    row[0]=0.25
+    assert abs(float(compiled.predict(row)[0])-float(booster.inplace_predict(row[None,:])[0]))<1e-5
+
+
+def test_rejects_non_identity_objective():
+    rng=np.random.default_rng(2)
+    X=rng.normal(size=(200,3))
+    other=xgb.train({'objective': 'binary:logistic','max_depth': 2},xgb.DMatrix(X,label=(X[:,0]>0).astype(float)),num_boost_round=2)
+    with pytest.raises(ValueError):
+        compile_booster(other)
@@ -0,0 +1,272 @@
+"""
+Span-based timing for the forecast and chat pipeline.
+
+    with span('builder.merge', lat=lat) as s:
+        ...
+        s.add('cache_hits')
+
+    @traced('builder.weather_feats')
+    async def weather_feats(self): ...
+
+The active span lives in a contextvar, so spans opened inside asyncio tasks
+(and coroutines handed to the shared HTTP client) nest under the span that
+was active when they were started. Instrumented code that only wants to
+count something calls current_span().add(...), which is a no-op outside a
+span.
+
+Configured from the [tracing] secrets section:
+
+    enabled   = false                    # off: traced() returns the function unchanged, span() is a no-op
+    exporter  = "file"                   # "file" (JSON lines) or "otlp" (OTLP/HTTP JSON)
+    path      = "./traces.jsonl"
+    endpoint  = "http://localhost:4318/v1/traces"
+    service   = "breezo"
+"""
+import os
+import json
+import time
+import atexit
+import logging
+import inspect
+import contextlib
+import functools
+import threading
+import contextvars
+import requests
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+tracing_config=st.secrets.get("tracing",{})
+TRACING_ENABLED=bool(tracing_config.get("enabled",False))
+TRACING_EXPORTER=tracing_config.get("exporter","file")
+TRACE_PATH=tracing_config.get("path","./traces.jsonl")
+OTLP_ENDPOINT=tracing_config.get("endpoint","http://localhost:4318/v1/traces")
+SERVICE_NAME=tracing_config.get("service","breezo")
+OTLP_BATCH_SIZE=256
+OTLP_FLUSH_INTERVAL=5   # seconds
+
+_current=contextvars.ContextVar('breezo_span',default=None)
+
+
+class Span():
+    def __init__(self,name,parent=None,attributes=None):
+        self.name=name
+        self.trace_id=parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id=os.urandom(8).hex()
+        self.parent_id=parent.span_id if parent is not None else None
+        self.attributes=dict(attributes or {})
+        self.start_ns=time.time_ns()
+        self._start=time.perf_counter()
+        self.end_ns=None
+        self.duration_ms=None
+        self.error=None
+        self._token=None
+
+    def set(self,key,value):
+        self.attributes[key]=value
+        return self
+
+    def add(self,key,amount=1):
+        """Increment a counter attribute (bytes, cache hits, ...)"""
+        self.attributes[key]=self.attributes.get(key,0)+amount
+        return self
+
+    def __enter__(self):
+        self._token=_current.set(self)
+        return self
+
+    def __exit__(self,exc_type,exc,tb):
+        _current.reset(self._token)
+        self.end(exc)
+        return False
+
+    def end(self,exc=None):
+        """Record the duration and export; __exit__ calls this, spans used with use_span() call it themselves"""
+        self.duration_ms=(time.perf_counter()-self._start)*1000
+        self.end_ns=time.time_ns()
+        if exc is not None:
+            self.error=f'{type(exc).__name__}: {exc}'
+        exporter.export(self)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,'span_id': self.span_id,'parent_id': self.parent_id,
+            'name': self.name,'start_ns': self.start_ns,'end_ns': self.end_ns,
+            'duration_ms': round(self.duration_ms,3),'attributes': self.attributes,'error': self.error,
+        }
+
+
+class _NoopSpan():
+    """Stands in for a span when tracing is off or no span is active"""
+    def set(self,key,value):
+        return self
+
+    def add(self,key,amount=1):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc,tb):
+        return False
+
+    def end(self,exc=None):
+        pass
+
+
+NOOP_SPAN=_NoopSpan()
+
+
+def span(name,**attributes):
+    """Context manager timing a block as a child of the active span"""
+    if not TRACING_ENABLED:
+        return NOOP_SPAN
+    return Span(name,_current.get(),attributes)
+
+
+def current_span():
+    return _current.get() or NOOP_SPAN
+
+
+def emit(name,**attributes):
+    """Export a span that only carries attributes, for periodic summaries such as hit rates"""
+    with span(name,**attributes):
+        pass
+
+
+@contextlib.contextmanager
+def use_span(s):
+    """Make s the active span for a block without ending it.
+
+    For spans that outlive the block, such as one covering a streamed
+    response: a generator must not hold a span's contextvar across its
+    yields, so the caller activates it only around the work that starts
+    there and calls s.end() when the stream finishes.
+    """
+    if s is NOOP_SPAN:
+        yield s
+        return
+    token=_current.set(s)
+    try:
+        yield s
+    finally:
+        _current.reset(token)
+
+
+def traced(name=None):
+    """Decorator wrapping a function or coroutine function in a span.
+
+    With tracing disabled the function is returned unchanged, so there is no
+    per-call cost at all.
+    """
+    def decorate(fn):
+        if not TRACING_ENABLED:
+            return fn
+        span_name=name or fn.__qualname__
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args,**kwargs):
+                with Span(span_name,_current.get()):
+                    return await fn(*args,**kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args,**kwargs):
+            with Span(span_name,_current.get()):
+                return fn(*args,**kwargs)
+        return wrapper
+    return decorate
+
+
+class FileExporter():
+    """Appends one JSON line per finished span"""
+    def __init__(self,path=TRACE_PATH):
+        self.path=path
+        self._lock=threading.Lock()
+
+    def export(self,s):
+        line=json.dumps(s.to_dict(),default=str)
+        try:
+            with self._lock,open(self.path,'a') as f:
+                f.write(line+'\n')
+        except Exception as e:
+            logger.error(f"Trace export to {self.path} failed: {e}")
+
+    def flush(self):
+        pass
+
+
+def _otlp_value(value):
+    if isinstance(value,bool):
+        return {'boolValue': value}
+    if isinstance(value,int):
+        return {'intValue': str(value)}
+    if isinstance(value,float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class OTLPExporter():
+    """Batches finished spans and POSTs them to an OpenTelemetry collector as OTLP/HTTP JSON"""
+    def __init__(self,endpoint=OTLP_ENDPOINT,service=SERVICE_NAME,batch_size=OTLP_BATCH_SIZE,flush_interval=OTLP_FLUSH_INTERVAL):
+        self.endpoint=endpoint
+        self.service=service
+        self.batch_size=batch_size
+        self.flush_interval=flush_interval
+        self._pending=[]
+        self._lock=threading.Lock()
+        self._wake=threading.Event()
+        self._session=requests.Session()
+        threading.Thread(target=self._run,name='otlp-exporter',daemon=True).start()
+
+    def export(self,s):
+        with self._lock:
+            self._pending.append(s)
+            full=len(self._pending)>=self.batch_size
+        if full:
+            self._wake.set()
+
+    def _otlp_span(self,s):
+        out={
+            'traceId': s.trace_id,'spanId': s.span_id,'name': s.name,'kind': 1,
+            'startTimeUnixNano': str(s.start_ns),'endTimeUnixNano': str(s.end_ns),
+            'attributes': [{'key': k,'value': _otlp_value(v)} for k,v in s.attributes.items()],
+            'status': {'code': 2,'message': s.error} if s.error else {'code': 1},
+        }
+        if s.parent_id:
+            out['parentSpanId']=s.parent_id
+        return out
+
+    def flush(self):
+        with self._lock:
+            batch,self._pending=self._pending,[]
+        if not batch:
+            return
+        body={'resourceSpans': [{
+            'resource': {'attributes': [{'key': 'service.name','value': {'stringValue': self.service}}]},
+            'scopeSpans': [{'scope': {'name': 'breezo.tracing'},'spans': [self._otlp_span(s) for s in batch]}],
+        }]}
+        try:
+            self._session.post(self.endpoint,json=body,timeout=5).raise_for_status()
+        except Exception as e:
+            logger.error(f"OTLP export of {len(batch)} spans to {self.endpoint} failed: {e}")
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def _make_exporter():
+    if not TRACING_ENABLED:
+        return None
+    if TRACING_EXPORTER=='otlp':
+        return OTLPExporter()
+    return FileExporter()
+
+
+exporter=_make_exporter()
+if exporter is not None:
+    atexit.register(exporter.flush)
@@ -0,0 +1,177 @@
+"""
+Flattened NumPy evaluator for the XGBoost horizon models.
+
+Every tree of a booster is packed into shared node arrays (children, split
+feature, threshold, default direction, leaf value), and a batch of rows walks
+all trees together one level per step, so a prediction is max_depth rounds of
+array gathers instead of a DMatrix plus a call into the XGBoost library.
+
+    python tree_compile.py           # parity against XGBoost and latency for the 16 boosters
+"""
+import sys
+import json
+import time
+import numpy as np
+
+# Objectives whose prediction is the raw margin (identity link)
+IDENTITY_OBJECTIVES=('reg:squarederror','reg:squaredlogerror','reg:absoluteerror','reg:pseudohubererror','reg:quantileerror')
+
+
+def _base_score(learner):
+    # Stored as "5E-1" by older XGBoost and "[5E-1]" by 2.x
+    value=learner['learner_model_param']['base_score'].strip('[]')
+    return float(value.split(',')[0])
+
+
+class CompiledEnsemble():
+    """A gbtree booster flattened into NumPy arrays.
+
+    Splits follow XGBoost exactly: the row value and the threshold are
+    compared as float32, `value < threshold` goes left and a missing (NaN)
+    value takes the node's default direction. Leaves point at themselves, so
+    rows that reach a leaf early stay there for the remaining levels.
+    """
+    def __init__(self,left,right,feature,threshold,default_left,value,roots,depth,base_score,feature_names):
+        self.left=left
+        self.right=right
+        self.feature=feature
+        self.threshold=threshold
+        self.default_left=default_left
+        self.value=value
+        self.roots=roots
+        self.depth=depth
+        self.base_score=base_score
+        self.feature_names=feature_names
+
+    @classmethod
+    def from_booster(cls,booster):
+        model=json.loads(booster.save_raw('json'))
+        learner=model['learner']
+        objective=learner['objective']['name']
+        if objective not in IDENTITY_OBJECTIVES:
+            raise ValueError(f"Cannot compile objective '{objective}'; only {IDENTITY_OBJECTIVES} are supported")
+        gbm=learner['gradient_booster']
+        if gbm['name']!='gbtree':
+            raise ValueError(f"Cannot compile booster type '{gbm['name']}'")
+
+        left,right,feature,threshold,default_left,value,roots=[],[],[],[],[],[],[]
+        depth=0
+        offset=0
+        for tree in gbm['model']['trees']:
+            if tree.get('categories_nodes'):
+                raise ValueError("Categorical splits are not supported")
+            lc=np.asarray(tree['left_children'],dtype=np.int64)
+            rc=np.asarray(tree['right_children'],dtype=np.int64)
+            n=len(lc)
+            nodes=np.arange(n)
+            leaf=lc==-1
+            # Leaves loop back to themselves; internal children shift to global node ids
+            left.append(np.where(leaf,nodes,lc)+offset)
+            right.append(np.where(leaf,nodes,rc)+offset)
+            feature.append(np.where(leaf,0,np.asarray(tree['split_indices'],dtype=np.int64)))
+            conditions=np.asarray(tree['split_conditions'],dtype=np.float32)
+            threshold.append(conditions)
+            default_left.append(np.asarray(tree['default_left'],dtype=bool))
+            # A leaf's value is kept in split_conditions
+            value.append(np.where(leaf,conditions,0).astype(np.float32))
+            roots.append(offset)
+            depth=max(depth,cls._tree_depth(lc,rc))
+            offset+=n
+
+        return cls(
+            np.concatenate(left),np.concatenate(right),np.concatenate(feature),
+            np.concatenate(threshold),np.concatenate(default_left),np.concatenate(value),
+            np.asarray(roots,dtype=np.int64),depth,np.float32(_base_score(learner)),
+            list(booster.feature_names or []),
+        )
+
+    @staticmethod
+    def _tree_depth(lc,rc):
+        depth=0
+        level=[0]
+        while level:
+            level=[c for node in level for c in (lc[node],rc[node]) if c!=-1]
+            if level:
+                depth+=1
+        return depth
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    def predict(self,X):
+        """Predictions for an (n_rows, n_features) array in feature_names order"""
+        X=np.asarray(X,dtype=np.float32)
+        if X.ndim==1:
+            X=X[None,:]
+        rows=np.arange(len(X))[:,None]
+        node=np.broadcast_to(self.roots,(len(X),self.num_trees))
+        for _ in range(self.depth):
+            x=X[rows,self.feature[node]]
+            go_left=np.where(np.isnan(x),self.default_left[node],x<self.threshold[node])
+            node=np.where(go_left,self.left[node],self.right[node])
+        return (self.value[node].sum(axis=1,dtype=np.float64)+self.base_score).astype(np.float32)
+
+    # Same call the inference engine makes on an xgb.Booster
+    inplace_predict=predict
+
+
+def compile_booster(booster):
+    return CompiledEnsemble.from_booster(booster)
+
+
+def parity_rows(compiled,n,rng,missing_rate=0.05):
+    """Rows whose values sit on and around the model's own split thresholds, plus some NaN"""
+    X=rng.normal(size=(n,len(compiled.feature_names))).astype(np.float32)
+    internal=compiled.left!=np.arange(len(compiled.left))
+    for f in range(X.shape[1]):
+        cuts=compiled.threshold[internal&(compiled.feature==f)]
+        if len(cuts):
+            picks=rng.choice(cuts,n)
+            # Some exactly on a threshold, the rest nudged either side of one
+            nudge=rng.choice([0.0,-1.0,1.0],n)*np.abs(picks)*1e-3+rng.choice([0.0,-1e-3,1e-3],n)
+            X[:,f]=picks+nudge
+    X[rng.random(X.shape)<missing_rate]=np.nan
+    return X
+
+
+if __name__ == '__main__':
+    from model_registry import get_registry, POLLUTANTS, HORIZONS
+    rng=np.random.default_rng(0)
+    registry=get_registry()
+    worst=0.0
+    failed=[]
+    timings={'xgboost single': 0.0,'numpy single': 0.0,'xgboost batch': 0.0,'numpy batch': 0.0}
+    runs=200
+    for poll in POLLUTANTS:
+        for time_step in HORIZONS:
+            booster=registry.get(poll,time_step).booster
+            start=time.perf_counter()
+            compiled=compile_booster(booster)
+            compile_seconds=time.perf_counter()-start
+
+            X=parity_rows(compiled,5000,rng)
+            expected=booster.inplace_predict(X)
+            got=compiled.predict(X)
+            diff=float(np.max(np.abs(expected-got)))
+            worst=max(worst,diff)
+            if not np.allclose(expected,got,rtol=1e-5,atol=1e-4):
+                failed.append(f'{poll} t+{time_step}')
+            print(f"{poll} t+{time_step}: {compiled.num_trees} trees, depth {compiled.depth}, compiled in {compile_seconds*1000:.0f} ms, max abs diff {diff:.2e}")
+
+            row=X[:1]
+            for label,fn in (('xgboost',booster.inplace_predict),('numpy',compiled.predict)):
+                fn(row)
+                start=time.perf_counter()
+                for _ in range(runs):
+                    fn(row)
+                timings[f'{label} single']+=(time.perf_counter()-start)/runs
+                start=time.perf_counter()
+                fn(X[:1000])
+                timings[f'{label} batch']+=time.perf_counter()-start
+
+    print(f"Worst max abs difference vs XGBoost: {worst:.2e}")
+    print(f"All 16 boosters, one row:   xgboost {timings['xgboost single']*1000:.2f} ms, numpy {timings['numpy single']*1000:.2f} ms")
+    print(f"All 16 boosters, 1000 rows: xgboost {timings['xgboost batch']*1000:.2f} ms, numpy {timings['numpy batch']*1000:.2f} ms")
+    if failed:
+        sys.exit(f"Parity check failed for {failed}")